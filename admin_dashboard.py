@@ -1,104 +1,35 @@
 import sqlite3
+import time
 import streamlit as st
 import pandas as pd
-import hashlib
 
-DB_PATH = "questions.db"
-USER_DB_PATH = "adminMN.db"  # ไฟล์แยกสำหรับข้อมูลผู้ใช้
+from admin_data import ensure_question_index, question_counts, question_page, question_version
+from user_store import USER_DB_PATH, UserStore
 
-# ฟังก์ชันสำหรับจัดการฐานข้อมูล users
-def init_user_database():
-    """สร้างตาราง users ในไฟล์ password_user.db หากยังไม่มี และเพิ่มผู้ใช้เริ่มต้น"""
-    conn = sqlite3.connect(USER_DB_PATH)
-    cursor = conn.cursor()
-    
-    # สร้างตาราง users
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT DEFAULT 'staff',
-            full_name TEXT,
-            email TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            is_active INTEGER DEFAULT 1
-        )
-    ''')
-    
-    # เพิ่มผู้ใช้เริ่มต้นหากยังไม่มี
-    default_users = [
-        ("admin", "password", "admin", "ผู้ดูแลระบบ", "admin@company.com"),
-        ("manager", "secret123", "manager", "ผู้จัดการ", "manager@company.com"), 
-        ("staff", "secret", "staff", "เจ้าหน้าที่", "staff@company.com")
-    ]
-    
-    for username, password, role, full_name, email in default_users:
-        cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", (username,))
-        if cursor.fetchone()[0] == 0:
-            password_hash = hash_password(password)
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, role, full_name, email) VALUES (?, ?, ?, ?, ?)",
-                (username, password_hash, role, full_name, email)
-            )
-    
-    conn.commit()
-    conn.close()
+DB_PATH = "questions.db"
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+EDITOR_COLUMNS = ("id", "question", "answer", "correct_answer", "timestamp")
+# แคชผลอ่านตาราง questions: key มี question_version() การเขียนจากทุก process จึงเห็นใน rerun ถัดไป
+# TTL ใช้แค่ลบผลของ version เก่าออกจากหน่วยความจำ
+CACHE_TTL_SECONDS = 300
 
-def get_user_credentials():
-    """ดึงข้อมูล login ทั้งหมดจากฐานข้อมูล adminMN.db"""
-    conn = sqlite3.connect(USER_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, password_hash FROM users WHERE is_active = 1")
-    credentials = dict(cursor.fetchall())
-    conn.close()
-    return credentials
+# ฟังก์ชันสำหรับจัดการฐานข้อมูล users (adminMN.db, ดู user_store.py)
+@st.cache_resource
+def get_user_store():
+    """สร้างตาราง/ผู้ใช้เริ่มต้นครั้งเดียวต่อ process และใช้ connection เดียวร่วมกันทุก session"""
+    return UserStore(USER_DB_PATH)
 
 def get_user_info(username):
-    """ดึงข้อมูลผู้ใช้ทั้งหมด"""
-    conn = sqlite3.connect(USER_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ? AND is_active = 1", (username,))
-    user_info = cursor.fetchone()
-    conn.close()
-    return user_info
-
-def update_last_login(username):
-    """อัพเดทเวลาล็อกอินล่าสุด"""
-    conn = sqlite3.connect(USER_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?",
-        (username,)
-    )
-    conn.commit()
-    conn.close()
+    """ดึงข้อมูลผู้ใช้ (dict) จากแคชของ user store"""
+    return get_user_store().get_user(username)
 
 def get_all_users():
     """ดึงข้อมูลผู้ใช้ทั้งหมดสำหรับการจัดการ"""
-    conn = sqlite3.connect(USER_DB_PATH)
-    df = pd.read_sql_query("""
-        SELECT id, username, role, full_name, email, created_at, last_login, is_active
-        FROM users 
-        ORDER BY created_at DESC
-    """, conn)
-    conn.close()
-    return df
-
-def hash_password(password):
-    """เข้ารหัสรหัสผ่านด้วย SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    return pd.DataFrame(get_user_store().list_users())
 
 def check_login(username, password):
-    """ตรวจสอบ username และ password จากฐานข้อมูล"""
-    credentials = get_user_credentials()
-    hashed_password = hash_password(password)
-    
-    if username in credentials and credentials[username] == hashed_password:
-        update_last_login(username)
-        return True
-    return False
+    """ตรวจสอบ username และ password (อ่านผู้ใช้คนเดียวด้วย index แล้วตรวจ bcrypt)"""
+    return get_user_store().verify_login(username, password) is not None
 
 def login_form():
     """แสดงฟอร์มล็อกอิน"""
@@ -134,12 +65,25 @@ def logout():
     st.session_state.username = None
     st.rerun()
 
-# โหลดข้อมูลจาก SQLite
-def load_data():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM questions ORDER BY timestamp DESC", conn)
-    conn.close()
-    return df
+# โหลดข้อมูลจาก SQLite ทีละหน้า (ดู admin_data.py) ผลถูกแคชไว้จนกว่าจะมีการเขียนตาราง questions
+# (version = ตัวนับการเขียนจาก trigger อ่านแถวเดียวต่อ rerun)
+@st.cache_resource
+def prepare_questions_db():
+    ensure_question_index(DB_PATH)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def load_counts(version):
+    return question_counts(DB_PATH)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def load_page(cursor, page_size, version):
+    """คืน (DataFrame ของหน้า, cursor ของหน้าถัดไปหรือ None)"""
+    rows, next_cursor = question_page(DB_PATH, cursor, page_size, EDITOR_COLUMNS)
+    return pd.DataFrame(rows, columns=EDITOR_COLUMNS), next_cursor
+
+def invalidate_question_cache():
+    load_counts.clear()
+    load_page.clear()
 
 # ลบข้อมูลทั้งหมด
 def delete_all_data():
@@ -148,14 +92,29 @@ def delete_all_data():
     cursor.execute("DELETE FROM questions")
     conn.commit()
     conn.close()
+    invalidate_question_cache()
 
-# บันทึกคำตอบที่ถูกต้อง
-def update_correct_answer(question_id, correct_answer):
+# หาแถวที่ correct_answer ถูกแก้ (เทียบทั้งคอลัมน์ทีเดียว ไม่วนทีละแถว)
+def changed_answers(original_df, edited_df):
+    """คืน [(correct_answer ใหม่ หรือ None, id)] ของแถวที่ค่าเปลี่ยน"""
+    old = original_df["correct_answer"].fillna("").astype(str)
+    new = edited_df["correct_answer"].fillna("").astype(str)
+    changed = old.ne(new)
+    return [(value or None, int(question_id))
+            for question_id, value in zip(edited_df.loc[changed, "id"], new[changed])]
+
+# บันทึกคำตอบที่ถูกต้องทั้งหมดใน transaction เดียว (สำเร็จทั้งหมดหรือไม่บันทึกเลย)
+def save_correct_answers(updates):
+    """คืน (จำนวนแถวที่บันทึก, เวลาที่ใช้เป็นวินาที)"""
+    start = time.perf_counter()
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE questions SET correct_answer = ? WHERE id = ?", (correct_answer, question_id))
-    conn.commit()
-    conn.close()
+    try:
+        with conn:
+            conn.executemany("UPDATE questions SET correct_answer = ? WHERE id = ?", updates)
+    finally:
+        conn.close()
+    invalidate_question_cache()
+    return len(updates), time.perf_counter() - start
 
 def main_dashboard():
     """หน้าหลักของแดชบอร์ด"""
@@ -169,8 +128,8 @@ def main_dashboard():
         st.write("แสดงคำถามที่ถูกถาม พร้อมแก้ไขคำตอบที่ถูกต้องได้")
     with col2:
         if user_info:
-            st.write(f"👋 สวัสดี **{user_info[4]}**")  # full_name
-            st.caption(f"สถานะ: {user_info[3]}")  # role
+            st.write(f"👋 สวัสดี **{user_info['full_name']}**")
+            st.caption(f"สถานะ: {user_info['role']}")
         else:
             st.write(f"👋 สวัสดี **{st.session_state.username}**")
         
@@ -186,35 +145,55 @@ def main_dashboard():
     with col2:
         st.info(f"👥 **ฐานข้อมูลผู้ใช้**: `{USER_DB_PATH}`")
     
-    # โหลดและแสดงข้อมูล
-    df = load_data()
+    # โหลดและแสดงข้อมูล (นับใน SQL และโหลดเฉพาะหน้าที่แสดง)
+    prepare_questions_db()
+    version = question_version(DB_PATH)
+    counts = load_counts(version)
     
-    if df.empty:
+    if counts["total"] == 0:
         st.info("ยังไม่มีข้อมูลคำถามในระบบ")
     else:
         # แสดงสถิติ
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("📊 จำนวนคำถามทั้งหมด", len(df))
+            st.metric("📊 จำนวนคำถามทั้งหมด", counts["total"])
         with col2:
-            answered = df['correct_answer'].notna().sum()
-            st.metric("✅ มีคำตอบที่ถูกต้องแล้ว", answered)
+            st.metric("✅ มีคำตอบที่ถูกต้องแล้ว", counts["answered"])
         with col3:
-            unanswered = len(df) - answered
-            st.metric("❓ ยังไม่มีคำตอบที่ถูกต้อง", unanswered)
+            st.metric("❓ ยังไม่มีคำตอบที่ถูกต้อง", counts["total"] - counts["answered"])
         with col4:
             # นับจำนวนผู้ใช้ทั้งหมด
-            total_users = len(get_all_users())
+            total_users = get_user_store().count_users()
             st.metric("👥 จำนวนผู้ใช้", total_users)
         
         st.divider()
         
-        # แสดงตารางแบบ editable เฉพาะคอลัมน์ correct_answer
+        # แสดงตารางแบบ editable เฉพาะคอลัมน์ correct_answer ทีละหน้า
         st.subheader("📝 แก้ไขคำตอบที่ถูกต้อง")
-        editable_df = df[["id", "question", "answer", "correct_answer", "timestamp"]].copy()
-        
+        col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
+        with col1:
+            page_size = st.selectbox("จำนวนแถวต่อหน้า", PAGE_SIZE_OPTIONS, index=1)
+        # keyset pagination: เก็บ cursor ของต้นหน้าที่ผ่านมาแล้ว (None = หน้าแรก) ย้อนกลับได้ทีละหน้า
+        if st.session_state.get("question_page_size") != page_size:
+            st.session_state.question_page_size = page_size
+            st.session_state.question_cursors = [None]
+        cursors = st.session_state.question_cursors
+        page = len(cursors)
+        page_df, next_cursor = load_page(cursors[-1], page_size, version)
+        total_pages = max(1, -(-counts["total"] // page_size))
+        with col2:
+            if st.button("⬅️ หน้าก่อนหน้า", disabled=page == 1, use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with col3:
+            if st.button("หน้าถัดไป ➡️", disabled=next_cursor is None, use_container_width=True):
+                cursors.append(next_cursor)
+                st.rerun()
+        with col4:
+            st.caption(f"หน้า {page} จาก {total_pages} (บันทึกก่อนเปลี่ยนหน้า การแก้ไขที่ยังไม่บันทึกจะหายไป)")
+
         edited_df = st.data_editor(
-            editable_df,
+            page_df,
             column_config={
                 "id": st.column_config.NumberColumn("ID", width="small"),
                 "question": st.column_config.TextColumn("คำถาม", width="large"),
@@ -224,30 +203,30 @@ def main_dashboard():
             },
             disabled=["id", "question", "answer", "timestamp"],
             use_container_width=True,
-            num_rows="dynamic",
-            height=400
+            # แก้ได้เฉพาะ correct_answer ของแถวที่มีอยู่ (ไม่เพิ่ม/ลบแถว) index จึงตรงกับ page_df เสมอ
+            num_rows="fixed",
+            height=400,
+            key=f"answers_editor_{page}_{page_size}"
         )
-        
+
+        # ผลการบันทึกครั้งก่อน (แสดงหลัง rerun)
+        saved = st.session_state.pop("save_result", None)
+        if saved:
+            st.success(f"✅ บันทึกคำตอบที่ถูกต้องแล้ว {saved[0]} รายการ ({saved[1] * 1000:.0f} ms)")
+
         # ปุ่มบันทึก
         col1, col2 = st.columns([1, 4])
         with col1:
             if st.button("💾 บันทึกทั้งหมด", type="primary"):
-                changes = 0
-                for i in range(len(df)):
-                    old = df.loc[i, "correct_answer"] if pd.notna(df.loc[i, "correct_answer"]) else ""
-                    new = edited_df.loc[i, "correct_answer"] if pd.notna(edited_df.loc[i, "correct_answer"]) else ""
-                    if old != new:
-                        update_correct_answer(df.loc[i, "id"], new if new else None)
-                        changes += 1
-                
-                if changes > 0:
-                    st.success(f"✅ บันทึกคำตอบที่ถูกต้องแล้ว {changes} รายการ")
+                updates = changed_answers(page_df, edited_df)
+                if updates:
+                    st.session_state.save_result = save_correct_answers(updates)
                     st.rerun()
                 else:
                     st.info("ไม่มีการเปลี่ยนแปลงข้อมูล")
     
     # ส่วนจัดการผู้ใช้ (สำหรับ admin เท่านั้น)
-    if user_info and user_info[3] == 'admin':  # role = admin
+    if user_info and user_info['role'] == 'admin':
         st.divider()
         with st.expander("👥 จัดการผู้ใช้ระบบ", expanded=False):
             users_df = get_all_users()
@@ -275,6 +254,7 @@ def main_dashboard():
         with col1:
             if st.button("🗑️ ลบข้อมูลคำถาม", type="secondary"):
                 delete_all_data()
+                st.session_state.question_cursors = [None]
                 st.success("✅ ลบข้อมูลคำถามทั้งหมดเรียบร้อยแล้ว")
                 st.rerun()
 
@@ -292,7 +272,7 @@ def main():
     if "username" not in st.session_state:
         st.session_state.username = None
 
-    init_user_database()
+    get_user_store()
 
     if st.session_state.authenticated:
         main_dashboard()
@@ -0,0 +1,125 @@
+import logging
+import sqlite3
+
+# ---------------------- Admin Data Access ----------------------
+# query ของตาราง questions สำหรับ admin_dashboard.py: อ่านทีละหน้าแบบ keyset บน (COALESCE(timestamp, ''), id)
+# เลือกเฉพาะคอลัมน์ที่แสดง และนับจำนวนด้วย COUNT ใน SQL ค่าใช้จ่ายต่อ rerun จึงขึ้นกับขนาดหน้า
+# ไม่ใช่ขนาดตาราง (OFFSET ต้องข้ามทุกแถวก่อนหน้า ส่วน keyset กระโดดไปที่ตำแหน่งใน index ได้ทันที)
+# ตาราง questions ไม่ได้ถูกสร้างโดย migrations.py ถ้ายังไม่มีตาราง ทุกฟังก์ชันคืนผลว่าง
+# trigger นับการเขียนตาราง questions (ทุก process) ลง questions_changes ผู้เรียกใช้ question_version()
+# เป็นส่วนหนึ่งของ key แคช ผลที่แคชไว้จึงหมดอายุทันทีที่ตารางถูกเขียน
+
+DB_PATH = "questions.db"
+QUESTION_COLUMNS = ("id", "question", "answer", "correct_answer", "timestamp")
+# key ของการเรียงหน้า: แถวที่ timestamp เป็น NULL นับเป็น '' (อยู่ท้ายสุด) แทนที่จะหลุดจากการเปรียบเทียบ
+PAGE_KEY = "COALESCE(timestamp, '')"
+
+
+def connect(db_path=DB_PATH):
+    return sqlite3.connect(db_path, timeout=30)
+
+
+def ensure_question_index(db_path=DB_PATH):
+    """index ที่ keyset pagination ใช้ (เรียงตาม timestamp ล่าสุดก่อน, id แยกแถวที่เวลาเท่ากัน) และ trigger นับการเขียน"""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_questions_page_key ON questions({PAGE_KEY}, id)")
+            # index เดิมบน (timestamp, id) ไม่ถูกใช้แล้ว
+            conn.execute("DROP INDEX IF EXISTS idx_questions_timestamp_id")
+            _create_change_triggers(conn)
+    except sqlite3.OperationalError as e:
+        logging.warning(f"⚠️ questions index not created ({e})")
+    finally:
+        conn.close()
+
+
+def _create_change_triggers(conn):
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'questions'").fetchone():
+        raise sqlite3.OperationalError("no such table: questions")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS questions_changes (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO questions_changes (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        # FOR EACH STATEMENT ไม่มีใน SQLite: DELETE ทั้งตารางบวกทีละแถว แต่เป็นแค่ UPDATE แถวเดียวซ้ำ
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_questions_{event.lower()} AFTER {event} ON questions
+            BEGIN
+                UPDATE questions_changes SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+
+def question_version(db_path=DB_PATH):
+    """ตัวนับการเขียนตาราง questions (เปลี่ยนทุกครั้งที่ process ใดก็ตาม insert/update/delete)
+
+    ถ้ายังไม่มี trigger (เช่น ตาราง questions ถูกสร้างหลังเปิด dashboard) จะลองสร้างแล้วอ่านใหม่
+    """
+    conn = connect(db_path)
+    try:
+        try:
+            return conn.execute("SELECT version FROM questions_changes WHERE id = 1").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass
+        try:
+            with conn:
+                _create_change_triggers(conn)
+            return conn.execute("SELECT version FROM questions_changes WHERE id = 1").fetchone()[0]
+        except sqlite3.OperationalError:
+            # ยังไม่มีตาราง questions
+            return None
+    finally:
+        conn.close()
+
+
+def question_counts(db_path=DB_PATH):
+    """{"total": จำนวนคำถาม, "answered": จำนวนที่มี correct_answer}"""
+    conn = connect(db_path)
+    try:
+        total, answered = conn.execute("SELECT COUNT(*), COUNT(correct_answer) FROM questions").fetchone()
+    except sqlite3.OperationalError:
+        total, answered = 0, 0
+    finally:
+        conn.close()
+    return {"total": total, "answered": answered}
+
+
+def question_page(db_path=DB_PATH, cursor=None, page_size=50, columns=QUESTION_COLUMNS):
+    """คืน (rows, next_cursor) ของหน้าที่เริ่มหลัง cursor (None = หน้าแรก)
+
+    cursor = (COALESCE(timestamp, ''), id) ของแถวสุดท้ายของหน้าก่อน, next_cursor เป็น None เมื่อไม่มีหน้าถัดไป
+    """
+    unknown = set(columns) - set(QUESTION_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown columns: {sorted(unknown)}")
+    # key ของการเรียงและ id ต่อท้ายผลเสมอเพื่อสร้าง cursor ของหน้าถัดไป
+    selected = [*columns, PAGE_KEY, "id"]
+    where, params = "", []
+    if cursor is not None:
+        # เขียนแยกแทน row value (key, id) < (?, ?) เพื่อให้ SQLite ค้นผ่าน expression index ได้
+        where = f"WHERE {PAGE_KEY} <= ? AND ({PAGE_KEY} < ? OR id < ?)"
+        params = [cursor[0], cursor[0], cursor[1]]
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f"""
+            SELECT {', '.join(selected)} FROM questions
+            {where}
+            ORDER BY {PAGE_KEY} DESC, id DESC
+            LIMIT ?
+        """, params + [page_size + 1]).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = (last[-2], last[-1])
+    return [row[:len(columns)] for row in rows], next_cursor
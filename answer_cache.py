@@ -0,0 +1,186 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# ---------------------- Semantic Answer Cache ----------------------
+# แคชคำตอบตามความหมายของคำถาม: ถ้าคำถามใหม่มี embedding ใกล้กับคำถามที่เคยตอบแล้ว
+# (cosine similarity >= threshold) จะคืนคำตอบเดิมพร้อมหน้าอ้างอิงโดยไม่ต้องเรียก LLM
+
+CACHE_DB_PATH = "answer_cache.db"
+
+
+class SemanticAnswerCache:
+    """แคชคำตอบแบบ persistent (SQLite) ที่ค้นด้วย cosine similarity ของ embedding คำถาม"""
+
+    def __init__(self, embed_query, db_path=CACHE_DB_PATH, threshold=0.92,
+                 max_entries=1000, ttl_seconds=24 * 3600, fingerprint=None):
+        self.embed_query = embed_query
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._init_db()
+        if fingerprint is not None:
+            self.check_fingerprint(fingerprint)
+        self._load_matrix()
+
+    def _init_db(self):
+        c = self._conn.cursor()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                response_time REAL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hit_count INTEGER DEFAULT 0
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self._conn.commit()
+
+    def _load_matrix(self):
+        """โหลด embedding ทั้งหมดเข้าหน่วยความจำเป็นเมทริกซ์ที่ normalize แล้ว"""
+        self._purge_expired()
+        rows = self._conn.execute("SELECT id, embedding FROM answer_cache").fetchall()
+        self._ids = [row[0] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+        logging.info(f"🗃️ Answer cache loaded with {len(self._ids)} entries")
+
+    @staticmethod
+    def _normalize(vector):
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    # ---------------------- Invalidation ----------------------
+    def check_fingerprint(self, fingerprint):
+        """ล้างแคชทั้งหมดเมื่อ fingerprint ของ vector collection เปลี่ยน"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_meta WHERE key = 'collection_fingerprint'"
+            ).fetchone()
+            if row and row[0] == fingerprint:
+                return False
+            self._conn.execute("DELETE FROM answer_cache")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('collection_fingerprint', ?)",
+                (fingerprint,)
+            )
+            self._conn.commit()
+            self._ids, self._matrix = [], None
+        if row:
+            logging.info("♻️ Vector collection changed, answer cache invalidated")
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answer_cache")
+            self._conn.commit()
+            self._ids, self._matrix = [], None
+
+    # ---------------------- Eviction ----------------------
+    def _purge_expired(self):
+        if not self.ttl_seconds:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        deleted = self._conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (cutoff,)).rowcount
+        self._conn.commit()
+        return deleted
+
+    def _evict_lru(self):
+        overflow = len(self._ids) - self.max_entries
+        if overflow <= 0:
+            return 0
+        self._conn.execute("""
+            DELETE FROM answer_cache WHERE id IN (
+                SELECT id FROM answer_cache ORDER BY last_used_at ASC LIMIT ?
+            )
+        """, (overflow,))
+        self._conn.commit()
+        return overflow
+
+    # ---------------------- Lookup / Store ----------------------
+    def lookup(self, question, query_vector=None):
+        """คืน dict ของคำตอบที่แคชไว้ถ้ามีคำถามที่ใกล้พอ ไม่เช่นนั้นคืน None"""
+        if query_vector is None:
+            query_vector = self.embed_query(question)
+        query = self._normalize(query_vector)
+
+        with self._lock:
+            if self._matrix is None or not self._ids:
+                return None
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                return None
+
+            entry_id = self._ids[best]
+            row = self._conn.execute(
+                "SELECT question, answer, sources, response_time, created_at FROM answer_cache WHERE id = ?",
+                (entry_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and row[4] < time.time() - self.ttl_seconds:
+                self._purge_expired()
+                self._load_matrix()
+                return None
+
+            self._conn.execute(
+                "UPDATE answer_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE id = ?",
+                (time.time(), entry_id)
+            )
+            self._conn.commit()
+
+        return {
+            "question": row[0],
+            "answer": row[1],
+            "sources": json.loads(row[2]),
+            "response_time": row[3] or 0.0,
+            "similarity": similarity,
+        }
+
+    def store(self, question, answer, sources, response_time, query_vector=None):
+        """บันทึกคำตอบใหม่ลงแคช; sources เป็น list ของ dict (page_content, metadata)"""
+        if query_vector is None:
+            query_vector = self.embed_query(question)
+        vector = self._normalize(query_vector)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO answer_cache (question, embedding, answer, sources, response_time, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (question, vector.tobytes(), answer, json.dumps(sources, ensure_ascii=False),
+                  response_time, now, now))
+            self._conn.commit()
+            self._ids.append(self._conn.execute("SELECT last_insert_rowid()").fetchone()[0])
+            self._matrix = vector[None, :] if self._matrix is None else np.vstack([self._matrix, vector])
+            if self._evict_lru() or self._purge_expired():
+                self._load_matrix()
+
+    def stats(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM answer_cache"
+            ).fetchone()
+        return {"entries": row[0], "hits": row[1]}
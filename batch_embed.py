@@ -0,0 +1,50 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------------------- Batched Parallel Embedding ----------------------
+# แบ่ง chunks เป็น batch แล้วส่งหลาย batch พร้อมกันไปยัง embedding backend (Ollama)
+# จำกัดจำนวน worker เพื่อไม่ให้ server ล้น และ retry เมื่อเกิดข้อผิดพลาดชั่วคราว
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+
+
+def _embed_batch(embeddings, texts, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = backoff * (2 ** attempt)
+            logging.warning(f"⚠️ Embedding batch failed ({e}), retry {attempt + 1}/{retries} in {wait:.1f}s")
+            time.sleep(wait)
+
+
+def embed_in_batches(embeddings, texts, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                     retries=DEFAULT_RETRIES, backoff=1.0):
+    """embed texts เป็น batch แบบขนาน คืน (vectors, stats) โดย vectors เรียงตามลำดับ texts เดิม"""
+    start = time.time()
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = []
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            # pool.map คืนผลตามลำดับ batch จึงต่อกันได้ตรงกับ texts
+            for batch_vectors in pool.map(lambda b: _embed_batch(embeddings, b, retries, backoff), batches):
+                vectors.extend(batch_vectors)
+
+    elapsed = time.time() - start
+    stats = {
+        "chunks": len(texts),
+        "batches": len(batches),
+        "seconds": elapsed,
+        "chunks_per_sec": len(texts) / elapsed if elapsed > 0 else 0.0,
+    }
+    if texts:
+        logging.info(
+            f"🧮 Embedded {stats['chunks']} chunks in {stats['batches']} batches "
+            f"({elapsed:.2f}s, {stats['chunks_per_sec']:.1f} chunks/sec)"
+        )
+    return vectors, stats
@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from dashboard_stats import get_chunks_page, get_feedback_page, get_messages_page, search_messages
+from migrations import m001_base_schema, m002_llm_metrics_columns, run_migrations
+
+# ---------------------- Migration Benchmark ----------------------
+# สร้าง questions.db สังเคราะห์ขนาดใหญ่ (schema ก่อนมี index) แล้ววัดเวลา query แบบที่ dashboard ใช้
+# ก่อนและหลังรัน migrations: python bench_migrations.py --messages 200000
+
+SATISFACTIONS = ["พอใจ", "ช่วยได้มาก 👍", "ไม่พอใจ", "ไม่ช่วย 👎"]
+THAI_LETTERS = "กขคงจชซดตถทนบปผพฟมยรลวสหอะาิีึืุูเแโใไ่้๊๋"
+VOCABULARY_SIZE = 5000
+
+
+def _vocabulary(rng):
+    # คำภาษาไทยสุ่ม ให้ข้อความหลากหลายเหมือน log จริง (ไม่ใช่ข้อความเดียวซ้ำทุกแถว)
+    return ["".join(rng.choice(THAI_LETTERS) for _ in range(rng.randint(3, 8))) for _ in range(VOCABULARY_SIZE)]
+
+
+def _sentence(rng, vocabulary, words):
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def build_synthetic_db(path, messages, chunks_per_message=3, feedback_ratio=0.3):
+    conn = sqlite3.connect(path)
+    m001_base_schema(conn)
+    m002_llm_metrics_columns(conn)
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    vocabulary = _vocabulary(rng)
+    batch = 10000
+    for offset in range(0, messages, batch):
+        ids = range(offset + 1, min(offset + batch, messages) + 1)
+        stamps = {i: (start + timedelta(seconds=i * 30)).isoformat() for i in ids}
+        conn.executemany(
+            "INSERT INTO user_messages (id, user_message, answer, timestamp) VALUES (?, ?, ?, ?)",
+            [(i, _sentence(rng, vocabulary, 6), _sentence(rng, vocabulary, 30), stamps[i]) for i in ids],
+        )
+        conn.executemany(
+            "INSERT INTO retrieved_chunks (user_message_id, chunk_text, source, page_number) VALUES (?, ?, ?, ?)",
+            [(i, f"chunk {i}-{j}", "Loan_Features.pdf", j) for i in ids for j in range(chunks_per_message)],
+        )
+        conn.executemany(
+            "INSERT INTO llm_metrics (user_message_id, prompt_tokens, response_tokens, response_time, timestamp, ttft) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(i, rng.randint(200, 900), rng.randint(20, 300), rng.uniform(0.5, 8.0), stamps[i], rng.uniform(0.1, 1.5))
+             for i in ids],
+        )
+        conn.executemany(
+            "INSERT INTO feedback (user_message_id, satisfaction, feedback_text, timestamp) VALUES (?, ?, ?, ?)",
+            [(i, rng.choice(SATISFACTIONS), "", stamps[i]) for i in ids if rng.random() < feedback_ratio],
+        )
+        conn.commit()
+    conn.close()
+
+
+def dashboard_queries(conn, messages):
+    target = messages // 2
+    question = conn.execute("SELECT user_message FROM user_messages WHERE id = ?", (target,)).fetchone()[0]
+    common_word, phrase = question.split()[0], " ".join(question.split()[2:4])
+    day = (datetime(2024, 1, 1) + timedelta(seconds=target * 30)).isoformat()[:10]
+    return {
+        "chunks of one message": lambda: conn.execute(
+            "SELECT chunk_text FROM retrieved_chunks WHERE user_message_id = ?", (target,)).fetchall(),
+        "metrics of one message": lambda: conn.execute(
+            "SELECT * FROM llm_metrics WHERE user_message_id = ?", (target,)).fetchall(),
+        "feedback of one message": lambda: conn.execute(
+            "SELECT * FROM feedback WHERE user_message_id = ?", (target,)).fetchall(),
+        "metrics in one day": lambda: conn.execute(
+            "SELECT COUNT(*), AVG(response_time) FROM llm_metrics WHERE timestamp >= ? AND timestamp < ?",
+            (day, day + "T23:59:59")).fetchall(),
+        "latest messages page": lambda: get_messages_page(conn, None, 50),
+        # หน้าลึก: cursor อยู่กลางประวัติ
+        "messages page (mid-history)": lambda: get_messages_page(conn, target, 50),
+        "chunks page (join)": lambda: get_chunks_page(conn, None, 50),
+        "feedback page by satisfaction": lambda: get_feedback_page(conn, target, 50, satisfaction="ไม่พอใจ"),
+        "search one word": lambda: search_messages(conn, common_word, None, 50),
+        "search phrase": lambda: search_messages(conn, phrase, None, 50),
+        "search no match": lambda: search_messages(conn, "ไม่มีคำนี้ในระบบ", None, 50),
+    }
+
+
+def time_queries(db_path, messages, repeat):
+    conn = sqlite3.connect(db_path)
+    results = {}
+    for name, query in dashboard_queries(conn, messages).items():
+        query()  # warm cache
+        start = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        results[name] = (time.perf_counter() - start) / repeat * 1000
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดผลของ migrations/index บน questions.db สังเคราะห์")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        build_synthetic_db(db_path, args.messages)
+        print(f"สร้างฐานข้อมูล {args.messages:,} ข้อความ ใน {time.perf_counter() - start:.1f}s")
+
+        before = time_queries(db_path, args.messages, args.repeat)
+
+        start = time.perf_counter()
+        version = run_migrations(db_path)
+        print(f"migrations -> v{version} ใน {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        run_migrations(db_path)
+        print(f"รันซ้ำ (ไม่มีงาน) ใน {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        after = time_queries(db_path, args.messages, args.repeat)
+
+    print(f"\n{'query':<32}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<32}{before[name]:>14.2f}{after[name]:>14.2f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
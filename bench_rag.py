@@ -0,0 +1,432 @@
+import argparse
+import json
+import logging
+import math
+import os
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# ---------------------- End-to-end RAG Benchmark ----------------------
+# เล่นคำถามจริงซ้ำผ่าน pipeline เดียวกับ chatbot (rag_pipeline.py) เพื่อดูว่าการเปลี่ยน chunk size, k,
+# prompt ฯลฯ ทำให้เร็วขึ้น/แย่ลงหรือไม่ คำถามมาจาก user_messages (พร้อม chunk ที่เคยใช้ตอบใน retrieved_chunks)
+# และ questions.correct_answer ที่ admin ใส่ไว้
+# ค่าเริ่มต้นรันแบบ offline: stub server (process แยก) ตอบแทน Ollama ทั้ง /api/embed และ /api/generate
+# ด้วย latency ที่กำหนด แล้ว ingest เอกสารใหม่ลง directory ชั่วคราว (ไม่แตะ chroma_db_pdf)
+# รายงาน recall@k, p50/p95/p99 ของแต่ละ stage, throughput ที่ N clients พร้อมกัน และ peak memory เป็น JSON
+#   python bench_rag.py --clients 1,4,8 --output bench.json
+#   python bench_rag.py --output after.json --baseline bench.json       (เทียบกับผลรอบก่อน)
+#   python bench_rag.py --ollama-url http://localhost:11434 --persist-dir chroma_db_pdf   (Ollama จริง)
+# recall@k วัดว่า context ที่ได้ครอบคลุม chunk ที่ถูกบันทึกไว้ตอนตอบจริงกี่ส่วน (เทียบกับ pipeline ในอดีต
+# ไม่ใช่คำตอบที่ถูกต้องเสมอไป) ส่วนคำถามที่มี correct_answer วัดว่า context/คำตอบครอบคลุมคำตอบที่ถูกต้องแค่ไหน
+
+STUB_DIM = 256
+# chunk ที่บันทึกไว้นับว่า "ถูกดึงมา" ถ้า trigram ของมันอยู่ใน context อย่างน้อยสัดส่วนนี้
+# (context assembly รวม/ตัด chunk ที่ซ้อนกัน และ parser ใหม่อาจตัดบรรทัดต่างจากเดิมเล็กน้อย)
+RECALL_THRESHOLD = 0.6
+STAGES = ["dense", "lexical", "fusion", "rerank", "assembly", "retrieval", "queue_wait", "ttft", "generation",
+          "total"]
+
+
+# ---------------------- Stub Ollama Server ----------------------
+def stub_vector(text, dim=STUB_DIM):
+    """embedding จำลองจาก hash ของ character trigram (ข้อความที่มีคำร่วมกันจะอยู่ใกล้กัน)"""
+    vector = [0.0] * dim
+    for i in range(max(len(text) - 2, 1)):
+        vector[zlib.crc32(text[i:i + 3].encode("utf-8")) % dim] += 1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def serve_stub(port, embed_ms, ttft_ms, tokens_per_sec, max_tokens):
+    """(รันใน process แยก) HTTP server ที่ตอบแบบ Ollama พร้อม latency ที่กำหนด"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._send_json({"models": []})
+
+        def _send_json(self, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/api/embed":
+                texts = payload.get("input") or []
+                texts = [texts] if isinstance(texts, str) else texts
+                time.sleep(embed_ms / 1000)
+                self._send_json({"model": payload.get("model"), "embeddings": [stub_vector(t) for t in texts]})
+            elif self.path == "/api/generate":
+                self._generate(payload)
+            else:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        def _generate(self, payload):
+            prompt = payload.get("prompt") or ""
+            # ตอบด้วยคำจาก context ใน prompt ความยาวคำตอบ/เวลาจึงใกล้เคียงการตอบจริง
+            words = prompt.split("(Context):", 1)[-1].split()[:max_tokens] if prompt else []
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            if words:
+                time.sleep(ttft_ms / 1000)
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(1 / tokens_per_sec)
+                self._chunk({"model": payload.get("model"), "response": word + " ", "done": False})
+            self._chunk({"model": payload.get("model"), "response": "", "done": True, "done_reason": "stop",
+                         "prompt_eval_count": len(prompt) // 4, "eval_count": len(words)})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _chunk(self, message):
+            line = json.dumps(message).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def start_stub(args):
+    """เริ่ม stub server ใน process แยก (ไม่แย่ง GIL กับ pipeline ที่วัด) คืน (process, base_url)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, __file__, "--stub-server", str(port), "--stub-embed-ms", str(args.stub_embed_ms),
+        "--stub-ttft-ms", str(args.stub_ttft_ms), "--stub-tokens-per-sec", str(args.stub_tokens_per_sec),
+        "--stub-tokens", str(args.stub_tokens),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while True:
+        try:
+            urllib.request.urlopen(base_url + "/api/tags", timeout=1).read()
+            return process, base_url
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("stub server did not start")
+            time.sleep(0.1)
+
+
+# ---------------------- Replay Set ----------------------
+def load_replay_set(db_path, limit):
+    """คืนรายการ {"question", "expected_chunks", "correct_answer"} จาก questions.db (เปิดแบบอ่านอย่างเดียว)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        messages = conn.execute(
+            "SELECT id, user_message FROM user_messages ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        chunks = {}
+        for message_id, text in conn.execute(
+            f"SELECT user_message_id, chunk_text FROM retrieved_chunks "
+            f"WHERE user_message_id IN ({','.join('?' * len(messages))})", [m[0] for m in messages]
+        ):
+            chunks.setdefault(message_id, []).append(text)
+        try:
+            curated = conn.execute(
+                "SELECT question, correct_answer FROM questions "
+                "WHERE correct_answer IS NOT NULL AND TRIM(correct_answer) != ''"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # ตาราง questions สร้างโดย admin_dashboard ไม่ได้อยู่ใน migrations
+            curated = []
+    finally:
+        conn.close()
+
+    items = [{"question": text, "expected_chunks": chunks.get(mid, []), "correct_answer": None}
+             for mid, text in reversed(messages)]
+    items += [{"question": q, "expected_chunks": [], "correct_answer": a} for q, a in curated]
+    return items
+
+
+# ---------------------- Scoring ----------------------
+def _shingles(text, n=3):
+    from doc_parsing import clean_pdf_text
+
+    # ล้างข้อความแบบเดียวกับ parser (chunk ที่บันทึกไว้อาจมาจาก parser รุ่นเก่า) แล้วตัดช่องว่างทิ้ง
+    text = "".join(clean_pdf_text(text).split())
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))} if text else set()
+
+
+def containment(part, whole):
+    return len(part & whole) / len(part) if part else 0.0
+
+
+def score_turn(item, docs, answer):
+    context = set().union(*(_shingles(d.page_content) for d in docs)) if docs else set()
+    scores = {}
+    if item["expected_chunks"]:
+        found = [containment(_shingles(c), context) >= RECALL_THRESHOLD for c in item["expected_chunks"]]
+        scores["recall"] = sum(found) / len(found)
+        scores["hit"] = float(any(found))
+    if item["correct_answer"]:
+        expected = _shingles(item["correct_answer"])
+        scores["context_recall"] = containment(expected, context)
+        scores["answer_overlap"] = containment(expected, _shingles(answer))
+    return scores
+
+
+def percentiles(values):
+    if not values:
+        return None
+    return {
+        "p50_ms": float(np.percentile(values, 50) * 1000),
+        "p95_ms": float(np.percentile(values, 95) * 1000),
+        "p99_ms": float(np.percentile(values, 99) * 1000),
+        "n": len(values),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss เป็น KB บน Linux และ byte บน macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# ---------------------- Replay ----------------------
+def run_turn(retriever, llm, scheduler, question, session_id):
+    """ค้นหา + stream คำตอบแบบเดียวกับ prepare_answer/stream_answer คืน (docs, answer, timings, tokens)"""
+    from stage_timings import get_last_timings, reset_timings
+    from token_count import OllamaUsageHandler
+
+    from rag_pipeline import build_prompt
+
+    start = time.perf_counter()
+    reset_timings()
+    docs = retriever.invoke(question)
+    timings = get_last_timings()
+    timings["retrieval"] = time.perf_counter() - start
+    prompt = build_prompt(question, docs)
+
+    ticket = scheduler.acquire(session_id)
+    timings["queue_wait"] = ticket.wait_time
+    usage, parts, first = OllamaUsageHandler(), [], None
+    try:
+        for chunk in llm.stream(prompt, config={"callbacks": [usage]}):
+            if chunk and first is None:
+                first = time.perf_counter()
+            parts.append(chunk)
+    finally:
+        scheduler.release(ticket)
+    end = time.perf_counter()
+    first = first or end
+    timings.update({"ttft": first - start, "generation": end - first, "total": end - start})
+    answer = "".join(parts)
+    return docs, answer, timings, usage.token_counts(prompt, answer)[1]
+
+
+def replay_quality(retriever, llm, scheduler, items):
+    """เล่นทุกคำถามทีละข้อ: คะแนน retrieval/คำตอบ และ latency ของแต่ละ stage โดยไม่มีการแย่งกัน"""
+    stage_values = {stage: [] for stage in STAGES}
+    scores = {}
+    for item in items:
+        docs, answer, timings, _ = run_turn(retriever, llm, scheduler, item["question"], "replay")
+        for stage, seconds in timings.items():
+            stage_values.setdefault(stage, []).append(seconds)
+        for name, value in score_turn(item, docs, answer).items():
+            scores.setdefault(name, []).append(value)
+    quality = {name: float(np.mean(values)) for name, values in scores.items()}
+    quality["scored_recall"] = len(scores.get("recall", []))
+    quality["scored_answers"] = len(scores.get("answer_overlap", []))
+    stages = {stage: percentiles(values) for stage, values in stage_values.items() if values}
+    return quality, stages
+
+
+def replay_concurrent(retriever, llm, scheduler, items, clients):
+    """ยิงคำถามทั้งหมดจาก client พร้อมกัน N ราย (แต่ละรายเป็น session ของตัวเองใน scheduler)"""
+    totals, waits, tokens, errors = [], [], [], []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = index % clients
+        try:
+            _, _, timings, response_tokens = run_turn(retriever, llm, scheduler, items[index]["question"],
+                                                      f"client-{client}")
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        with lock:
+            totals.append(timings["total"])
+            waits.append(timings["queue_wait"])
+            tokens.append(response_tokens)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(len(items))))
+    elapsed = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "questions": len(items),
+        "seconds": elapsed,
+        "questions_per_sec": len(totals) / elapsed,
+        "output_tokens_per_sec": sum(tokens) / elapsed,
+        "total": percentiles(totals),
+        "queue_wait": percentiles(waits),
+        "errors": len(errors),
+    }
+
+
+# ---------------------- Report ----------------------
+def compare(result, baseline):
+    """พิมพ์ค่าหลักเทียบกับผลรอบก่อน"""
+    rows = [(f"quality.{name}", result["quality"].get(name), baseline["quality"].get(name))
+            for name in ("recall", "hit", "context_recall", "answer_overlap")]
+    for stage in STAGES:
+        now, before = result["stages"].get(stage), baseline["stages"].get(stage)
+        if now and before:
+            rows.append((f"{stage}.p95_ms", now["p95_ms"], before["p95_ms"]))
+    before_levels = {level["clients"]: level for level in baseline["throughput"]}
+    for level in result["throughput"]:
+        before = before_levels.get(level["clients"])
+        if before:
+            rows.append((f"qps@{level['clients']}", level["questions_per_sec"], before["questions_per_sec"]))
+    rows.append(("peak_rss_mb", result["peak_rss_mb"], baseline["peak_rss_mb"]))
+
+    print(f"\n{'metric':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, now, before in rows:
+        if now is None or before is None:
+            continue
+        change = f"{(now - before) / before * 100:+.1f}%" if before else ""
+        print(f"{name:<24}{before:>12.3f}{now:>12.3f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark pipeline RAG ด้วยคำถามที่บันทึกไว้ใน questions.db")
+    parser.add_argument("--db", default="questions.db")
+    parser.add_argument("--limit", type=int, default=200, help="จำนวนคำถามล่าสุดจาก user_messages")
+    parser.add_argument("--clients", default="1,4,8", help="จำนวน client พร้อมกัน คั่นด้วย comma")
+    parser.add_argument("--llm-concurrency", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "2")),
+                        help="ช่องของ LLM scheduler (เหมือน LLM_MAX_CONCURRENCY ของ chatbot)")
+    parser.add_argument("--ollama-url", help="ใช้ Ollama จริงแทน stub server")
+    parser.add_argument("--persist-dir", help="ใช้ index ที่มีอยู่ (ค่าเริ่มต้น: ingest ใหม่ลง directory ชั่วคราว)")
+    parser.add_argument("--embed-cache", action="store_true", help="เปิดแคช query embedding ใน process")
+    parser.add_argument("--output", help="เขียนผลเป็น JSON")
+    parser.add_argument("--baseline", help="JSON ของรอบก่อนสำหรับเทียบ")
+    parser.add_argument("--stub-embed-ms", type=float, default=20.0)
+    parser.add_argument("--stub-ttft-ms", type=float, default=150.0)
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--stub-tokens", type=int, default=60)
+    parser.add_argument("--stub-server", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub_server:
+        serve_stub(args.stub_server, args.stub_embed_ms, args.stub_ttft_ms, args.stub_tokens_per_sec,
+                   args.stub_tokens)
+        return
+
+    import ingest
+    import rag_pipeline
+    from llm_scheduler import LLMScheduler
+
+    items = load_replay_set(args.db, args.limit)
+    if not items:
+        sys.exit(f"no questions found in {args.db}")
+    levels = [int(n) for n in args.clients.split(",") if n.strip()]
+
+    stub, base_url = (None, args.ollama_url) if args.ollama_url else start_stub(args)
+    tmp = None
+    try:
+        persist_dir = args.persist_dir
+        if persist_dir is None:
+            tmp = tempfile.TemporaryDirectory()
+            persist_dir = tmp.name
+        # ปิดแคชโดยค่าเริ่มต้น: ทุกรอบ (และทุกระดับ concurrency) ต้อง embed คำถามจริง ผลจึงเทียบกันได้
+        cache_size = rag_pipeline.QUERY_EMBED_CACHE_SIZE if args.embed_cache else 0
+        embeddings = rag_pipeline.build_query_embeddings(base_url, cache_db=None, cache_size=cache_size)
+        start = time.perf_counter()
+        vectorstore, chunk_count = rag_pipeline.load_store(embeddings, persist_dir=persist_dir)
+        load_seconds = time.perf_counter() - start
+        reranker = rag_pipeline.build_reranker()
+        retriever = rag_pipeline.build_retriever(vectorstore, reranker, persist_dir=persist_dir)
+        llm = rag_pipeline.build_llm(base_url)
+        scheduler = LLMScheduler(max_concurrency=args.llm_concurrency, queue_timeout=600)
+
+        # คำถามแรกโหลด tokenizer/โมเดล ไม่นับรวมในผล
+        run_turn(retriever, llm, scheduler, items[0]["question"], "warm-up")
+        quality, stages = replay_quality(retriever, llm, scheduler, items)
+        throughput = [replay_concurrent(retriever, llm, scheduler, items, n) for n in levels]
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+        if tmp is not None:
+            tmp.cleanup()
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "llm": "stub" if stub else rag_pipeline.LLM_MODEL,
+            "vector_backend": rag_pipeline.VECTOR_BACKEND,
+            "chunk_size": ingest.CHUNK_SIZE,
+            "chunk_overlap": ingest.CHUNK_OVERLAP,
+            "chunks": chunk_count,
+            "hybrid": rag_pipeline.HYBRID_RETRIEVAL,
+            "rerank": reranker is not None,
+            "context_candidates": rag_pipeline.CONTEXT_CANDIDATES,
+            "context_token_budget": rag_pipeline.CONTEXT_TOKEN_BUDGET,
+            "llm_concurrency": args.llm_concurrency,
+            "embed_cache": args.embed_cache,
+            **({"stub_embed_ms": args.stub_embed_ms, "stub_ttft_ms": args.stub_ttft_ms,
+                "stub_tokens_per_sec": args.stub_tokens_per_sec} if stub else {}),
+        },
+        "dataset": {
+            "questions": len(items),
+            "with_logged_chunks": sum(1 for i in items if i["expected_chunks"]),
+            "with_correct_answer": sum(1 for i in items if i["correct_answer"]),
+        },
+        "index_load_seconds": load_seconds,
+        "quality": quality,
+        "stages": stages,
+        "throughput": throughput,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print(f"\n{len(items)} questions, {chunk_count} chunks, recall@{rag_pipeline.CONTEXT_CANDIDATES} "
+          f"{quality.get('recall', float('nan')):.3f} (hit rate {quality.get('hit', float('nan')):.3f})")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, p in stages.items():
+        print(f"{stage:<12}{p['p50_ms']:>10.1f}{p['p95_ms']:>10.1f}{p['p99_ms']:>10.1f}")
+    print(f"{'clients':<12}{'q/s':>10}{'tok/s':>10}{'p95 ms':>10}{'errors':>8}")
+    for level in throughput:
+        p95 = level["total"]["p95_ms"] if level["total"] else float("nan")
+        print(f"{level['clients']:<12}{level['questions_per_sec']:>10.2f}{level['output_tokens_per_sec']:>10.1f}"
+              f"{p95:>10.0f}{level['errors']:>8}")
+    print(f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
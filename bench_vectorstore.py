@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ---------------------- Vector Store Benchmark ----------------------
+# เปรียบเทียบ Chroma กับ memory-mapped index (mmap_vectorstore.py) บน embedding สังเคราะห์ขนาดเท่า bge-m3
+# วัด recall@k เทียบกับ exact search (float32), latency p50/p99 ต่อ query (ไม่รวมเวลา embed คำถาม),
+# เวลา startup (import + เปิด store + query แรก) และหน่วยความจำของ process ใหม่
+#   python bench_vectorstore.py --chunks 20000 --queries 200
+
+DIM = 1024
+
+
+def synthetic_embeddings(n, queries, dim=DIM, clusters=64, seed=0):
+    """embedding แบบเป็นกลุ่ม (เหมือน chunk หลายหัวข้อ) และคำถามที่อยู่ใกล้ chunk บางตัว"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    targets = rng.integers(0, n, size=queries)
+    query_vectors = vectors[targets] + 0.04 * rng.normal(size=(queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+
+def exact_top_k(vectors, query_vectors, k):
+    return np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :k]
+
+
+# ---------------------- Backends ----------------------
+def build_chroma(path, vectors):
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection("bench", metadata={"hnsw:space": "cosine"})
+    for i in range(0, len(vectors), 5000):
+        batch = vectors[i:i + 5000]
+        collection.add(
+            ids=[str(j) for j in range(i, i + len(batch))],
+            embeddings=batch.tolist(),
+            documents=[f"chunk {j}" for j in range(i, i + len(batch))],
+            metadatas=[{"source": "bench.pdf", "page_number": j % 50} for j in range(i, i + len(batch))],
+        )
+
+
+def open_backend(name, path, nprobe):
+    if name == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=path).get_collection("bench")
+        return lambda q, k: [int(i) for i in collection.query(query_embeddings=[q.tolist()], n_results=k)["ids"][0]]
+    from mmap_vectorstore import MmapVectorStore
+    store = MmapVectorStore(path, nprobe=nprobe)
+    return lambda q, k: [int(store.ids[i]) for i in store.search_vectors(q, k)[0]]
+
+
+def _memory():
+    # RssAnon = หน่วยความจำของ process เอง, RssFile = หน้า mmap ที่แชร์ผ่าน page cache
+    usage = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS", "RssAnon", "RssFile")):
+                key, value = line.split(":")
+                usage[key] = int(value.split()[0]) / 1024
+    return usage
+
+
+def child_main(name, path, nprobe, query_file, k):
+    """วัด startup และหน่วยความจำใน process ใหม่"""
+    start = time.perf_counter()
+    search = open_backend(name, path, nprobe)
+    opened = time.perf_counter()
+    query_vectors = np.load(query_file)
+    search(query_vectors[0], k)
+    first_query = time.perf_counter()
+    for q in query_vectors:
+        search(q, k)
+    print(json.dumps({
+        "open_s": opened - start,
+        "startup_s": first_query - start,
+        **{f"{key}_mb": value for key, value in _memory().items()},
+    }))
+
+
+def measure(name, path, nprobe, vectors, query_vectors, truth, k, query_file):
+    search = open_backend(name, path, nprobe)
+    latencies, hits = [], 0
+    for q, expected in zip(query_vectors, truth):
+        start = time.perf_counter()
+        found = search(q, k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(found) & set(expected.tolist()))
+    child = subprocess.run(
+        [sys.executable, __file__, "--child", name, "--path", path, "--nprobe", str(nprobe),
+         "--query-file", query_file, "--k", str(k)],
+        capture_output=True, text=True, check=True,
+    )
+    return {
+        "recall": hits / (len(truth) * k),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        **json.loads(child.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="เปรียบเทียบ Chroma กับ memory-mapped vector index")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="จำนวนกลุ่ม IVF (0 = ใช้ sqrt(chunks))")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--skip-chroma", action="store_true")
+    parser.add_argument("--child")
+    parser.add_argument("--path")
+    parser.add_argument("--query-file")
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.child, args.path, args.nprobe, args.query_file, args.k)
+        return
+
+    from mmap_vectorstore import write_mmap_index
+
+    vectors, query_vectors = synthetic_embeddings(args.chunks, args.queries)
+    truth = exact_top_k(vectors, query_vectors, args.k)
+    ids = [str(i) for i in range(len(vectors))]
+    texts = [f"chunk {i}" for i in ids]
+    metadatas = [{"source": "bench.pdf", "page_number": i % 50} for i in range(len(vectors))]
+    nlist = args.nlist or int(np.sqrt(args.chunks))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        query_file = os.path.join(tmp, "queries.npy")
+        np.save(query_file, query_vectors)
+        backends = []
+        if not args.skip_chroma:
+            start = time.perf_counter()
+            build_chroma(os.path.join(tmp, "chroma"), vectors)
+            print(f"chroma: built in {time.perf_counter() - start:.1f}s")
+            backends.append(("chroma", "chroma", os.path.join(tmp, "chroma")))
+        for label, dtype, n in [("mmap-float16", "float16", 0), ("mmap-int8", "int8", 0),
+                                (f"mmap-float16-ivf{nlist}", "float16", nlist)]:
+            path = os.path.join(tmp, label)
+            start = time.perf_counter()
+            write_mmap_index(path, ids, texts, metadatas, vectors, dtype=dtype, nlist=n)
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            print(f"{label}: built in {time.perf_counter() - start:.1f}s, {size / 1e6:.1f} MB on disk")
+            backends.append((label, "mmap", path))
+
+        for label, name, path in backends:
+            results[label] = measure(name, path, args.nprobe, vectors, query_vectors, truth, args.k, query_file)
+
+    print(f"\n{args.chunks:,} chunks x {DIM} dims, {args.queries} queries, k={args.k}")
+    header = f"{'backend':<24}{'recall@k':>9}{'p50 ms':>9}{'p99 ms':>9}{'startup s':>11}{'RSS MB':>9}{'anon MB':>9}{'file MB':>9}"
+    print(header)
+    for label, r in results.items():
+        print(f"{label:<24}{r['recall']:>9.3f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['startup_s']:>11.2f}"
+              f"{r.get('VmRSS_mb', 0):>9.0f}{r.get('RssAnon_mb', 0):>9.0f}{r.get('RssFile_mb', 0):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,126 +1,93 @@
 import os
-import sqlite3
 import logging
+import threading
 import time
-from datetime import datetime
 
 import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from dotenv import load_dotenv
 
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
-from langchain.schema import Document
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain_ollama import OllamaLLM, OllamaEmbeddings
+# import เฉพาะที่ใช้บน chat path; Chroma (chromadb) และ langchain_ollama ถูก import
+# ในฟังก์ชันที่ใช้จริง ให้ header/sidebar แสดงได้ก่อนโหลดของหนัก
+from langchain_core.documents import Document
+
+from answer_cache import SemanticAnswerCache
+from telemetry import TelemetryWriter, resolve_message_id
+from token_count import OllamaUsageHandler, get_tokenizer
+from ingest import SOURCE_DOCS, manifest_fingerprint
+from rag_pipeline import (LLM_MODEL, build_llm, build_prompt, build_query_embeddings, build_reranker,
+                          build_retriever, load_store)
+from stage_timings import get_last_spans, get_last_timings, reset_timings
+from tracing import LangfuseExporter, Trace, TraceSink
+from migrations import run_migrations
+from llm_scheduler import GenerationTimeout, LLMScheduler, QueueTimeout, RequestCancelled, stream_until
+from warmup import WARMUP_QUERY, ping_ollama
 
 # ---------------------- Load Environment ----------------------
 load_dotenv()
 OLLAMA_URL = os.getenv("OLLAMA_BASE_URL")
 
+# Semantic answer cache
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# เขียน telemetry ผ่าน queue เบื้องหลัง (0 = เขียนทันทีก่อนตอบกลับ)
+TELEMETRY_BACKGROUND = os.getenv("TELEMETRY_BACKGROUND", "1") == "1"
+
+# Tracing ราย stage ต่อคำถาม (ตาราง trace_spans) และไฟล์ JSONL เพิ่มเติม (ค่าว่าง = ไม่เขียนไฟล์)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "")
+
+# LLM scheduler: จำนวนคำขอที่ส่งไป Ollama พร้อมกัน (ให้ตรงกับ OLLAMA_NUM_PARALLEL) และ timeout (วินาที)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+LLM_GENERATION_TIMEOUT = float(os.getenv("LLM_GENERATION_TIMEOUT", "180"))
+
+# Warm-up ตอนเริ่ม process: ลองค้นหา 1 ครั้ง (index/embedder/reranker) และให้ Ollama โหลด LLM
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
 # ---------------------- Logging ----------------------
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # ---------------------- Database Functions ----------------------
 DB_PATH = "questions.db"
 
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS user_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_message TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            timestamp TEXT NOT NULL
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS retrieved_chunks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_message_id INTEGER NOT NULL,
-            chunk_text TEXT NOT NULL,
-            source TEXT,
-            page_number INTEGER,
-            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS llm_metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_message_id INTEGER NOT NULL,
-            prompt_tokens INTEGER,
-            response_tokens INTEGER,
-            response_time REAL,
-            timestamp TEXT NOT NULL,
-            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_message_id INTEGER,
-            satisfaction TEXT NOT NULL,
-            feedback_text TEXT,
-            timestamp TEXT NOT NULL,
-            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
-        )
-    """)
-    conn.commit()
-    conn.close()
-    logging.info("📦 Database initialized successfully.")
-
-def save_user_message(user_message, answer):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO user_messages (user_message, answer, timestamp)
-        VALUES (?, ?, ?)
-    """, (user_message, answer, datetime.now().isoformat()))
-    message_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    logging.info("✅ Saved user message & answer to DB")
-    return message_id
-
-def save_retrieved_chunks(user_message_id, chunks):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    for chunk in chunks:
-        page_number = chunk.metadata.get("page_number", 0)
-        c.execute("""
-            INSERT INTO retrieved_chunks (user_message_id, chunk_text, source, page_number)
-            VALUES (?, ?, ?, ?)
-        """, (user_message_id, chunk.page_content, chunk.metadata.get("source"), page_number))
-    conn.commit()
-    conn.close()
-    logging.info(f"📝 Saved {len(chunks)} chunks for user_message_id {user_message_id}")
-
-def save_llm_metrics(user_message_id, prompt_tokens, response_tokens, response_time):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO llm_metrics (user_message_id, prompt_tokens, response_tokens, response_time, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_message_id, prompt_tokens, response_tokens, response_time, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
-    logging.info(f"📊 Saved LLM metrics for user_message_id {user_message_id}")
-
-def save_feedback(user_message_id, satisfaction, feedback_text):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO feedback (user_message_id, satisfaction, feedback_text, timestamp)
-        VALUES (?, ?, ?, ?)
-    """, (user_message_id, satisfaction, feedback_text, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
-    logging.info(f"💬 Saved feedback for message {user_message_id}: {satisfaction}")
-
-def count_tokens(text: str) -> int:
-    return len(text.split())
+    # สร้าง/อัปเดต schema ครั้งเดียวต่อ process (ดู migrations.py)
+    version = run_migrations(DB_PATH)
+    logging.info(f"📦 Database initialized successfully (schema v{version}).")
+
+@st.cache_resource
+def get_telemetry():
+    # connection เดียวต่อ process ใช้ร่วมกันทุก session
+    return TelemetryWriter(DB_PATH, background=TELEMETRY_BACKGROUND)
+
+@st.cache_resource
+def get_trace_sink():
+    # None = ปิด tracing; Langfuse ใช้เมื่อตั้ง LANGFUSE_PUBLIC_KEY / LANGFUSE_SECRET_KEY
+    if not TRACING_ENABLED:
+        return None
+    return TraceSink(DB_PATH, jsonl_path=TRACE_JSONL_PATH or None, exporter=LangfuseExporter.from_env())
+
+@st.cache_resource
+def get_scheduler():
+    # คิวเดียวต่อ process ทุก session แชร์ Ollama instance เดียวกัน
+    return LLMScheduler(max_concurrency=LLM_MAX_CONCURRENCY, queue_timeout=LLM_QUEUE_TIMEOUT)
+
+def current_session():
+    """คืน (session_id, is_active) ของ session ปัจจุบัน is_active() เป็น False เมื่อผู้ใช้ปิดหน้าไปแล้ว"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return "default", None
+    session_id = ctx.session_id
+    if not Runtime.exists():
+        return session_id, None
+    runtime = Runtime.instance()
+    return session_id, lambda: runtime.is_active_session(session_id)
 
 # ---------------------- Load CSS ----------------------
 def load_css():
@@ -161,7 +128,9 @@ with st.sidebar:
         <p style='margin: 0; color: #374151;'><strong>🔍 Retrieved Chunks:</strong> 3</p>
     </div>
     """, unsafe_allow_html=True)
-    
+    queue_stats = get_scheduler().stats()
+    st.caption(f"🚦 กำลังตอบ {queue_stats['active']}/{queue_stats['max_concurrency']} | รอคิว {queue_stats['queue_depth']} คำถาม")
+
     st.markdown("---")
     st.markdown("### 💡 วิธีใช้งาน")
     st.markdown("""
@@ -192,84 +161,210 @@ init_db()
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# ---------------------- Load Document ----------------------
-doc_path = "Loan_Features.pdf"
+# ---------------------- Load Vector Store ----------------------
+# ค่า retrieval (VECTOR_BACKEND, HYBRID_*, RERANK_*, QUERY_EMBED_*, CONTEXT_*) อยู่ใน rag_pipeline.py
+@st.cache_resource
+def get_query_embeddings():
+    # embedder เดียวต่อ process ใช้ทั้งใน Chroma retriever และ answer cache
+    return build_query_embeddings(OLLAMA_URL)
 
 @st.cache_resource
 def load_vectorstore():
-    if not os.path.exists(doc_path):
-        st.error(f"❌ ไม่พบไฟล์ {doc_path} กรุณาวางไฟล์ในตำแหน่งที่ถูกต้อง")
+    with st.spinner("📚 กำลังโหลด Vector Database..."):
+        vectorstore, count = load_store(get_query_embeddings())
+
+    if count == 0:
+        st.error(f"❌ ไม่พบเอกสาร {', '.join(SOURCE_DOCS)} กรุณาวางไฟล์ในตำแหน่งที่ถูกต้อง")
         st.stop()
-    
-    with st.spinner("📚 กำลังโหลดเอกสารและสร้าง Vector Database..."):
-        loader = UnstructuredFileLoader(doc_path)
-        docs_raw = loader.load()
-
-        docs = []
-        for d in docs_raw:
-            source = d.metadata.get("source", doc_path)
-            page_num = d.metadata.get("page_number", 1)
-            docs.append(Document(page_content=d.page_content, metadata={"source": source, "page_number": page_num}))
-        
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_documents(docs)
-        logging.info(f"✅ Document split into {len(chunks)} chunks")
-        
-        embed = OllamaEmbeddings(model="bge-m3", base_url=OLLAMA_URL)
-        persist_dir = "chroma_db_pdf"
-        
-        if os.path.exists(persist_dir):
-            vectorstore = Chroma(persist_directory=persist_dir, embedding_function=embed)
-            logging.info("📂 Loaded existing ChromaDB")
-        else:
-            vectorstore = Chroma.from_documents(chunks, embed, persist_directory=persist_dir)
-            logging.info("🆕 Created new ChromaDB and persisted")
-        
-        return vectorstore
+    return vectorstore
 
 vectorstore = load_vectorstore()
-retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
 
-# ---------------------- LLM Setup ----------------------
-llm = OllamaLLM(model="llama3.2:latest", base_url=OLLAMA_URL, temperature=0.2)
-
-template = """
-คุณเป็นผู้ช่วย AI ที่เชี่ยวชาญด้านคุณสมบัติผู้กู้ยืมเงิน กยศ.
-โปรดตอบคำถามอย่างชัดเจน กระชับ และเป็นมิตร ใช้ข้อมูลจากบริบทที่ให้มาเท่านั้น
-
-บริบท (Context): {context}
+@st.cache_resource
+def get_reranker():
+    # โหลด cross-encoder ครั้งเดียวต่อ process คืน None ถ้าปิดไว้หรือโหลดไม่ได้
+    return build_reranker()
 
-คำถาม (Question): {question}
+@st.cache_resource
+def get_retriever(_vectorstore, fingerprint):
+    return build_retriever(_vectorstore, get_reranker())
 
-คำตอบ (Answer):
-- ตอบเป็นภาษาไทยที่เข้าใจง่าย
-- เจาะจงเกี่ยวกับคุณสมบัติผู้กู้ยืม กยศ.
-- ถ้าไม่มีข้อมูลในบริบท ให้บอกว่า "ไม่พบข้อมูลที่เกี่ยวข้องในเอกสาร"
-"""
-prompt = PromptTemplate(template=template, input_variables=["context", "question"])
+retriever = get_retriever(vectorstore, manifest_fingerprint())
 
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    retriever=retriever,
-    chain_type="stuff",
-    chain_type_kwargs={"prompt": prompt},
-    return_source_documents=True
-)
+@st.cache_resource
+def load_answer_cache(fingerprint):
+    return SemanticAnswerCache(
+        get_query_embeddings().embed_query,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        fingerprint=fingerprint,
+    )
 
-# ---------------------- Generate Answer ----------------------
-def generate_answer(question: str):
-    start_time = time.time()
-    result = qa_chain({"query": question})
-    end_time = time.time()
+# fingerprint เปลี่ยนเมื่อ collection ถูก ingest ใหม่ -> แคชคำตอบเดิมถูกล้าง
+answer_cache = load_answer_cache(manifest_fingerprint()) if ANSWER_CACHE_ENABLED else None
 
-    answer_text = result["result"]
-    retrieved_docs = result.get("source_documents", [])
+# ---------------------- LLM Setup ----------------------
+@st.cache_resource
+def load_llm():
+    # read timeout ของ client: thread ที่อ่าน stream ค้างอยู่หลัง deadline จะจบเองไม่เกินเวลานี้
+    return build_llm(OLLAMA_URL, timeout=LLM_GENERATION_TIMEOUT)
 
-    prompt_tokens = count_tokens(question)
-    response_tokens = count_tokens(answer_text)
-    response_time = end_time - start_time
+llm = load_llm()
+# โหลด tokenizer ครั้งเดียวตอนเริ่ม process ไม่ใช่ตอนตอบคำถามแรก
+get_tokenizer()
 
-    return answer_text, retrieved_docs, prompt_tokens, response_tokens, response_time
+# ---------------------- Warm-up ----------------------
+@st.cache_resource
+def start_warm_up():
+    """ครั้งเดียวต่อ process (เบื้องหลัง): ให้คำถามแรกไม่ต้องรอโหลดโมเดล/อ่าน index"""
+    def run():
+        start = time.time()
+        try:
+            # embed คำถาม (Ollama โหลด bge-m3), ค้น index, BM25 และ rerank ครบทั้งเส้นทาง
+            retriever.invoke(WARMUP_QUERY)
+        except Exception as e:
+            logging.warning(f"⚠️ Retrieval warm-up failed ({e})")
+        ping_ollama(OLLAMA_URL, LLM_MODEL)
+        logging.info(f"🔥 Warm-up finished in {time.time() - start:.2f}s")
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+if WARMUP_ENABLED:
+    start_warm_up()
+
+# ---------------------- Answer Cache ----------------------
+def lookup_cached_answer(question: str, start_time: float):
+    """คืน (query_vector, hit) โดย hit เป็น dict ของคำตอบจากแคช หรือ None"""
+    if answer_cache is None:
+        return None, None
+    query_vector = answer_cache.embed_query(question)
+    hit = answer_cache.lookup(question, query_vector=query_vector)
+    if not hit:
+        return query_vector, None
+
+    hit["docs"] = [Document(page_content=s["page_content"], metadata=s["metadata"]) for s in hit["sources"]]
+    hit["latency_saved"] = max(hit["response_time"] - (time.time() - start_time), 0.0)
+    logging.info(f"⚡ Answer cache hit (similarity={hit['similarity']:.3f})")
+    return query_vector, hit
+
+def store_cached_answer(question, answer_text, retrieved_docs, response_time, query_vector):
+    if answer_cache is not None and retrieved_docs:
+        sources = [{"page_content": d.page_content, "metadata": d.metadata} for d in retrieved_docs]
+        answer_cache.store(question, answer_text, sources, response_time, query_vector=query_vector)
+
+# ---------------------- Streaming Answer ----------------------
+def prepare_answer(question: str):
+    """ค้นหา context (หรือคำตอบจากแคช) ก่อนเริ่ม stream คำตอบ
+
+    คืน dict ของ turn ที่ stream_answer() ใช้และเติมผลลัพธ์ (answer, ttft, total_time)
+    """
+    turn = {"question": question, "start_time": time.time(), "cache_info": None, "trace": Trace()}
+    trace = turn["trace"]
+    # เริ่มนับตั้งแต่ค้นแคช: embed ของคำถามเกิดครั้งแรกที่นี่
+    reset_timings()
+
+    with trace.span("cache_lookup") as span:
+        query_vector, hit = lookup_cached_answer(question, turn["start_time"])
+        span["hit"] = bool(hit)
+    turn["query_vector"] = query_vector
+    if hit:
+        turn["docs"] = hit["docs"]
+        turn["cached_answer"] = hit["answer"]
+        turn["cache_info"] = {"similarity": hit["similarity"], "latency_saved": hit["latency_saved"]}
+        trace.add_stage_spans(get_last_spans())
+        return turn
+
+    with trace.span("retrieval"):
+        turn["docs"] = retriever.invoke(question)
+    turn["retrieval_timings"] = get_last_timings()
+    trace.add_stage_spans(get_last_spans())
+    with trace.span("prompt"):
+        turn["prompt_text"] = build_prompt(question, turn["docs"])
+    return turn
+
+def wait_for_llm_slot(turn, placeholder):
+    """เข้าคิวของ scheduler แล้วแสดงลำดับคิวใน placeholder จนได้สิทธิ์เรียก LLM"""
+    def show_position(position, waited):
+        placeholder.info(f"⏳ มีผู้ใช้งานจำนวนมาก คุณอยู่ลำดับที่ {position} ในคิว (รอแล้ว {waited:.0f} วินาที)")
+
+    session_id, is_active = current_session()
+    ticket = get_scheduler().acquire(session_id, is_active, on_wait=show_position)
+    # เก็บ ticket ก่อนเรียก Streamlit อีกครั้ง เพื่อให้ release_llm_slot ที่จุดเรียกคืนสิทธิ์ได้เสมอ
+    turn["ticket"] = ticket
+    placeholder.empty()
+    turn["queue_wait"] = ticket.wait_time
+    turn["trace"].add_span("queue_wait", ticket.enqueued_at, ticket.wait_time)
+
+def release_llm_slot(turn):
+    """คืนสิทธิ์ของ scheduler หลัง stream_answer: ตอบจบ/ถูกตัดเพราะหมดเวลา = release,
+    ผู้ใช้ปิดหน้าหรือ script หยุดก่อนตอบจบ (stop/rerun) = cancel เรียกซ้ำได้"""
+    ticket = turn.get("ticket")
+    if ticket is None:
+        return
+    if "answer" in turn and not turn.get("cancelled"):
+        get_scheduler().release(ticket)
+    else:
+        get_scheduler().cancel(ticket)
+    get_scheduler().log_stats()
+
+def stream_answer(turn):
+    """yield token ของคำตอบทีละส่วนจาก OllamaLLM พร้อมจับเวลา time-to-first-token
+
+    การ stream มี deadline LLM_GENERATION_TIMEOUT นับจากได้สิทธิ์ (รวม prefill) ผู้เรียกคืนสิทธิ์ด้วย release_llm_slot
+    """
+    parts = []
+    usage = OllamaUsageHandler()
+    ticket = turn.get("ticket")
+    stream_start = time.time()
+    if turn["cache_info"]:
+        chunks = iter([turn["cached_answer"]])
+    else:
+        deadline = (ticket.granted_at if ticket is not None else stream_start) + LLM_GENERATION_TIMEOUT
+        chunks = stream_until(llm.stream(turn["prompt_text"], config={"callbacks": [usage]}), deadline,
+                              ticket.is_active if ticket is not None else None)
+
+    cancelled, truncated = False, False
+    try:
+        for chunk in chunks:
+            if chunk and "ttft" not in turn:
+                turn["ttft"] = time.time() - turn["start_time"]
+            parts.append(chunk)
+            yield chunk
+    except RequestCancelled:
+        logging.info("🚪 Session closed, stopping generation")
+        cancelled = True
+    except GenerationTimeout:
+        logging.warning(f"⌛ Generation exceeded {LLM_GENERATION_TIMEOUT:g}s, truncating answer")
+        note = "\n\n⚠️ คำตอบถูกตัดเนื่องจากใช้เวลานานเกินกำหนด"
+        parts.append(note)
+        yield note
+        truncated = True
+    finally:
+        # ปิด stream: thread ที่อ่านจาก Ollama หยุดและตัดการเชื่อมต่อ
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+    turn["cancelled"] = cancelled
+    turn["answer"] = "".join(parts)
+    turn["total_time"] = time.time() - turn["start_time"]
+    turn.setdefault("ttft", turn["total_time"])
+    if not turn["cache_info"]:
+        # prefill = ส่ง prompt จนได้ token แรก, decode = token แรกจนจบ
+        first_token = turn["start_time"] + turn["ttft"]
+        turn["trace"].add_span("prefill", stream_start, max(first_token - stream_start, 0.0))
+        turn["trace"].add_span("decode", first_token, time.time() - first_token, cancelled=cancelled,
+                               truncated=truncated)
+    if turn["cache_info"]:
+        turn["prompt_tokens"], turn["response_tokens"] = 0, 0
+    else:
+        # นับ prompt ทั้งหมดที่ส่งไป (template + context + คำถาม)
+        turn["prompt_tokens"], turn["response_tokens"] = usage.token_counts(turn["prompt_text"], turn["answer"])
+        # คำตอบที่ถูกตัด (ปิดหน้า/หมดเวลา) ไม่เก็บลงแคช ไม่เช่นนั้นผู้ใช้ถัดไปจะได้คำตอบไม่ครบเป็น cache hit
+        if not (cancelled or truncated):
+            store_cached_answer(turn["question"], turn["answer"], turn["docs"], turn["total_time"],
+                                turn["query_vector"])
+    logging.info(f"⏱️ TTFT {turn['ttft']:.2f}s, total {turn['total_time']:.2f}s, retrieval {turn.get('retrieval_timings', {})}")
 
 # ---------------------- Chat Interface ----------------------
 if not st.session_state.get("chat_ended", False):
@@ -312,9 +407,28 @@ if not st.session_state.get("chat_ended", False):
         
         with st.chat_message("assistant", avatar="🤖"):
             with st.spinner("🔍 กำลังค้นหาข้อมูล..."):
-                answer, retrieved_docs, prompt_tokens, response_tokens, response_time = generate_answer(user_input)
-            
-            st.markdown(answer)
+                turn = prepare_answer(user_input)
+
+            # ได้สิทธิ์และ stream ใน try เดียวกัน: stop/rerun ระหว่างทางต้องไม่ทำให้สิทธิ์ค้าง
+            try:
+                if not turn["cache_info"]:
+                    queue_placeholder = st.empty()
+                    try:
+                        wait_for_llm_slot(turn, queue_placeholder)
+                    except (QueueTimeout, RequestCancelled):
+                        queue_placeholder.empty()
+                        st.error("⌛ ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาลองถามใหม่อีกครั้งในภายหลัง")
+                        st.stop()
+
+                # แสดงคำตอบทีละ token ทันทีที่ LLM เริ่มตอบ
+                answer = st.write_stream(stream_answer(turn))
+            finally:
+                release_llm_slot(turn)
+            retrieved_docs = turn["docs"]
+            cache_info = turn["cache_info"]
+            prompt_tokens = turn["prompt_tokens"]
+            response_tokens = turn["response_tokens"]
+            response_time = turn["total_time"]
 
             # ประมวลผลและแสดงเลขหน้าสำหรับคำตอบล่าสุด
             page_numbers_str = ""
@@ -324,17 +438,42 @@ if not st.session_state.get("chat_ended", False):
                 st.caption(f"📄 อ้างอิงจากหน้า: {page_numbers_str}")
             
             with st.expander("📊 ข้อมูลเพิ่มเติม"):
-                col1, col2, col3 = st.columns(3)
+                col1, col2, col3, col4 = st.columns(4)
                 col1.metric("Prompt Tokens", prompt_tokens)
                 col2.metric("Response Tokens", response_tokens)
-                col3.metric("Response Time", f"{response_time:.2f}s")
+                col3.metric("Time to First Token", f"{turn['ttft']:.2f}s")
+                col4.metric("Response Time", f"{response_time:.2f}s")
+                timings = turn.get("retrieval_timings")
+                if timings:
+                    st.caption(" | ".join(f"{stage}: {seconds * 1000:.0f} ms" for stage, seconds in timings.items()))
+                if turn.get("queue_wait"):
+                    st.caption(f"⏳ รอคิว LLM {turn['queue_wait']:.2f}s")
+                if cache_info:
+                    st.caption(f"⚡ ตอบจากแคช (similarity {cache_info['similarity']:.2f}, ประหยัดเวลา {cache_info['latency_saved']:.2f}s)")
     
         # ### >> FIX << ### แก้ไขการบันทึก session state ให้เก็บเลขหน้าไปด้วย
-        # Save to database
-        user_message_id = save_user_message(user_input, answer)
+        # Save to database (ข้อความ + chunks + metrics ใน transaction เดียว)
+        write_started = time.time()
+        user_message_id = get_telemetry().submit_turn(user_input, answer, retrieved_docs, {
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "response_time": response_time,
+            "ttft": turn["ttft"],
+            "total_time": turn["total_time"],
+            "cache_hit": int(cache_info is not None),
+            "latency_saved": cache_info["latency_saved"] if cache_info else None,
+            "dense_time": turn.get("retrieval_timings", {}).get("dense"),
+            "lexical_time": turn.get("retrieval_timings", {}).get("lexical"),
+            "queue_wait": turn.get("queue_wait"),
+            "rerank_time": turn.get("retrieval_timings", {}).get("rerank"),
+        })
+        trace_sink = get_trace_sink()
+        if trace_sink is not None:
+            turn["trace"].finish(cache_hit=cache_info is not None, prompt_tokens=prompt_tokens,
+                                 response_tokens=response_tokens, chunks=len(retrieved_docs))
+            # span db_write และ user_message_id ถูกเติมเมื่อ telemetry เขียนเสร็จ (thread เบื้องหลัง)
+            trace_sink.submit(turn["trace"], user_message_id, write_started)
         st.session_state.messages.append({"role": "user", "content": user_input, "id": user_message_id})
-        save_retrieved_chunks(user_message_id, retrieved_docs)
-        save_llm_metrics(user_message_id, prompt_tokens, response_tokens, response_time)
 
         # บันทึกข้อความของ assistant พร้อมเลขหน้า
         assistant_message = {"role": "assistant", "content": answer}
@@ -377,11 +516,11 @@ if st.session_state.get("chat_ended", False):
                 last_user_msg_id = None
                 for msg in reversed(st.session_state.messages):
                     if msg["role"] == "user":
-                        last_user_msg_id = msg.get("id")
+                        last_user_msg_id = resolve_message_id(msg.get("id"))
                         break
                 
                 if last_user_msg_id:
-                    save_feedback(last_user_msg_id, satisfaction, feedback_text)
+                    get_telemetry().record_feedback(last_user_msg_id, satisfaction, feedback_text)
                     st.success("✅ ขอบคุณสำหรับความคิดเห็นของคุณ!")
                     time.sleep(2)
                     st.session_state.messages = []
@@ -0,0 +1,109 @@
+import time
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from stage_timings import record_timing
+from token_count import count_tokens
+
+# ---------------------- Context Assembly ----------------------
+# ขั้นตอนระหว่าง retriever กับ PromptTemplate:
+# 1) รวม chunk ที่อยู่หน้าเดียวกันและข้อความซ้อนกัน (chunk_overlap) ให้เป็นก้อนเดียว
+# 2) ตัด chunk ที่เกือบซ้ำกัน
+# 3) เลือกเนื้อหาที่อันดับสูงสุดให้พอดีกับงบ token ของ context
+
+MIN_OVERLAP_CHARS = 20
+DUPLICATE_THRESHOLD = 0.9
+
+
+def _overlap_length(left, right, max_overlap):
+    """ความยาวของส่วนท้าย left ที่ตรงกับส่วนต้น right (0 ถ้าไม่ซ้อนกัน)"""
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_overlapping(docs, max_overlap=200):
+    """รวม chunk ที่มาจากหน้าเดียวกันและมีข้อความซ้อนกัน คงลำดับของ chunk ที่อันดับสูงกว่าไว้"""
+    merged = []
+    for doc in docs:
+        text = doc.page_content
+        page = (doc.metadata.get("source"), doc.metadata.get("page_number"))
+        for i, existing in enumerate(merged):
+            if (existing.metadata.get("source"), existing.metadata.get("page_number")) != page:
+                continue
+            current = existing.page_content
+            if text in current:
+                break
+            if current in text:
+                merged[i] = Document(page_content=text, metadata=existing.metadata)
+                break
+            size = _overlap_length(current, text, max_overlap)
+            if size:
+                merged[i] = Document(page_content=current + text[size:], metadata=existing.metadata)
+                break
+            size = _overlap_length(text, current, max_overlap)
+            if size:
+                merged[i] = Document(page_content=text + current[size:], metadata=existing.metadata)
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+
+def _shingles(text, n=3):
+    text = "".join(text.split())
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+
+
+def drop_near_duplicates(docs, threshold=DUPLICATE_THRESHOLD):
+    """ตัด chunk ที่ character 3-gram เกือบทั้งหมด (>= threshold) อยู่ใน chunk ที่อันดับสูงกว่าแล้ว"""
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / len(shingles) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_to_budget(docs, token_budget):
+    """เลือก chunk ตามลำดับอันดับจนเต็มงบ token (chunk แรกถูกตัดให้พอดีถ้ายาวเกินงบ)"""
+    packed, used = [], 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if used + tokens <= token_budget:
+            packed.append(doc)
+            used += tokens
+        elif not packed:
+            ratio = token_budget / tokens
+            text = doc.page_content[:int(len(doc.page_content) * ratio)]
+            packed.append(Document(page_content=text, metadata=doc.metadata))
+            used += count_tokens(text)
+    return packed, used
+
+
+def assemble_context(docs, token_budget):
+    merged = merge_overlapping(docs)
+    unique = drop_near_duplicates(merged)
+    packed, _ = pack_to_budget(unique, token_budget)
+    return packed
+
+
+class AssembledRetriever(BaseRetriever):
+    """ห่อ retriever เดิม แล้วรวม/ตัดซ้ำ/จำกัดขนาด context ก่อนส่งให้ PromptTemplate"""
+
+    base_retriever: Any
+    token_budget: int = 1200
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        docs = self.base_retriever.invoke(query, config=config)
+        start = time.perf_counter()
+        assembled = assemble_context(docs, self.token_budget)
+        record_timing("assembly", time.perf_counter() - start)
+        return assembled
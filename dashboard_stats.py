@@ -0,0 +1,455 @@
+import argparse
+import logging
+import sqlite3
+import time
+
+from metrics_engine import HISTOGRAM_METRICS, RESOLUTIONS, STAGE_PREFIX, latency_bin, period_of
+from text_utils import normalize_text
+from tracing import UNTRACED_STAGES
+
+# ---------------------- Dashboard Aggregates ----------------------
+# ตาราง rollup รายชั่วโมงที่อัปเดตแบบ incremental (ประมวลผลเฉพาะแถวใหม่หลัง watermark)
+# KPI บน dashboard อ่านจากตารางเหล่านี้แทนการโหลดทุกแถวเข้า pandas ทุกครั้งที่ rerun
+# ตาราง rollup สร้างใน migrations.py (m005, m011)
+
+DB_PATH = "questions.db"
+
+# ค่า satisfaction ที่นับเป็น "พอใจ" (ค่าเดิม + ค่าจากแบบประเมินปัจจุบัน)
+HELPFUL_SATISFACTION = ("พอใจ", "ช่วยได้มาก 👍")
+
+
+# ---------------------- Compaction Job ----------------------
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _col(columns, name):
+    # ฐานข้อมูลเก่าอาจยังไม่มีคอลัมน์ใหม่ (เช่น ttft, cache_hit)
+    return name if name in columns else "NULL"
+
+
+def _watermark(conn, source):
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_watermark(conn, source, last_id):
+    conn.execute("INSERT OR REPLACE INTO rollup_state (source, last_id) VALUES (?, ?)", (source, last_id))
+
+
+def _roll_messages(conn):
+    last_id = _watermark(conn, "user_messages")
+    rows = conn.execute(
+        "SELECT id, substr(timestamp, 1, 13), user_message FROM user_messages WHERE id > ? ORDER BY id",
+        (last_id,)
+    ).fetchall()
+    if not rows:
+        return 0
+    per_bucket, per_question = {}, {}
+    for _, bucket, message in rows:
+        per_bucket[bucket] = per_bucket.get(bucket, 0) + 1
+        normalized = normalize_text(message)
+        per_question[normalized] = per_question.get(normalized, 0) + 1
+    conn.executemany("""
+        INSERT INTO stats_hourly (bucket, messages) VALUES (?, ?)
+        ON CONFLICT(bucket) DO UPDATE SET messages = messages + excluded.messages
+    """, per_bucket.items())
+    conn.executemany("""
+        INSERT INTO question_counts (normalized, count) VALUES (?, ?)
+        ON CONFLICT(normalized) DO UPDATE SET count = count + excluded.count
+    """, per_question.items())
+    _set_watermark(conn, "user_messages", rows[-1][0])
+    return len(rows)
+
+
+def _roll_chunks(conn):
+    last_id = _watermark(conn, "retrieved_chunks")
+    max_id = conn.execute("SELECT MAX(id) FROM retrieved_chunks").fetchone()[0]
+    if max_id is None or max_id <= last_id:
+        return 0
+    rows = conn.execute("""
+        SELECT substr(um.timestamp, 1, 13) AS bucket, COUNT(*)
+        FROM retrieved_chunks rc
+        LEFT JOIN user_messages um ON rc.user_message_id = um.id
+        WHERE rc.id > ? AND rc.id <= ?
+        GROUP BY bucket
+    """, (last_id, max_id)).fetchall()
+    conn.executemany("""
+        INSERT INTO stats_hourly (bucket, chunks) VALUES (?, ?)
+        ON CONFLICT(bucket) DO UPDATE SET chunks = chunks + excluded.chunks
+    """, [(bucket or "unknown", count) for bucket, count in rows])
+    _set_watermark(conn, "retrieved_chunks", max_id)
+    return sum(count for _, count in rows)
+
+
+def _roll_metrics(conn):
+    last_id = _watermark(conn, "llm_metrics")
+    max_id = conn.execute("SELECT MAX(id) FROM llm_metrics").fetchone()[0]
+    if max_id is None or max_id <= last_id:
+        return 0
+    cols = _columns(conn, "llm_metrics")
+    ttft, cache_hit, latency_saved = _col(cols, "ttft"), _col(cols, "cache_hit"), _col(cols, "latency_saved")
+    rows = conn.execute(f"""
+        SELECT substr(timestamp, 1, 13) AS bucket, COUNT(*),
+               COALESCE(SUM(response_time), 0), MIN(response_time), MAX(response_time),
+               COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(response_tokens), 0),
+               COALESCE(SUM({ttft}), 0), COUNT({ttft}),
+               COALESCE(SUM({cache_hit}), 0), COALESCE(SUM({latency_saved}), 0)
+        FROM llm_metrics
+        WHERE id > ? AND id <= ?
+        GROUP BY bucket
+    """, (last_id, max_id)).fetchall()
+    conn.executemany("""
+        INSERT INTO stats_hourly (bucket, metrics_count, response_time_sum, response_time_min, response_time_max,
+                                  prompt_tokens_sum, response_tokens_sum, ttft_sum, ttft_count,
+                                  cache_hits, latency_saved_sum)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(bucket) DO UPDATE SET
+            metrics_count = metrics_count + excluded.metrics_count,
+            response_time_sum = response_time_sum + excluded.response_time_sum,
+            response_time_min = MIN(COALESCE(response_time_min, excluded.response_time_min),
+                                    COALESCE(excluded.response_time_min, response_time_min)),
+            response_time_max = MAX(COALESCE(response_time_max, excluded.response_time_max),
+                                    COALESCE(excluded.response_time_max, response_time_max)),
+            prompt_tokens_sum = prompt_tokens_sum + excluded.prompt_tokens_sum,
+            response_tokens_sum = response_tokens_sum + excluded.response_tokens_sum,
+            ttft_sum = ttft_sum + excluded.ttft_sum,
+            ttft_count = ttft_count + excluded.ttft_count,
+            cache_hits = cache_hits + excluded.cache_hits,
+            latency_saved_sum = latency_saved_sum + excluded.latency_saved_sum
+    """, [((bucket or "unknown"),) + tuple(rest) for bucket, *rest in rows])
+    _set_watermark(conn, "llm_metrics", max_id)
+    return sum(row[1] for row in rows)
+
+
+def _roll_histograms(conn):
+    # watermark แยกจาก stats_hourly: ฐานข้อมูลเดิมจะถูกนับย้อนหลังทั้งหมดในการ refresh ครั้งแรก
+    last_id = _watermark(conn, "llm_metrics_histogram")
+    max_id = conn.execute("SELECT MAX(id) FROM llm_metrics").fetchone()[0]
+    if max_id is None or max_id <= last_id:
+        return 0
+    ttft = _col(_columns(conn, "llm_metrics"), "ttft")
+    histogram, periods, processed = {}, {}, 0
+    rows = conn.execute(f"""
+        SELECT timestamp, response_time, {ttft}, prompt_tokens, response_tokens
+        FROM llm_metrics
+        WHERE id > ? AND id <= ? AND timestamp IS NOT NULL
+    """, (last_id, max_id))
+    for timestamp, response_time, first_token, prompt_tokens, response_tokens in rows:
+        bins = [(metric, latency_bin(value))
+                for metric, value in zip(HISTOGRAM_METRICS, (response_time, first_token)) if value is not None]
+        # token rate นับเฉพาะช่วงสร้างคำตอบ (หลัง token แรก) ของ request ที่เรียก LLM จริง
+        generation_time = max(response_time - (first_token or 0), 0.0) if response_tokens and response_time else 0.0
+        for resolution in RESOLUTIONS:
+            period = period_of(timestamp, resolution)
+            for metric, index in bins:
+                key = (resolution, metric, period, index)
+                histogram[key] = histogram.get(key, 0) + 1
+            totals = periods.setdefault((resolution, period), [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += prompt_tokens or 0
+            totals[2] += response_tokens or 0
+            totals[3] += generation_time
+        processed += 1
+    conn.executemany("""
+        INSERT INTO metrics_histogram (resolution, metric, period, bin, count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(resolution, metric, period, bin) DO UPDATE SET count = count + excluded.count
+    """, [key + (count,) for key, count in histogram.items()])
+    conn.executemany("""
+        INSERT INTO metrics_periods (resolution, period, requests, prompt_tokens_sum, response_tokens_sum,
+                                     generation_time_sum)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(resolution, period) DO UPDATE SET
+            requests = requests + excluded.requests,
+            prompt_tokens_sum = prompt_tokens_sum + excluded.prompt_tokens_sum,
+            response_tokens_sum = response_tokens_sum + excluded.response_tokens_sum,
+            generation_time_sum = generation_time_sum + excluded.generation_time_sum
+    """, [key + tuple(totals) for key, totals in periods.items()])
+    _set_watermark(conn, "llm_metrics_histogram", max_id)
+    return processed
+
+
+def _roll_spans(conn):
+    # span ของ tracing.py -> histogram ราย stage ในตารางเดียวกับ latency (metric = "stage:<ชื่อ>")
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trace_spans'").fetchone():
+        return 0
+    last_id = _watermark(conn, "trace_spans")
+    max_id = conn.execute("SELECT MAX(id) FROM trace_spans").fetchone()[0]
+    if max_id is None or max_id <= last_id:
+        return 0
+    histogram, processed = {}, 0
+    # ไม่นับ span ที่ซ้อนกับ stage อื่น (เช่น dense ที่ trace เก่ายังบันทึกไว้)
+    rows = conn.execute(f"""
+        SELECT name, start_time, duration FROM trace_spans
+        WHERE id > ? AND id <= ? AND name NOT IN ({", ".join("?" for _ in UNTRACED_STAGES)})
+    """, (last_id, max_id, *UNTRACED_STAGES))
+    for name, start_time, duration in rows:
+        index = latency_bin(duration)
+        for resolution in RESOLUTIONS:
+            key = (resolution, STAGE_PREFIX + name, period_of(start_time, resolution), index)
+            histogram[key] = histogram.get(key, 0) + 1
+        processed += 1
+    conn.executemany("""
+        INSERT INTO metrics_histogram (resolution, metric, period, bin, count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(resolution, metric, period, bin) DO UPDATE SET count = count + excluded.count
+    """, [key + (count,) for key, count in histogram.items()])
+    _set_watermark(conn, "trace_spans", max_id)
+    return processed
+
+
+def _roll_feedback(conn):
+    last_id = _watermark(conn, "feedback")
+    max_id = conn.execute("SELECT MAX(id) FROM feedback").fetchone()[0]
+    if max_id is None or max_id <= last_id:
+        return 0
+    rows = conn.execute("""
+        SELECT substr(timestamp, 1, 13) AS bucket, COALESCE(satisfaction, ''), COUNT(*)
+        FROM feedback
+        WHERE id > ? AND id <= ?
+        GROUP BY bucket, satisfaction
+    """, (last_id, max_id)).fetchall()
+    conn.executemany("""
+        INSERT INTO feedback_hourly (bucket, satisfaction, count) VALUES (?, ?, ?)
+        ON CONFLICT(bucket, satisfaction) DO UPDATE SET count = count + excluded.count
+    """, [(bucket or "unknown", satisfaction, count) for bucket, satisfaction, count in rows])
+    _set_watermark(conn, "feedback", max_id)
+    return sum(row[2] for row in rows)
+
+
+# watermark ใน rollup_state -> ตารางต้นทาง
+ROLLUP_SOURCES = {
+    "user_messages": "user_messages",
+    "retrieved_chunks": "retrieved_chunks",
+    "llm_metrics": "llm_metrics",
+    "llm_metrics_histogram": "llm_metrics",
+    "trace_spans": "trace_spans",
+    "feedback": "feedback",
+}
+
+
+def has_pending_rows(conn):
+    """มีแถวใหม่หลัง watermark หรือไม่ (อ่านอย่างเดียว: MAX(id) ของ primary key กับ rollup_state)"""
+    watermarks = dict(conn.execute("SELECT source, last_id FROM rollup_state").fetchall())
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for source, table in ROLLUP_SOURCES.items():
+        if table not in tables:
+            continue
+        max_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        if max_id is not None and max_id > watermarks.get(source, 0):
+            return True
+    return False
+
+
+def refresh_rollups(db_path=DB_PATH):
+    """ประมวลผลเฉพาะแถวใหม่ตั้งแต่ครั้งก่อน แล้วบวกเข้าตาราง rollup ใน transaction เดียว
+
+    ถ้าไม่มีแถวใหม่ จะไม่เปิด write transaction (ไม่แย่ง lock กับ telemetry ของหน้าแชท)
+    """
+    start = time.time()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if not has_pending_rows(conn):
+            return dict.fromkeys(("messages", "chunks", "metrics", "histograms", "spans", "feedback"), 0)
+        conn.execute("BEGIN IMMEDIATE")
+        processed = {
+            "messages": _roll_messages(conn),
+            "chunks": _roll_chunks(conn),
+            "metrics": _roll_metrics(conn),
+            "histograms": _roll_histograms(conn),
+            "spans": _roll_spans(conn),
+            "feedback": _roll_feedback(conn),
+        }
+        conn.commit()
+    finally:
+        conn.close()
+    if any(processed.values()):
+        logging.info(f"📈 Rollups refreshed in {time.time() - start:.3f}s: {processed}")
+    return processed
+
+
+def rebuild_rollups(db_path=DB_PATH):
+    """ล้าง rollup แล้วคำนวณใหม่ทั้งหมด (ใช้หลังลบข้อมูลในตารางต้นทาง)"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.executescript("""
+            DELETE FROM stats_hourly;
+            DELETE FROM feedback_hourly;
+            DELETE FROM question_counts;
+            DELETE FROM metrics_histogram;
+            DELETE FROM metrics_periods;
+            DELETE FROM rollup_state;
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+    return refresh_rollups(db_path)
+
+
+# ---------------------- KPI Queries ----------------------
+def get_kpis(conn):
+    row = conn.execute("""
+        SELECT COALESCE(SUM(messages), 0), COALESCE(SUM(chunks), 0), COALESCE(SUM(metrics_count), 0),
+               COALESCE(SUM(response_time_sum), 0), MIN(response_time_min), MAX(response_time_max),
+               COALESCE(SUM(prompt_tokens_sum), 0), COALESCE(SUM(response_tokens_sum), 0),
+               COALESCE(SUM(ttft_sum), 0), COALESCE(SUM(ttft_count), 0),
+               COALESCE(SUM(cache_hits), 0), COALESCE(SUM(latency_saved_sum), 0)
+        FROM stats_hourly
+    """).fetchone()
+    (messages, chunks, requests, rt_sum, rt_min, rt_max,
+     prompt_sum, response_sum, ttft_sum, ttft_count, cache_hits, saved_sum) = row
+
+    feedback = get_feedback_counts(conn)
+    feedback_count = sum(feedback.values())
+    helpful = sum(count for satisfaction, count in feedback.items() if satisfaction in HELPFUL_SATISFACTION)
+
+    return {
+        "messages": messages,
+        "chunks": chunks,
+        "requests": requests,
+        "avg_response_time": rt_sum / requests if requests else 0.0,
+        "min_response_time": rt_min,
+        "max_response_time": rt_max,
+        "total_tokens": prompt_sum + response_sum,
+        "avg_prompt_tokens": prompt_sum / requests if requests else 0.0,
+        "avg_response_tokens": response_sum / requests if requests else 0.0,
+        "avg_ttft": ttft_sum / ttft_count if ttft_count else None,
+        "cache_hits": cache_hits,
+        "latency_saved": saved_sum,
+        "feedback_count": feedback_count,
+        "satisfaction_rate": round(helpful / feedback_count * 100, 1) if feedback_count else 0,
+    }
+
+
+def get_feedback_counts(conn):
+    rows = conn.execute("SELECT satisfaction, SUM(count) FROM feedback_hourly GROUP BY satisfaction").fetchall()
+    return dict(rows)
+
+
+def get_top_questions(conn, limit=10):
+    return conn.execute(
+        "SELECT normalized, count FROM question_counts ORDER BY count DESC LIMIT ?", (limit,)
+    ).fetchall()
+
+
+# ---------------------- Paginated Detail Queries ----------------------
+# keyset pagination แบบเดียวกับ admin_data.question_page: cursor = id (หรือ (rank, id) ของผลค้นหา) ของแถวสุดท้าย
+# ของหน้าก่อน แต่ละหน้าจึงอ่านผ่าน primary key ไม่ว่าจะลึกแค่ไหน (ไม่มี OFFSET)
+MAX_ROWID = 2 ** 63 - 1
+
+
+def _before(cursor):
+    # หน้าแรก (cursor = None) = ทุกแถว
+    return MAX_ROWID if cursor is None else cursor
+
+
+def _keyset_page(rows, page_size, cursor_of):
+    """คืน (rows, next_cursor) จากผลที่ดึงมา page_size + 1 แถว"""
+    next_cursor = cursor_of(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def get_messages_page(conn, cursor, page_size):
+    """คืน (rows, next_cursor) ของหน้าที่เริ่มหลัง cursor (None = หน้าแรก) next_cursor เป็น None เมื่อไม่มีหน้าถัดไป"""
+    rows = conn.execute("""
+        SELECT id, user_message, answer, timestamp FROM user_messages
+        WHERE id < ?
+        ORDER BY id DESC LIMIT ?
+    """, (_before(cursor), page_size + 1)).fetchall()
+    return _keyset_page(rows, page_size, lambda row: row[0])
+
+
+# ---------------------- Message Search ----------------------
+# ใช้ index user_messages_fts (FTS5 trigram, สร้างใน migrations.py) ค้นทั้งคำถามและคำตอบ
+# เรียงตาม bm25 และคืน snippet ที่ไฮไลต์คำค้น ถ้าไม่มี index หรือคำค้นสั้นกว่า 3 ตัวอักษร
+# (trigram ค้นไม่ได้) จะใช้ LIKE บน user_messages แทน
+
+SEARCH_TABLE = "user_messages_fts"
+HIGHLIGHT = ("«", "»")
+SNIPPET_TOKENS = 16
+
+
+def has_search_index(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def _fts_phrase(term):
+    # ครอบเป็น phrase เพื่อไม่ให้เครื่องหมายในคำค้น (", *, -, OR) ถูกตีความเป็น syntax ของ FTS5
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_messages(conn, term, cursor, page_size):
+    """คืน (rows, next_cursor) rows = (id, user_message, answer, timestamp, question snippet, answer snippet)
+
+    cursor ของผลจาก FTS = (rank, id) ของแถวสุดท้าย, ของผลจาก LIKE = id
+    """
+    term = term.strip()
+    if len(term) >= 3 and has_search_index(conn):
+        where, params = "", []
+        if cursor is not None:
+            where = f"AND ({SEARCH_TABLE}.rank, um.id) > (?, ?)"
+            params = list(cursor)
+        rows = conn.execute(f"""
+            SELECT um.id, um.user_message, um.answer, um.timestamp,
+                   snippet({SEARCH_TABLE}, 0, ?, ?, '…', ?),
+                   snippet({SEARCH_TABLE}, 1, ?, ?, '…', ?),
+                   {SEARCH_TABLE}.rank
+            FROM {SEARCH_TABLE}
+            JOIN user_messages um ON um.id = {SEARCH_TABLE}.rowid
+            WHERE {SEARCH_TABLE} MATCH ? {where}
+            ORDER BY {SEARCH_TABLE}.rank, um.id
+            LIMIT ?
+        """, (*HIGHLIGHT, SNIPPET_TOKENS, *HIGHLIGHT, SNIPPET_TOKENS,
+              _fts_phrase(term), *params, page_size + 1)).fetchall()
+        rows, next_cursor = _keyset_page(rows, page_size, lambda row: (row[6], row[0]))
+        return [row[:6] for row in rows], next_cursor
+
+    pattern = f"%{term}%"
+    rows = conn.execute("""
+        SELECT id, user_message, answer, timestamp, user_message, substr(answer, 1, 200)
+        FROM user_messages
+        WHERE id < ? AND (user_message LIKE ? OR answer LIKE ?)
+        ORDER BY id DESC LIMIT ?
+    """, (_before(cursor), pattern, pattern, page_size + 1)).fetchall()
+    return _keyset_page(rows, page_size, lambda row: row[0])
+
+
+def get_chunks_page(conn, cursor, page_size):
+    rows = conn.execute("""
+        SELECT rc.id, rc.user_message_id, um.user_message, rc.chunk_text, rc.source, rc.page_number
+        FROM retrieved_chunks rc
+        LEFT JOIN user_messages um ON rc.user_message_id = um.id
+        WHERE rc.id < ?
+        ORDER BY rc.id DESC LIMIT ?
+    """, (_before(cursor), page_size + 1)).fetchall()
+    return _keyset_page(rows, page_size, lambda row: row[0])
+
+
+def get_feedback_page(conn, cursor, page_size, satisfaction=None):
+    params = [_before(cursor)]
+    where = "WHERE f.id < ?"
+    if satisfaction:
+        where += " AND f.satisfaction = ?"
+        params.append(satisfaction)
+    rows = conn.execute(f"""
+        SELECT f.id, f.user_message_id, um.user_message, f.satisfaction, f.feedback_text, f.timestamp
+        FROM feedback f
+        LEFT JOIN user_messages um ON f.user_message_id = um.id
+        {where}
+        ORDER BY f.id DESC LIMIT ?
+    """, params + [page_size + 1]).fetchall()
+    return _keyset_page(rows, page_size, lambda row: row[0])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="อัปเดตตาราง rollup ของ dashboard (ใช้กับ cron ได้)")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--rebuild", action="store_true", help="คำนวณ rollup ใหม่ทั้งหมด")
+    args = parser.parse_args()
+
+    from migrations import run_migrations
+    run_migrations(args.db)
+    print(rebuild_rollups(args.db) if args.rebuild else refresh_rollups(args.db))
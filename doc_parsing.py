@@ -0,0 +1,145 @@
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# ---------------------- Document Parsing ----------------------
+# แยกเอกสารเป็น Document ทีละหน้า (page_number ถูกต้อง) แบบ generator ให้ splitter รับไปทีละหน้า
+# - PDF: PyMuPDF ดึงชั้นข้อความทีละช่วงหน้าใน process pool หน้าที่ไม่มีชั้นข้อความแต่มีรูป (หน้าสแกน)
+#   เท่านั้นที่ส่งต่อให้ unstructured (OCR / layout analysis)
+# - ไฟล์อื่น (เช่น DOCX): unstructured แบบ elements แล้วรวม element ที่อยู่หน้าเดียวกัน
+# module นี้ import เฉพาะ stdlib ที่ระดับบนสุด worker process จึงเริ่มได้เร็ว
+
+# เปลี่ยนเมื่อข้อความ/เลขหน้าที่ parser ให้ออกมาเปลี่ยน (ingest จะ embed ใหม่ทั้งหมด)
+PARSER_VERSION = "pymupdf-2"
+PAGES_PER_TASK = 8
+# เอกสารสั้นกว่านี้ดึงใน process เดียว (เวลาเริ่ม worker มากกว่าเวลาที่ประหยัดได้)
+MIN_PAGES_FOR_POOL = 100
+MIN_TEXT_CHARS = 20
+
+# ฟอนต์ไทยใน PDF หลายตัวเก็บวรรณยุกต์/สระที่ขยับตำแหน่งเป็น glyph ใน private-use area (U+F700-U+F71A)
+THAI_PUA = dict(zip(range(0xF700, 0xF71B), "ฐิีึื่้๊๋์่้๊๋์ญัํ็่้๊๋์ฺุู"))
+# สระอำที่ถูกแยกเป็น (นิคหิตที่หายไปเป็นช่องว่าง) + า เช่น "ก าหนด" -> "กำหนด"
+_SPLIT_SARA_AM_RE = re.compile(r"(?<=[ก-ฮ่-๋]) า")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def clean_pdf_text(text):
+    text = _SPLIT_SARA_AM_RE.sub("ำ", text.translate(THAI_PUA))
+    lines = [line.strip() for line in text.splitlines()]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _pymupdf():
+    try:
+        import pymupdf
+    except ImportError:  # PyMuPDF < 1.24
+        import fitz as pymupdf
+    return pymupdf
+
+
+# ---------------------- PDF Fast Path ----------------------
+def _extract_pages(path, start, end):
+    """(รันใน worker) คืน [(page_number, text, needs_fallback)] ของหน้า start..end-1"""
+    results = []
+    with _pymupdf().open(path) as pdf:
+        for index in range(start, end):
+            page = pdf[index]
+            text = clean_pdf_text(page.get_text("text"))
+            # ไม่มีชั้นข้อความแต่มีรูป = หน้าสแกน ต้อง OCR
+            needs_fallback = len(text) < MIN_TEXT_CHARS and bool(page.get_images())
+            results.append((index + 1, text, needs_fallback))
+    return results
+
+
+def _page_batches(path, page_count, workers):
+    ranges = [(lo, min(lo + PAGES_PER_TASK, page_count)) for lo in range(0, page_count, PAGES_PER_TASK)]
+    if workers <= 1 or page_count < MIN_PAGES_FOR_POOL:
+        for lo, hi in ranges:
+            yield _extract_pages(path, lo, hi)
+        return
+    # spawn: ไม่ fork process ที่มี thread ของ Streamlit/Chroma อยู่
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        pending = deque()
+        for lo, hi in ranges:
+            pending.append(pool.submit(_extract_pages, path, lo, hi))
+            # ส่งงานล่วงหน้าไม่เกิน 2 เท่าของ worker ผลที่ยังไม่ถูกใช้จะได้ไม่กองในหน่วยความจำ
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _fallback_page(path, page_number):
+    """ส่งหน้าเดียวให้ unstructured โดยคัดหน้านั้นออกเป็น PDF ชั่วคราว"""
+    from langchain.document_loaders import UnstructuredFileLoader
+
+    pymupdf = _pymupdf()
+    with tempfile.TemporaryDirectory() as tmp:
+        page_path = os.path.join(tmp, f"page-{page_number}.pdf")
+        with pymupdf.open(path) as pdf, pymupdf.open() as single:
+            single.insert_pdf(pdf, from_page=page_number - 1, to_page=page_number - 1)
+            single.save(page_path)
+        docs = UnstructuredFileLoader(page_path).load()
+    return clean_pdf_text("\n\n".join(d.page_content for d in docs))
+
+
+def _iter_pdf_pages(path, workers):
+    start = time.time()
+    with _pymupdf().open(path) as pdf:
+        page_count = pdf.page_count
+    fast, fallback, failed = 0, 0, 0
+    for batch in _page_batches(path, page_count, workers):
+        for page_number, text, needs_fallback in batch:
+            if needs_fallback:
+                try:
+                    text = _fallback_page(path, page_number)
+                    fallback += 1
+                except Exception as e:
+                    failed += 1
+                    logging.warning(f"⚠️ {path} page {page_number}: OCR fallback failed ({e}), page skipped")
+                    continue
+            else:
+                fast += 1
+            yield page_number, text
+    logging.info(
+        f"📑 {path}: {page_count} pages in {time.time() - start:.2f}s "
+        f"(PyMuPDF={fast}, unstructured={fallback}, skipped={failed})"
+    )
+
+
+# ---------------------- Other Formats ----------------------
+def _iter_unstructured_pages(path):
+    from langchain.document_loaders import UnstructuredFileLoader
+
+    # mode="elements" เก็บ page_number ของแต่ละ element (mode ปกติรวมทั้งไฟล์เป็นก้อนเดียว เลขหน้าหาย)
+    page, parts = None, []
+    for element in UnstructuredFileLoader(path, mode="elements").lazy_load():
+        number = element.metadata.get("page_number") or 1
+        if parts and number != page:
+            yield page, "\n\n".join(parts)
+            parts = []
+        page = number
+        parts.append(element.page_content)
+    if parts:
+        yield page, "\n\n".join(parts)
+
+
+def iter_pages(path, workers=0):
+    """yield Document ทีละหน้า metadata = {"source": path, "page_number": เลขหน้าเริ่มที่ 1}
+
+    workers = จำนวน process ที่ดึงข้อความ PDF (0 = จำนวน CPU)
+    """
+    from langchain_core.documents import Document
+
+    if path.lower().endswith(".pdf"):
+        pages = _iter_pdf_pages(path, workers or os.cpu_count() or 1)
+    else:
+        pages = _iter_unstructured_pages(path)
+    for page_number, text in pages:
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": path, "page_number": page_number})
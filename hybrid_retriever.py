@@ -0,0 +1,174 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from stage_timings import record_timing
+
+# ---------------------- Hybrid Retrieval ----------------------
+# BM25 (keyword) index บน chunks ชุดเดียวกับ Chroma แล้วรวมผลกับ dense search ด้วย
+# reciprocal-rank fusion ช่วยให้คำถามที่มีตัวเลขตรงตัว (รายได้, อายุ, GPA) เจอ chunk ที่ถูกต้อง
+
+LEXICAL_INDEX_NAME = "bm25_index.json"
+
+_THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)*|[a-z]+|[฀-๿]+")
+
+try:
+    from pythainlp.tokenize import word_tokenize as _thai_word_tokenize
+except ImportError:
+    _thai_word_tokenize = None
+
+
+# ---------------------- Tokenizer ----------------------
+def _split_thai(text):
+    if _thai_word_tokenize is not None:
+        return [w for w in _thai_word_tokenize(text, engine="newmm", keep_whitespace=False) if w.strip()]
+    # ไม่มี pythainlp: ใช้ character bigram ของภาษาไทยแทนการตัดคำ
+    if len(text) < 2:
+        return [text]
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def tokenize(text):
+    """ตัดคำแบบรองรับภาษาไทย ตัวเลขถูกเก็บเป็น token เดียว (1,000,000 -> 1000000)"""
+    text = text.lower().translate(_THAI_DIGITS)
+    tokens = []
+    for match in _TOKEN_RE.findall(text):
+        if match[0].isdigit():
+            tokens.append(match.replace(",", ""))
+        elif "฀" <= match[0] <= "๿":
+            tokens.extend(_split_thai(match))
+        else:
+            tokens.append(match)
+    return tokens
+
+
+# ---------------------- BM25 Index ----------------------
+class BM25Index:
+    """BM25 Okapi บน chunks ที่เก็บเป็นไฟล์ JSON ข้าง chroma_db_pdf"""
+
+    def __init__(self, ids, texts, metadatas, tokens=None, k1=1.5, b=0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+        self.tokens = tokens if tokens is not None else [tokenize(t) for t in texts]
+        self._build()
+
+    def _build(self):
+        self.term_freqs = [Counter(toks) for toks in self.tokens]
+        self.doc_lens = [len(toks) for toks in self.tokens]
+        self.avg_len = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+        df = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(self.tokens)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+        # inverted index: term -> [(doc index, tf)]
+        self.postings = {}
+        for i, tf in enumerate(self.term_freqs):
+            for term, freq in tf.items():
+                self.postings.setdefault(term, []).append((i, freq))
+
+    def search(self, query, k=10):
+        """คืน list ของ (doc index, score) เรียงจากคะแนนมากไปน้อย"""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[i] / (self.avg_len or 1.0))
+                scores[i] = scores.get(i, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def document(self, i):
+        return Document(page_content=self.texts[i], metadata=dict(self.metadatas[i]))
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "k1": self.k1, "b": self.b, "ids": self.ids, "texts": self.texts,
+                "metadatas": self.metadatas, "tokens": self.tokens,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["texts"], data["metadatas"], tokens=data["tokens"], k1=data["k1"], b=data["b"])
+
+
+def lexical_index_path(persist_dir):
+    return os.path.join(persist_dir, LEXICAL_INDEX_NAME)
+
+
+def build_lexical_index(vectorstore, persist_dir):
+    """สร้าง BM25 index จาก chunks ทั้งหมดใน collection แล้วบันทึกลงไฟล์"""
+    start = time.time()
+    data = vectorstore.get(include=["documents", "metadatas"])
+    index = BM25Index(data["ids"], data["documents"], data["metadatas"])
+    index.save(lexical_index_path(persist_dir))
+    logging.info(f"🔤 Built BM25 index over {len(index.ids)} chunks in {time.time() - start:.2f}s")
+    return index
+
+
+def load_lexical_index(persist_dir):
+    path = lexical_index_path(persist_dir)
+    if not os.path.exists(path):
+        return None
+    return BM25Index.load(path)
+
+
+# ---------------------- Fusion Retriever ----------------------
+def _doc_key(doc):
+    return (doc.metadata.get("source"), doc.metadata.get("page_number"), doc.page_content)
+
+
+class HybridRetriever(BaseRetriever):
+    """รวมผล dense (Chroma) กับ BM25 ด้วย reciprocal-rank fusion ใช้แทน retriever เดิมใน RetrievalQA ได้"""
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 3
+    fetch_k: int = 10
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        start = time.perf_counter()
+        # embed แยกจากการค้น: dense = embed + search (ตรงกับ llm_metrics.dense_time), search = ค้น index อย่างเดียว
+        vector = self.vectorstore.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+        dense_docs = self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+        dense_time = time.perf_counter() - start
+        search_time = time.perf_counter() - embedded
+
+        start = time.perf_counter()
+        lexical_hits = self.lexical_index.search(query, k=self.fetch_k)
+        lexical_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scores, docs = {}, {}
+        ranked_lists = [dense_docs, [self.lexical_index.document(i) for i, _ in lexical_hits]]
+        for ranked in ranked_lists:
+            for rank, doc in enumerate(ranked):
+                key = _doc_key(doc)
+                docs.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        fusion_time = time.perf_counter() - start
+
+        record_timing("dense", dense_time)
+        record_timing("search", search_time)
+        record_timing("lexical", lexical_time)
+        record_timing("fusion", fusion_time)
+        return [docs[key] for key in best]
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from batch_embed import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, embed_in_batches
+from doc_parsing import PARSER_VERSION, iter_pages
+from hybrid_retriever import build_lexical_index, lexical_index_path
+from mmap_vectorstore import build_mmap_index, read_index_fingerprint
+from model_config import EMBED_MODEL
+
+# ---------------------- Config ----------------------
+load_dotenv()
+OLLAMA_URL = os.getenv("OLLAMA_BASE_URL")
+
+PERSIST_DIR = "chroma_db_pdf"
+MANIFEST_NAME = "ingest_manifest.json"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(DEFAULT_WORKERS)))
+# จำนวน process ที่ดึงข้อความ PDF (0 = จำนวน CPU)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+# chunk ใหม่ถูก embed/upsert ทีละกลุ่มระหว่าง parse ไม่ต้องถือทั้งเอกสารไว้ในหน่วยความจำ
+FLUSH_CHUNKS = 256
+# memory-mapped index (backend ทางเลือก VECTOR_BACKEND=mmap): ชนิดข้อมูล และจำนวนกลุ่ม IVF (0 = brute-force)
+# export เฉพาะเมื่อใช้ backend mmap (backend chroma ไม่ต้องเก็บสำเนา embedding ชุดที่สอง)
+MMAP_INDEX_ENABLED = os.getenv("VECTOR_BACKEND", "chroma") == "mmap"
+MMAP_INDEX_DTYPE = os.getenv("MMAP_INDEX_DTYPE", "float16")
+MMAP_INDEX_NLIST = int(os.getenv("MMAP_INDEX_NLIST", "0"))
+
+# รายการเอกสารที่นำเข้า (คั่นด้วย comma) เช่น RAG_SOURCE_DOCS=Loan_Features.pdf,QA-Doc.pdf
+SOURCE_DOCS = [
+    p.strip() for p in os.getenv("RAG_SOURCE_DOCS", "Loan_Features.pdf,QA-Doc.pdf").split(",") if p.strip()
+]
+
+
+# ---------------------- Hashing ----------------------
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 ของไฟล์ (อ่านทีละ block ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id(source, page_number, text):
+    """id ของ chunk มาจากเนื้อหา ทำให้ chunk เดิมได้ id เดิมทุกครั้งที่ ingest"""
+    payload = f"{source}\x00{page_number}\x00{text}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def pipeline_config():
+    """ค่าที่ถ้าเปลี่ยนแล้วต้อง embed ใหม่ทั้งหมด"""
+    return {"embed_model": EMBED_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+            "parser": PARSER_VERSION}
+
+
+# ---------------------- Manifest ----------------------
+def manifest_path(persist_dir=PERSIST_DIR):
+    return os.path.join(persist_dir, MANIFEST_NAME)
+
+
+def load_manifest(persist_dir=PERSIST_DIR):
+    path = manifest_path(persist_dir)
+    if not os.path.exists(path):
+        return {"config": None, "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, persist_dir=PERSIST_DIR):
+    os.makedirs(persist_dir, exist_ok=True)
+    path = manifest_path(persist_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ---------------------- Parsing & Splitting ----------------------
+def iter_chunks(path, workers=None):
+    """แยกเอกสารเป็น chunks พร้อม id ที่คำนวณจากเนื้อหา yield (id, Document) ทีละหน้า (ดู doc_parsing.py)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    seen = set()
+    for page in iter_pages(path, workers=PARSE_WORKERS if workers is None else workers):
+        for chunk in splitter.split_documents([page]):
+            cid = chunk_id(path, chunk.metadata["page_number"], chunk.page_content)
+            if cid in seen:
+                # chunk ซ้ำในหน้าเดียวกัน ไม่ต้อง embed ซ้ำ
+                continue
+            seen.add(cid)
+            yield cid, chunk
+
+
+# ---------------------- Sync ----------------------
+def needs_sync(sources=None, persist_dir=PERSIST_DIR):
+    """True ถ้าเอกสาร/config เปลี่ยนไปจาก manifest (hash ไฟล์อย่างเดียว ไม่ต้องเปิด vector store)"""
+    sources = SOURCE_DOCS if sources is None else sources
+    manifest = load_manifest(persist_dir)
+    if manifest.get("config") != pipeline_config() or set(manifest["files"]) - set(sources):
+        return True
+    for path in sources:
+        if not os.path.exists(path):
+            continue
+        previous = manifest["files"].get(path)
+        if not previous or previous["file_hash"] != file_hash(path):
+            return True
+    return False
+
+
+def open_vectorstore(persist_dir=PERSIST_DIR, embedding=None):
+    """เปิด Chroma collection (import chromadb เฉพาะตอนเรียก ไม่ให้ผู้ที่ import ingest ต้องโหลดด้วย)"""
+    from langchain.vectorstores import Chroma
+
+    if embedding is None:
+        from langchain_ollama import OllamaEmbeddings
+
+        embedding = OllamaEmbeddings(model=EMBED_MODEL, base_url=OLLAMA_URL)
+    return Chroma(persist_directory=persist_dir, embedding_function=embedding)
+
+
+def add_chunks(vectorstore, chunks, batch_size=None, workers=None):
+    """embed chunks แบบ batch ขนาน แล้ว upsert เข้า Chroma collection พร้อม id"""
+    vectors, stats = embed_in_batches(
+        vectorstore.embeddings,
+        [doc.page_content for _, doc in chunks],
+        batch_size=batch_size or EMBED_BATCH_SIZE,
+        workers=workers or EMBED_WORKERS,
+    )
+    vectorstore._collection.upsert(
+        ids=[cid for cid, _ in chunks],
+        embeddings=vectors,
+        documents=[doc.page_content for _, doc in chunks],
+        metadatas=[doc.metadata for _, doc in chunks],
+    )
+    return stats
+
+
+def sync_vectorstore(vectorstore, sources=None, persist_dir=PERSIST_DIR, rebuild=False,
+                     batch_size=None, workers=None, mmap_index=MMAP_INDEX_ENABLED):
+    """ทำให้ collection ตรงกับไฟล์เอกสารปัจจุบันแบบ incremental
+
+    - ไฟล์ที่ hash ไม่เปลี่ยนจะไม่ถูก parse ซ้ำ
+    - embed เฉพาะ chunk ใหม่/ที่เปลี่ยน และลบ chunk ที่ไม่มีแล้ว
+    - ถ้า config (model / chunk size) เปลี่ยน หรือ rebuild=True จะ embed ใหม่ทั้งหมด
+    - mmap_index=True: export memory-mapped index ใหม่เมื่อ collection เปลี่ยน
+    """
+    sources = SOURCE_DOCS if sources is None else sources
+    start = time.time()
+    manifest = load_manifest(persist_dir)
+    stats = {"parsed": 0, "skipped": 0, "missing": 0, "added": 0, "deleted": 0, "embed_seconds": 0.0}
+
+    if rebuild or manifest.get("config") != pipeline_config():
+        if manifest.get("config") is not None:
+            logging.info("⚙️ Rebuilding: re-embedding all documents")
+        manifest = {"config": pipeline_config(), "files": {}}
+
+    files = {}
+    for path in sources:
+        previous = manifest["files"].get(path)
+        if not os.path.exists(path):
+            logging.warning(f"⚠️ Source document not found: {path}")
+            stats["missing"] += 1
+            if previous:
+                files[path] = previous
+            continue
+
+        digest = file_hash(path)
+        if previous and previous["file_hash"] == digest:
+            files[path] = previous
+            stats["skipped"] += 1
+            continue
+
+        stats["parsed"] += 1
+        old_ids = set(previous["chunk_ids"]) if previous else set()
+        chunk_ids, pending, added = [], [], 0
+        for cid, doc in iter_chunks(path):
+            chunk_ids.append(cid)
+            if cid not in old_ids:
+                pending.append((cid, doc))
+            if len(pending) >= FLUSH_CHUNKS:
+                stats["embed_seconds"] += add_chunks(vectorstore, pending, batch_size, workers)["seconds"]
+                added += len(pending)
+                pending = []
+        if pending:
+            stats["embed_seconds"] += add_chunks(vectorstore, pending, batch_size, workers)["seconds"]
+            added += len(pending)
+        stats["added"] += added
+        files[path] = {"file_hash": digest, "chunk_ids": chunk_ids}
+        logging.info(f"📄 {path}: {len(chunk_ids)} chunks ({added} new)")
+
+    # ลบ chunk ที่ไม่อยู่ใน manifest ใหม่ (รวมถึง collection เดิมที่สร้างก่อนมี manifest)
+    keep = {cid for entry in files.values() for cid in entry["chunk_ids"]}
+    stale = [cid for cid in vectorstore.get(include=[])["ids"] if cid not in keep]
+    if stale:
+        vectorstore.delete(ids=stale)
+        stats["deleted"] = len(stale)
+
+    manifest["files"] = files
+    save_manifest(manifest, persist_dir)
+    # BM25 index สร้างครั้งเดียวตอน ingest และเก็บไว้ข้าง collection
+    if stats["added"] or stats["deleted"] or not os.path.exists(lexical_index_path(persist_dir)):
+        build_lexical_index(vectorstore, persist_dir)
+    fingerprint = manifest_fingerprint(persist_dir)
+    if mmap_index and read_index_fingerprint(persist_dir) != fingerprint:
+        build_mmap_index(vectorstore, persist_dir, dtype=MMAP_INDEX_DTYPE, nlist=MMAP_INDEX_NLIST,
+                         fingerprint=fingerprint)
+    if stats["embed_seconds"] > 0:
+        stats["chunks_per_sec"] = stats["added"] / stats["embed_seconds"]
+    logging.info(
+        f"✅ Ingestion done in {time.time() - start:.2f}s "
+        f"(parsed={stats['parsed']}, skipped={stats['skipped']}, added={stats['added']}, deleted={stats['deleted']}, "
+        f"{stats.get('chunks_per_sec', 0.0):.1f} chunks/sec)"
+    )
+    return stats
+
+
+def manifest_fingerprint(persist_dir=PERSIST_DIR):
+    """fingerprint ของ collection จาก manifest (ไม่ต้องอ่าน collection ทั้งหมด)"""
+    manifest = load_manifest(persist_dir)
+    ids = sorted(cid for entry in manifest["files"].values() for cid in entry["chunk_ids"])
+    payload = json.dumps({"config": manifest.get("config"), "ids": ids})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="นำเข้าเอกสารเข้า vector database แบบ incremental")
+    parser.add_argument("sources", nargs="*", help="ไฟล์เอกสาร (ค่าเริ่มต้นจาก RAG_SOURCE_DOCS)")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="embed เอกสารทั้งหมดใหม่ (แทนสคริปต์ rebuild เดิม addUser.py)")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="จำนวน batch ที่ embed พร้อมกัน")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="จำนวน chunk ต่อ batch")
+    parser.add_argument("--mmap-index", action="store_true", default=MMAP_INDEX_ENABLED,
+                        help="export memory-mapped index ด้วย (ค่าเริ่มต้นเปิดเมื่อ VECTOR_BACKEND=mmap)")
+    args = parser.parse_args()
+
+    store = open_vectorstore(args.persist_dir)
+    sync_vectorstore(store, sources=args.sources or None, persist_dir=args.persist_dir,
+                     rebuild=args.rebuild, batch_size=args.batch_size, workers=args.workers,
+                     mmap_index=args.mmap_index)
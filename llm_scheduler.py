@@ -0,0 +1,240 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# ---------------------- LLM Request Scheduler ----------------------
+# คั่นระหว่างทุก session ของ Streamlit กับ Ollama instance เดียว:
+# - จำกัดจำนวนคำขอที่ส่งไป LLM พร้อมกัน (max_concurrency ให้ตรงกับ OLLAMA_NUM_PARALLEL)
+# - คิว FIFO แยกตาม session แล้วจ่ายสิทธิ์แบบ round-robin ไม่ให้ session เดียวกินคิว
+# - timeout ระหว่างรอคิว และยกเลิกคำขอของ session ที่ปิดไปแล้ว
+# Streamlit รันแต่ละ session ใน thread ของตัวเอง จึงใช้ threading.Condition แทน event loop
+
+QUEUED, RUNNING, DONE, CANCELLED = "queued", "running", "done", "cancelled"
+
+
+class QueueTimeout(Exception):
+    """รอคิวนานเกิน queue_timeout"""
+
+
+class RequestCancelled(Exception):
+    """คำขอถูกยกเลิกระหว่างรอคิว (เช่น session ปิดไปแล้ว)"""
+
+
+class GenerationTimeout(Exception):
+    """LLM ตอบไม่จบภายใน deadline"""
+
+
+class Ticket:
+    """คำขอหนึ่งรายการในคิว"""
+
+    def __init__(self, session_id, is_active=None):
+        self.session_id = session_id
+        self.is_active = is_active
+        self.state = QUEUED
+        self.enqueued_at = time.time()
+        self.granted_at = None
+
+    @property
+    def wait_time(self):
+        end = self.granted_at if self.granted_at is not None else time.time()
+        return end - self.enqueued_at
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=2, queue_timeout=120.0, history=500):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._sessions = OrderedDict()  # session_id -> deque[Ticket] ลำดับ = ลำดับ round-robin
+        self._active = 0
+        self._waits = deque(maxlen=history)
+        self._counters = {"served": 0, "timeouts": 0, "cancelled": 0}
+
+    # ---------------------- Queue ----------------------
+    def submit(self, session_id, is_active=None):
+        """เข้าคิว คืน Ticket (อาจได้สิทธิ์ทันทีถ้ายังมีช่องว่าง)"""
+        ticket = Ticket(session_id, is_active)
+        with self._cond:
+            self._sessions.setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+        return ticket
+
+    def _next_ticket(self):
+        # session แรกใน OrderedDict ถึงคิว ได้ 1 คำขอแล้วย้ายไปท้าย (round-robin)
+        session_id, queue = next(iter(self._sessions.items()))
+        ticket = queue.popleft()
+        if queue:
+            self._sessions.move_to_end(session_id)
+        else:
+            del self._sessions[session_id]
+        return ticket
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._sessions:
+            ticket = self._next_ticket()
+            if ticket.is_active is not None and not ticket.is_active():
+                # ผู้ใช้ปิดหน้าไปแล้ว ไม่ต้องส่งไป LLM
+                ticket.state = CANCELLED
+                self._counters["cancelled"] += 1
+                continue
+            ticket.state = RUNNING
+            ticket.granted_at = time.time()
+            self._active += 1
+            self._waits.append(ticket.wait_time)
+        self._cond.notify_all()
+
+    def wait(self, ticket, timeout=None):
+        """รอจนได้สิทธิ์ไม่เกิน timeout วินาที คืน True เมื่อได้สิทธิ์แล้ว"""
+        with self._cond:
+            self._cond.wait_for(lambda: ticket.state != QUEUED, timeout)
+            return ticket.state == RUNNING
+
+    def position(self, ticket):
+        """ลำดับในคิว (1 = คิวถัดไป) หรือ 0 ถ้าได้สิทธิ์/ออกจากคิวแล้ว"""
+        with self._cond:
+            if ticket.state != QUEUED:
+                return 0
+            order = list(self._sessions)
+            own_index = order.index(ticket.session_id)
+            depth = self._sessions[ticket.session_id].index(ticket)
+            ahead = depth
+            for i, session_id in enumerate(order):
+                if session_id != ticket.session_id:
+                    # round-robin: session ที่อยู่ก่อนได้ depth + 1 คำขอ ที่อยู่หลังได้ depth คำขอก่อนเรา
+                    ahead += min(len(self._sessions[session_id]), depth + (1 if i < own_index else 0))
+            return ahead + 1
+
+    def cancel(self, ticket, reason="cancelled"):
+        """ยกเลิกคำขอ (ออกจากคิว หรือคืนสิทธิ์ถ้ากำลังรันอยู่) reason คือ counter ที่นับ"""
+        with self._cond:
+            if ticket.state == QUEUED:
+                queue = self._sessions.get(ticket.session_id)
+                if queue is not None:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._sessions[ticket.session_id]
+                ticket.state = CANCELLED
+                self._counters[reason] += 1
+                self._cond.notify_all()
+            elif ticket.state == RUNNING:
+                self._finish(ticket, CANCELLED, reason)
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.state == RUNNING:
+                self._finish(ticket, DONE, "served")
+
+    def _finish(self, ticket, state, counter):
+        ticket.state = state
+        self._active -= 1
+        self._counters[counter] += 1
+        self._dispatch()
+
+    def acquire(self, session_id, is_active=None, timeout=None, on_wait=None, poll=0.5):
+        """เข้าคิวแล้วรอจนได้สิทธิ์ เรียก on_wait(position, waited) ทุก poll วินาทีระหว่างรอ
+
+        ถ้ารอเกิน timeout (ค่าเริ่มต้น queue_timeout) จะยกเลิกคำขอแล้ว raise QueueTimeout
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = self.submit(session_id, is_active)
+        try:
+            while not self.wait(ticket, poll):
+                if ticket.state == CANCELLED:
+                    raise RequestCancelled("request cancelled while queued")
+                if ticket.wait_time >= timeout:
+                    self.cancel(ticket, "timeouts")
+                    raise QueueTimeout(f"waited {ticket.wait_time:.1f}s for an LLM slot")
+                if on_wait is not None:
+                    on_wait(self.position(ticket), ticket.wait_time)
+        except BaseException:
+            # timeout หรือ script ของ session ถูกหยุด (ผู้ใช้ปิดหน้า/rerun) ระหว่างรอ
+            self.cancel(ticket)
+            raise
+        return ticket
+
+    @contextmanager
+    def slot(self, session_id, is_active=None, timeout=None):
+        ticket = self.acquire(session_id, is_active, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # ---------------------- Metrics ----------------------
+    def stats(self):
+        with self._cond:
+            waits = list(self._waits)
+            return {
+                "queue_depth": sum(len(q) for q in self._sessions.values()),
+                "sessions_waiting": len(self._sessions),
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "wait_p50": _percentile(waits, 0.50),
+                "wait_p95": _percentile(waits, 0.95),
+                **self._counters,
+            }
+
+    def log_stats(self):
+        logging.info(f"🚦 LLM scheduler: {self.stats()}")
+
+
+# ---------------------- Deadline Stream ----------------------
+class _StreamEnd:
+    def __init__(self, error=None):
+        self.error = error
+
+
+def stream_until(chunks, deadline, is_active=None, poll=0.5):
+    """yield chunk จาก iterator (เช่น llm.stream) ที่อ่านใน thread เบื้องหลัง จนกว่าจะจบหรือถึง deadline (epoch)
+
+    prefill ที่ช้าหรือ stream ที่ค้างจึงถูกตัดตรงเวลา: เลย deadline -> raise GenerationTimeout,
+    is_active() เป็น False (ผู้ใช้ปิดหน้า) -> raise RequestCancelled ตรวจทุก poll วินาทีแม้ยังไม่มี token
+    thread เบื้องหลังปิด iterator เมื่อได้ chunk ถัดไปหรือเมื่อ read timeout ของ client หมด
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        error = None
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                items.put(chunk)
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            items.put(_StreamEnd(error))
+
+    threading.Thread(target=pump, name="llm-stream", daemon=True).start()
+    try:
+        while True:
+            if is_active is not None and not is_active():
+                raise RequestCancelled("session closed during generation")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise GenerationTimeout("generation deadline passed")
+            try:
+                item = items.get(timeout=min(poll, remaining))
+            except queue.Empty:
+                continue
+            if isinstance(item, _StreamEnd):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,165 @@
+import math
+from datetime import datetime, timedelta
+
+# ---------------------- Metrics Engine ----------------------
+# percentile ของ latency, throughput และ token rate ตามช่วงเวลา (1 ชม. / 24 ชม. / 7 วัน) โดยไม่อ่าน llm_metrics
+# compaction job ใน dashboard_stats.py นับแต่ละ request ลง histogram แบบ log bucket (ช่องละ HISTOGRAM_GAMMA เท่า)
+# ทั้งราย 5 นาทีและรายชั่วโมง (RESOLUTIONS) percentile ของช่วงใด ๆ = รวม histogram ของช่วงนั้นแล้วหาช่องที่ผลสะสมถึง q
+# ค่าที่ได้คลาดจากค่าจริงไม่เกิน (GAMMA - 1) / (GAMMA + 1) (~2%) และขนาดข้อมูลที่อ่านขึ้นกับจำนวนช่วงเวลา
+# ไม่ใช่จำนวน request (ช่วง 7 วันอ่าน histogram รายชั่วโมง 168 ช่วง x จำนวนช่องที่มีค่า)
+
+HISTOGRAM_GAMMA = 1.04
+# ค่าที่ต่ำกว่านี้ (วินาที) นับรวมในช่องแรก (stage อย่าง fusion ใช้เวลาระดับ 100 µs)
+MIN_LATENCY = 0.00001
+# ความละเอียดของ rollup (นาที) ต้องหาร 60 ลงตัว
+RESOLUTIONS = (5, 60)
+HISTOGRAM_METRICS = ("response_time", "ttft")
+QUANTILES = (0.5, 0.9, 0.99)
+# span ของ tracing.py ถูกนับลง histogram เดียวกันในชื่อ metric "stage:<ชื่อ span>"
+STAGE_PREFIX = "stage:"
+STAGE_QUANTILES = (0.5, 0.95, 0.99)
+
+# ชื่อช่วงเวลา -> (ความยาว, ความละเอียดของ rollup ที่อ่าน = ระยะห่างของจุดบนกราฟ)
+WINDOWS = {
+    "1 ชั่วโมง": (timedelta(hours=1), 5),
+    "24 ชั่วโมง": (timedelta(hours=24), 60),
+    "7 วัน": (timedelta(days=7), 60),
+}
+
+_LOG_GAMMA = math.log(HISTOGRAM_GAMMA)
+
+
+def latency_bin(seconds):
+    """เลขช่องของ histogram: ช่อง b ครอบคลุม (GAMMA^(b-1), GAMMA^b]"""
+    return math.ceil(math.log(max(seconds, MIN_LATENCY)) / _LOG_GAMMA)
+
+
+def bin_value(index):
+    """ค่าตัวแทนของช่อง (ค่ากลางแบบ relative ระหว่างขอบล่างและขอบบน)"""
+    return 2 * HISTOGRAM_GAMMA ** index / (HISTOGRAM_GAMMA + 1)
+
+
+def period_of(timestamp, resolution=RESOLUTIONS[0]):
+    """'YYYY-MM-DDTHH:MM' ปัดลงทีละ resolution นาที (รับ ISO ทั้งแบบ 'T' และช่องว่าง)"""
+    minute = int(timestamp[14:16]) // resolution * resolution
+    return f"{timestamp[:10]}T{timestamp[11:13]}:{minute:02d}"
+
+
+def quantiles_from_counts(counts, quantiles=QUANTILES):
+    """counts = [(bin, count)] คืน {q: วินาที} (None เมื่อไม่มีข้อมูล)"""
+    counts = sorted(counts)
+    total = sum(count for _, count in counts)
+    if not total:
+        return {q: None for q in quantiles}
+    result, cumulative, position = {}, 0, 0
+    for q in sorted(quantiles):
+        rank = q * total
+        while position < len(counts) - 1 and cumulative + counts[position][1] < rank:
+            cumulative += counts[position][1]
+            position += 1
+        result[q] = bin_value(counts[position][0])
+    return result
+
+
+# ---------------------- Window Queries ----------------------
+def _since(window, now=None):
+    length, resolution = WINDOWS[window]
+    return period_of(((now or datetime.now()) - length).isoformat(), resolution)
+
+
+def _window_minutes(window):
+    return WINDOWS[window][0].total_seconds() / 60
+
+
+def get_window_summary(conn, window, now=None):
+    """percentile ของ response_time/ttft, requests, requests/นาที, tokens/นาที และ tokens/วินาทีขณะสร้างคำตอบ"""
+    since, resolution = _since(window, now), WINDOWS[window][1]
+    summary = {}
+    for metric in HISTOGRAM_METRICS:
+        counts = conn.execute("""
+            SELECT bin, SUM(count) FROM metrics_histogram
+            WHERE resolution = ? AND metric = ? AND period >= ?
+            GROUP BY bin
+        """, (resolution, metric, since)).fetchall()
+        summary[metric] = quantiles_from_counts(counts)
+
+    requests, prompt_tokens, response_tokens, generation_time = conn.execute("""
+        SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(prompt_tokens_sum), 0),
+               COALESCE(SUM(response_tokens_sum), 0), COALESCE(SUM(generation_time_sum), 0)
+        FROM metrics_periods
+        WHERE resolution = ? AND period >= ?
+    """, (resolution, since)).fetchone()
+    minutes = _window_minutes(window)
+    summary.update({
+        "requests": requests,
+        "requests_per_min": requests / minutes,
+        "tokens_per_min": (prompt_tokens + response_tokens) / minutes,
+        "output_tokens_per_sec": response_tokens / generation_time if generation_time else None,
+    })
+    return summary
+
+
+def get_window_series(conn, window, now=None):
+    """จุดบนกราฟของช่วงเวลา: [{"time", "p50", "p90", "p99", "requests_per_min", "tokens_per_min"}]"""
+    since, resolution = _since(window, now), WINDOWS[window][1]
+
+    histograms = {}
+    for period, index, count in conn.execute("""
+        SELECT period, bin, count FROM metrics_histogram
+        WHERE resolution = ? AND metric = 'response_time' AND period >= ?
+    """, (resolution, since)):
+        histograms.setdefault(period, []).append((index, count))
+
+    series = []
+    for period, requests, tokens in conn.execute("""
+        SELECT period, requests, prompt_tokens_sum + response_tokens_sum FROM metrics_periods
+        WHERE resolution = ? AND period >= ?
+        ORDER BY period
+    """, (resolution, since)):
+        quantiles = quantiles_from_counts(histograms.get(period, []))
+        series.append({
+            "time": period,
+            "p50": quantiles[0.5],
+            "p90": quantiles[0.9],
+            "p99": quantiles[0.99],
+            "requests_per_min": requests / resolution,
+            "tokens_per_min": tokens / resolution,
+        })
+    return series
+
+
+# ---------------------- Stage Queries ----------------------
+def _stage_bounds():
+    # ช่วงของ metric ที่ขึ้นต้นด้วย STAGE_PREFIX (ใช้ primary key ได้ ต่างจาก LIKE)
+    return STAGE_PREFIX, STAGE_PREFIX[:-1] + chr(ord(STAGE_PREFIX[-1]) + 1)
+
+
+def get_stage_summary(conn, window, now=None):
+    """{stage: {"count": จำนวน span, q: วินาที}} ของช่วงเวลา (q ตาม STAGE_QUANTILES)"""
+    since, resolution = _since(window, now), WINDOWS[window][1]
+    histograms = {}
+    for metric, index, count in conn.execute("""
+        SELECT metric, bin, SUM(count) FROM metrics_histogram
+        WHERE resolution = ? AND metric >= ? AND metric < ? AND period >= ?
+        GROUP BY metric, bin
+    """, (resolution, *_stage_bounds(), since)):
+        histograms.setdefault(metric[len(STAGE_PREFIX):], []).append((index, count))
+    return {
+        stage: {"count": sum(count for _, count in counts), **quantiles_from_counts(counts, STAGE_QUANTILES)}
+        for stage, counts in histograms.items()
+    }
+
+
+def get_stage_series(conn, window, quantile=0.95, now=None):
+    """[(period, stage, วินาที)] ของ quantile ราย stage ต่อช่วง (ระยะห่างตามความละเอียดของ window)"""
+    since, resolution = _since(window, now), WINDOWS[window][1]
+    histograms = {}
+    for metric, period, index, count in conn.execute("""
+        SELECT metric, period, bin, count FROM metrics_histogram
+        WHERE resolution = ? AND metric >= ? AND metric < ? AND period >= ?
+    """, (resolution, *_stage_bounds(), since)):
+        histograms.setdefault((period, metric[len(STAGE_PREFIX):]), []).append((index, count))
+    return sorted(
+        (period, stage, quantiles_from_counts(counts, (quantile,))[quantile])
+        for (period, stage), counts in histograms.items()
+    )
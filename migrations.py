@@ -0,0 +1,368 @@
+import argparse
+import logging
+import sqlite3
+
+# ---------------------- Schema Migrations ----------------------
+# เวอร์ชันของ schema เก็บใน PRAGMA user_version ของ questions.db
+# แต่ละ migration รันครั้งเดียวใน transaction ของตัวเอง และเขียนให้รันซ้ำได้ (idempotent)
+# เพิ่ม migration ใหม่ต่อท้าย MIGRATIONS เสมอ ห้ามแก้ลำดับของที่มีอยู่แล้ว
+
+DB_PATH = "questions.db"
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_columns(conn, table, columns):
+    existing = _columns(conn, table)
+    for name, col_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+
+def m001_base_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS retrieved_chunks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message_id INTEGER NOT NULL,
+            chunk_text TEXT NOT NULL,
+            source TEXT,
+            page_number INTEGER,
+            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message_id INTEGER NOT NULL,
+            prompt_tokens INTEGER,
+            response_tokens INTEGER,
+            response_time REAL,
+            timestamp TEXT NOT NULL,
+            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message_id INTEGER,
+            satisfaction TEXT NOT NULL,
+            feedback_text TEXT,
+            timestamp TEXT NOT NULL,
+            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
+        )
+    """)
+
+
+def m002_llm_metrics_columns(conn):
+    # คอลัมน์ที่เพิ่มมาภายหลัง (streaming, answer cache, hybrid retrieval)
+    _add_columns(conn, "llm_metrics", {
+        "ttft": "REAL",
+        "total_time": "REAL",
+        "cache_hit": "INTEGER DEFAULT 0",
+        "latency_saved": "REAL",
+        "dense_time": "REAL",
+        "lexical_time": "REAL",
+    })
+
+
+def m003_drop_feedback_rating(conn):
+    # แทนสคริปต์ newtable.py เดิม: สร้างตาราง feedback ใหม่โดยไม่มีคอลัมน์ rating
+    if "rating" not in _columns(conn, "feedback"):
+        return
+    conn.execute("""
+        CREATE TABLE feedback_temp (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message_id INTEGER,
+            satisfaction TEXT,
+            feedback_text TEXT,
+            timestamp TEXT
+        )
+    """)
+    conn.execute("""
+        INSERT INTO feedback_temp (id, user_message_id, satisfaction, feedback_text, timestamp)
+        SELECT id, user_message_id, satisfaction, feedback_text, timestamp
+        FROM feedback
+    """)
+    conn.execute("DROP TABLE feedback")
+    conn.execute("ALTER TABLE feedback_temp RENAME TO feedback")
+
+
+def m004_dashboard_indexes(conn):
+    # index สำหรับ join ด้วย user_message_id, เรียงตามเวลา และกรองตาม satisfaction
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_messages_timestamp ON user_messages(timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_retrieved_chunks_message ON retrieved_chunks(user_message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_metrics_message ON llm_metrics(user_message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_metrics_timestamp ON llm_metrics(timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_message ON feedback(user_message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_satisfaction ON feedback(satisfaction)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback(timestamp)")
+
+
+def m005_rollup_tables(conn):
+    # ตาราง rollup รายชั่วโมงและ watermark ของ dashboard_stats.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_hourly (
+            bucket TEXT PRIMARY KEY,            -- 'YYYY-MM-DDTHH'
+            messages INTEGER DEFAULT 0,
+            chunks INTEGER DEFAULT 0,
+            metrics_count INTEGER DEFAULT 0,
+            response_time_sum REAL DEFAULT 0,
+            response_time_min REAL,
+            response_time_max REAL,
+            prompt_tokens_sum INTEGER DEFAULT 0,
+            response_tokens_sum INTEGER DEFAULT 0,
+            ttft_sum REAL DEFAULT 0,
+            ttft_count INTEGER DEFAULT 0,
+            cache_hits INTEGER DEFAULT 0,
+            latency_saved_sum REAL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS feedback_hourly (
+            bucket TEXT NOT NULL,
+            satisfaction TEXT NOT NULL,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (bucket, satisfaction)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS question_counts (
+            normalized TEXT PRIMARY KEY,
+            count INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_question_counts_count ON question_counts(count)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS stats_daily AS
+            SELECT substr(bucket, 1, 10) AS day,
+                   SUM(messages) AS messages,
+                   SUM(chunks) AS chunks,
+                   SUM(metrics_count) AS metrics_count,
+                   SUM(response_time_sum) AS response_time_sum,
+                   MIN(response_time_min) AS response_time_min,
+                   MAX(response_time_max) AS response_time_max,
+                   SUM(prompt_tokens_sum) AS prompt_tokens_sum,
+                   SUM(response_tokens_sum) AS response_tokens_sum
+            FROM stats_hourly
+            GROUP BY day
+    """)
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def create_search_index(conn):
+    """สร้าง index ค้นหาข้อความ (รันซ้ำได้) คืน False ถ้า SQLite ไม่มี FTS5 หรือ trigram
+
+    FTS5 (trigram รองรับภาษาไทยที่ไม่มีการเว้นวรรค) แบบ external content ชี้ไปที่ user_messages
+    trigger ทำให้ index ตรงกับตารางเสมอ ไม่ต้องซิงก์เอง
+    """
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS user_messages_fts USING fts5(
+                user_message, answer,
+                content='user_messages', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite ที่ไม่มี FTS5 หรือเก่ากว่า 3.34 (ไม่มี trigram): การค้นหาใช้ LIKE แทน
+        logging.warning(f"⚠️ Full-text search index unavailable: {e}")
+        return False
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_messages_fts_insert AFTER INSERT ON user_messages BEGIN
+            INSERT INTO user_messages_fts (rowid, user_message, answer)
+            VALUES (new.id, new.user_message, new.answer);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_messages_fts_delete AFTER DELETE ON user_messages BEGIN
+            INSERT INTO user_messages_fts (user_messages_fts, rowid, user_message, answer)
+            VALUES ('delete', old.id, old.user_message, old.answer);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_messages_fts_update AFTER UPDATE ON user_messages BEGIN
+            INSERT INTO user_messages_fts (user_messages_fts, rowid, user_message, answer)
+            VALUES ('delete', old.id, old.user_message, old.answer);
+            INSERT INTO user_messages_fts (rowid, user_message, answer)
+            VALUES (new.id, new.user_message, new.answer);
+        END
+    """)
+    conn.execute("INSERT INTO user_messages_fts (user_messages_fts) VALUES ('rebuild')")
+    return True
+
+
+def m006_message_search_index(conn):
+    # ถ้า SQLite ไม่รองรับ เวอร์ชันยังเลื่อนเป็น 6 แต่ _ensure_search_index ลองสร้างใหม่ทุกครั้งที่ migrate
+    create_search_index(conn)
+
+
+def m007_question_clusters(conn):
+    # ดู question_clusters.py: เก็บ vector ของคำถาม (หลัง normalize_text) ครั้งเดียว และ centroid ของแต่ละกลุ่ม
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS question_clusters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            centroid BLOB NOT NULL,
+            members INTEGER DEFAULT 0,          -- จำนวนคำถามที่ไม่ซ้ำกันในกลุ่ม
+            size INTEGER DEFAULT 0,             -- จำนวนครั้งที่ถูกถามทั้งหมด
+            representative TEXT,
+            updated_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_question_clusters_size ON question_clusters(size)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS question_embeddings (
+            normalized TEXT PRIMARY KEY,
+            vector BLOB NOT NULL,
+            cluster_id INTEGER,
+            count INTEGER DEFAULT 0,
+            FOREIGN KEY(cluster_id) REFERENCES question_clusters(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_question_embeddings_cluster ON question_embeddings(cluster_id, count)")
+
+
+def m008_llm_metrics_queue_wait(conn):
+    # เวลาที่คำขอรอคิวของ LLM scheduler ก่อนได้เรียก Ollama
+    _add_columns(conn, "llm_metrics", {"queue_wait": "REAL"})
+
+
+def m009_llm_metrics_rerank_time(conn):
+    # เวลาของ cross-encoder rerank (NULL เมื่อข้ามหรือปิด rerank)
+    _add_columns(conn, "llm_metrics", {"rerank_time": "REAL"})
+
+
+def m010_trace_spans(conn):
+    # span ของแต่ละ stage ต่อคำถาม (tracing.py) เวลาเริ่มเป็น ISO ให้ query ตามช่วงเวลาแบบเดียวกับ llm_metrics
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS trace_spans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trace_id TEXT NOT NULL,
+            user_message_id INTEGER,
+            name TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            duration REAL NOT NULL,
+            attributes TEXT,
+            FOREIGN KEY(user_message_id) REFERENCES user_messages(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_spans_message ON trace_spans(user_message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_spans_start ON trace_spans(start_time)")
+
+
+def m011_metrics_histograms(conn):
+    # histogram แบบ log bucket ของ latency และผลรวมต่อช่วง ราย 5 นาทีและรายชั่วโมง (ดู metrics_engine.py)
+    # ข้อมูลย้อนหลังถูกเติมตอน refresh_rollups ครั้งแรก
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_histogram (
+            resolution INTEGER NOT NULL,        -- ความยาวช่วง (นาที)
+            metric TEXT NOT NULL,
+            period TEXT NOT NULL,               -- 'YYYY-MM-DDTHH:MM' (ปัดลงทีละ resolution นาที)
+            bin INTEGER NOT NULL,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (resolution, metric, period, bin)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_periods (
+            resolution INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            requests INTEGER DEFAULT 0,
+            prompt_tokens_sum INTEGER DEFAULT 0,
+            response_tokens_sum INTEGER DEFAULT 0,
+            generation_time_sum REAL DEFAULT 0,
+            PRIMARY KEY (resolution, period)
+        ) WITHOUT ROWID
+    """)
+
+
+def m012_question_embeddings_original(conn):
+    # ข้อความที่ผู้ใช้พิมพ์จริง (ครั้งแรกที่เห็น) ของแต่ละคำถามหลัง normalize_text ใช้เป็นตัวแทนกลุ่มบน dashboard
+    # แถวเดิมยังเป็น NULL จนกว่าคำถามเดียวกันจะถูกถามอีกครั้ง (question_clusters.py เติมให้)
+    _add_columns(conn, "question_embeddings", {"original": "TEXT"})
+
+
+MIGRATIONS = [
+    (1, "base schema", m001_base_schema),
+    (2, "llm_metrics columns", m002_llm_metrics_columns),
+    (3, "drop feedback.rating", m003_drop_feedback_rating),
+    (4, "dashboard indexes", m004_dashboard_indexes),
+    (5, "dashboard rollup tables", m005_rollup_tables),
+    (6, "message search index", m006_message_search_index),
+    (7, "question clusters", m007_question_clusters),
+    (8, "llm_metrics.queue_wait", m008_llm_metrics_queue_wait),
+    (9, "llm_metrics.rerank_time", m009_llm_metrics_rerank_time),
+    (10, "trace spans", m010_trace_spans),
+    (11, "metrics histograms", m011_metrics_histograms),
+    (12, "question_embeddings.original", m012_question_embeddings_original),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _ensure_search_index(conn):
+    # index ที่ m006 สร้างไม่ได้ (SQLite ไม่รองรับ) ถูกสร้างเมื่อ SQLite รองรับแล้ว เช่นหลังอัปเกรด
+    if schema_version(conn) < 6 or _has_table(conn, "user_messages_fts"):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        created = not _has_table(conn, "user_messages_fts") and create_search_index(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if created:
+        logging.info("🛠️ Created message search index skipped by migration 006")
+
+
+def run_migrations(db_path=DB_PATH):
+    """รัน migration ที่ยังไม่ได้รันตามลำดับ คืนเวอร์ชันล่าสุดของ schema"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        for version, description, migrate in MIGRATIONS:
+            if schema_version(conn) >= version:
+                continue
+            # BEGIN IMMEDIATE กันหลาย process migrate พร้อมกัน แล้วตรวจเวอร์ชันซ้ำหลังได้ lock
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logging.info(f"🛠️ Applied migration {version:03d}: {description}")
+        _ensure_search_index(conn)
+        return schema_version(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="อัปเดต schema ของ questions.db")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    print(f"schema version: {run_migrations(args.db)}")
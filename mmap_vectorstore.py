@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import time
+from typing import Any, List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# ---------------------- Memory-mapped Vector Store ----------------------
+# backend ทางเลือกแทน Chroma สำหรับ corpus ขนาดเล็ก-กลาง: เก็บ embedding ทั้งหมดเป็น matrix ต่อเนื่อง
+# (float16 หรือ int8 + scale ต่อแถว) ในไฟล์ .npy ที่เปิดด้วย mmap ทุก Streamlit process จึงใช้หน้าเดียวกัน
+# ใน page cache ของ OS ข้อความ/metadata อยู่ในไฟล์ JSON ข้างกัน ค้นหาแบบ brute-force (vectorized)
+# หรือ IVF (k-means แล้วค้นเฉพาะ nprobe กลุ่มที่ใกล้ที่สุด) ด้วย cosine similarity
+#
+# Chroma ยังเป็นที่เก็บหลักตอน ingest; index นี้ export จาก collection เมื่อ collection เปลี่ยน
+
+MMAP_INDEX_DIR = "mmap_index"
+META_NAME = "meta.json"
+SEARCH_BLOCK_ROWS = 8192
+
+
+def mmap_index_dir(persist_dir):
+    return os.path.join(persist_dir, MMAP_INDEX_DIR)
+
+
+# ---------------------- Quantization ----------------------
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors, dtype):
+    """คืน (matrix, scales) โดย scales เป็น None สำหรับ float16 และเป็น scale ต่อแถวสำหรับ int8"""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        matrix = np.clip(np.round(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return matrix, scales.astype(np.float32)
+    raise ValueError(f"unsupported dtype: {dtype}")
+
+
+def _kmeans(vectors, nlist, iterations=10, seed=0):
+    """spherical k-means อย่างง่าย คืน (centroids, assignment)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _unit_rows(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+# ---------------------- Build ----------------------
+def write_mmap_index(index_dir, ids, texts, metadatas, embeddings, dtype="float16", nlist=0, fingerprint=None):
+    """เขียน index ลง index_dir (แทนที่ของเดิมแบบ atomic ผ่าน meta.json)"""
+    os.makedirs(index_dir, exist_ok=True)
+    vectors = _unit_rows(embeddings) if len(embeddings) else np.zeros((0, 0), dtype=np.float32)
+    order = np.arange(len(vectors))
+    ivf = None
+    if nlist and len(vectors) > nlist:
+        centroids, assignment = _kmeans(vectors, nlist)
+        # เรียงแถวตามกลุ่ม ให้แต่ละกลุ่มเป็นช่วงต่อเนื่องใน matrix (อ่าน mmap เป็นก้อน)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        ivf = (centroids.astype(np.float32), offsets.astype(np.int64))
+    matrix, scales = quantize(vectors[order], dtype)
+
+    # ชื่อไฟล์ข้อมูลมี version ของตัวเอง process ที่ mmap ไฟล์เก่าอยู่จึงอ่านต่อได้จนกว่าจะเปิดใหม่
+    version = f"{int(time.time() * 1000)}"
+    files = {"vectors": f"vectors-{version}.npy"}
+    np.save(os.path.join(index_dir, files["vectors"]), matrix)
+    if scales is not None:
+        files["scales"] = f"scales-{version}.npy"
+        np.save(os.path.join(index_dir, files["scales"]), scales)
+    if ivf is not None:
+        files["centroids"] = f"centroids-{version}.npy"
+        files["offsets"] = f"offsets-{version}.npy"
+        np.save(os.path.join(index_dir, files["centroids"]), ivf[0])
+        np.save(os.path.join(index_dir, files["offsets"]), ivf[1])
+
+    meta = {
+        "dtype": dtype,
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": int(len(matrix)),
+        "fingerprint": fingerprint,
+        "files": files,
+        "ids": [ids[i] for i in order],
+        "texts": [texts[i] for i in order],
+        "metadatas": [metadatas[i] or {} for i in order],
+    }
+    meta_path = os.path.join(index_dir, META_NAME)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # ลบไฟล์ข้อมูลของ version ก่อนหน้า
+    current = set(files.values()) | {META_NAME}
+    for name in os.listdir(index_dir):
+        if name.endswith(".npy") and name not in current:
+            os.remove(os.path.join(index_dir, name))
+    return index_dir
+
+
+def build_mmap_index(vectorstore, persist_dir, dtype="float16", nlist=0, fingerprint=None):
+    """export embeddings จาก Chroma collection ไปเป็น memory-mapped index"""
+    start = time.time()
+    data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+    index_dir = write_mmap_index(
+        mmap_index_dir(persist_dir), data["ids"], data["documents"], data["metadatas"],
+        np.asarray(data["embeddings"], dtype=np.float32), dtype=dtype, nlist=nlist, fingerprint=fingerprint,
+    )
+    logging.info(f"🧮 Built {dtype} mmap index over {len(data['ids'])} chunks in {time.time() - start:.2f}s")
+    return index_dir
+
+
+def read_index_fingerprint(persist_dir):
+    path = os.path.join(mmap_index_dir(persist_dir), META_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("fingerprint")
+
+
+# ---------------------- Search ----------------------
+class MmapVectorStore:
+    """อ่าน index แบบ memory-mapped มี similarity_search / as_retriever เหมือน vector store ของ LangChain"""
+
+    def __init__(self, index_dir, embedding=None, nprobe=4):
+        self.index_dir = index_dir
+        self.embedding = embedding
+        self.nprobe = nprobe
+        with open(os.path.join(index_dir, META_NAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dtype = meta["dtype"]
+        self.fingerprint = meta.get("fingerprint")
+        self.ids = meta["ids"]
+        self.texts = meta["texts"]
+        self.metadatas = meta["metadatas"]
+        files = meta["files"]
+        self.matrix = np.load(os.path.join(index_dir, files["vectors"]), mmap_mode="r")
+        self.scales = np.load(os.path.join(index_dir, files["scales"])) if "scales" in files else None
+        self.centroids = np.load(os.path.join(index_dir, files["centroids"])) if "centroids" in files else None
+        self.offsets = np.load(os.path.join(index_dir, files["offsets"])) if "offsets" in files else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def embeddings(self):
+        # ชื่อเดียวกับ VectorStore.embeddings ของ LangChain (HybridRetriever embed คำถามเองผ่าน property นี้)
+        return self.embedding
+
+    def _score_rows(self, start, end, query):
+        scores = np.empty(end - start, dtype=np.float32)
+        for lo in range(start, end, SEARCH_BLOCK_ROWS):
+            hi = min(lo + SEARCH_BLOCK_ROWS, end)
+            block = self.matrix[lo:hi].astype(np.float32) @ query
+            if self.scales is not None:
+                block *= self.scales[lo:hi]
+            scores[lo - start:hi - start] = block
+        return scores
+
+    def search_vectors(self, query_vector, k=4):
+        """คืน (indices, scores) ของ k แถวที่ cosine similarity สูงสุด"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if not len(self.ids):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        if self.centroids is None:
+            ranges = [(0, len(self.ids))]
+        else:
+            probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            ranges = [(int(self.offsets[c]), int(self.offsets[c + 1])) for c in probe]
+        candidates = np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+        scores = np.concatenate([self._score_rows(lo, hi, query) for lo, hi in ranges])
+        k = min(k, len(scores))
+        if k == 0:
+            # กลุ่ม IVF ที่ probe ว่างทั้งหมด
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def _document(self, i):
+        return Document(page_content=self.texts[i], metadata=dict(self.metadatas[i]))
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        indices, _ = self.search_vectors(embedding, k)
+        return [self._document(i) for i in indices]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        indices, scores = self.search_vectors(self.embedding.embed_query(query), k)
+        return [(self._document(i), float(s)) for i, s in zip(indices, scores)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def get(self, include=None, **kwargs):
+        # รูปแบบเดียวกับ Chroma.get สำหรับ build_lexical_index
+        return {"ids": list(self.ids), "documents": list(self.texts), "metadatas": list(self.metadatas)}
+
+    def as_retriever(self, search_kwargs=None):
+        return MmapRetriever(vectorstore=self, k=(search_kwargs or {}).get("k", 4))
+
+
+class MmapRetriever(BaseRetriever):
+    """retriever ของ MmapVectorStore ใช้กับ RetrievalQA / HybridRetriever ได้เหมือน Chroma retriever"""
+
+    vectorstore: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.vectorstore.similarity_search(query, k=self.k)
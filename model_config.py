@@ -0,0 +1,6 @@
+# ---------------------- Model Config ----------------------
+# ชื่อโมเดลบน Ollama ที่ทุกส่วนใช้ร่วมกัน (ingest, rag_pipeline, warmup, question_clusters)
+# แยกเป็น module ของตัวเองเพื่อไม่ให้ module เหล่านั้นต้อง import กันเองเพียงเพื่อชื่อโมเดล
+
+LLM_MODEL = "llama3.2:latest"
+EMBED_MODEL = "bge-m3"
@@ -0,0 +1,293 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from stage_timings import add_timing
+from text_utils import normalize_query
+
+# ---------------------- Micro-batched Query Embedding ----------------------
+# ช่วงคนใช้เยอะ หลาย session ขอ embed คำถามพร้อมกัน แต่ละคำถามเสีย round trip ไป Ollama ของตัวเอง
+# MicroBatchEmbeddings รวมคำขอ embed_query ที่มาถึงภายใน window สั้น ๆ (เช่น 15 ms) เป็น
+# embed_documents ครั้งเดียว แล้วกระจายผลกลับให้แต่ละผู้เรียก ใช้แทน OllamaEmbeddings ใน Chroma ได้เลย
+
+DEFAULT_WINDOW_MS = 15
+DEFAULT_MAX_BATCH = 32
+# ขอบบนของช่อง histogram ขนาด batch
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _bucket(size):
+    for upper in HISTOGRAM_BUCKETS:
+        if size <= upper:
+            return upper
+    return HISTOGRAM_BUCKETS[-1] + 1
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """ห่อ Embeddings เดิม: embed_query ถูกรวมเป็น batch, embed_documents ส่งผ่านตรง (ใช้ตอน ingest)"""
+
+    def __init__(self, base, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH, log_every=100):
+        self.base = base
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.log_every = log_every
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._histogram = Counter()
+        self._batches = 0
+        self._requests = 0
+        self._worker = threading.Thread(target=self._run, name="query-embed-batcher", daemon=True)
+        self._worker.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    # ---------------------- Batching Worker ----------------------
+    def _collect(self):
+        # รอคำขอแรก แล้วเก็บคำขอที่ตามมาจนครบ window หรือเต็ม max_batch
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.base.embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            self._record(len(batch))
+
+    # ---------------------- Metrics ----------------------
+    def _record(self, size):
+        with self._lock:
+            self._histogram[_bucket(size)] += 1
+            self._batches += 1
+            self._requests += size
+            should_log = self.log_every and self._batches % self.log_every == 0
+        if should_log:
+            logging.info(f"📦 Query embedding batches: {self.stats()}")
+
+    def stats(self):
+        """จำนวน batch/คำขอ และ histogram ขนาด batch {ขอบบนของช่อง: จำนวน batch}"""
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "histogram": {
+                    **{f"<={upper}": self._histogram.get(upper, 0) for upper in HISTOGRAM_BUCKETS},
+                    f">{HISTOGRAM_BUCKETS[-1]}": self._histogram.get(HISTOGRAM_BUCKETS[-1] + 1, 0),
+                },
+            }
+
+
+# ---------------------- Query Embedding Cache ----------------------
+# คำถามเดิม/ต่างกันแค่คำลงท้าย ("ครับ", "?", ช่องว่าง) ไม่ต้องเรียก bge-m3 ซ้ำ
+# ชั้นที่ 1: LRU ใน process, ชั้นที่ 2 (ถ้ากำหนด db_path): SQLite ที่อยู่รอดข้ามการ restart
+# key = (model, normalize_query(text)) และ embed ข้อความที่ normalize แล้ว ให้ vector ของ key เดียวกันตรงกันเสมอ
+
+DEFAULT_CACHE_SIZE = 2048
+DEFAULT_DISK_MAX_ENTRIES = 50000
+# ตรวจขนาดแคชบนดิสก์ทุก ๆ กี่รายการที่เขียน (และตอนเปิด) แทนการ trim ทุกครั้ง
+DISK_TRIM_EVERY = 256
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """ห่อ Embeddings (เช่น MicroBatchEmbeddings) ด้วยแคชของ embed_query"""
+
+    def __init__(self, base, model_name, max_entries=DEFAULT_CACHE_SIZE, db_path=None,
+                 disk_max_entries=DEFAULT_DISK_MAX_ENTRIES, log_every=200):
+        self.base = base
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        self.db_path = db_path
+        self.disk_max_entries = disk_max_entries
+        self.log_every = log_every
+        self._lock = threading.Lock()
+        # lock ของ SQLite แยกจาก LRU: hit ในหน่วยความจำไม่ต้องรอ I/O ของดิสก์
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        self._lru = OrderedDict()      # key -> np.float32 vector
+        self._inflight = {}            # key -> Future (คำถามเดียวกันที่กำลัง embed อยู่)
+        self._bytes = 0
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self._conn = self._open_disk_tier() if db_path else None
+
+    # ---------------------- Disk Tier ----------------------
+    def _open_disk_tier(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, normalized)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_created ON query_embeddings(created_at)")
+        self._trim_disk(conn)
+        conn.commit()
+        return conn
+
+    def _trim_disk(self, conn):
+        # จำกัดขนาด: ลบรายการเก่าที่สุดส่วนที่เกิน disk_max_entries (อ่านผ่าน index ของ created_at)
+        excess = conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] - self.disk_max_entries
+        if excess > 0:
+            conn.execute("""
+                DELETE FROM query_embeddings WHERE rowid IN (
+                    SELECT rowid FROM query_embeddings ORDER BY created_at LIMIT ?
+                )
+            """, (excess,))
+
+    def _disk_get(self, key):
+        if self._conn is None:
+            return None
+        with self._disk_lock:
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND normalized = ?", (self.model_name, key)
+            ).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def _disk_put(self, key, vector):
+        if self._conn is None:
+            return
+        with self._disk_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, normalized, vector, created_at) VALUES (?, ?, ?, ?)",
+                (self.model_name, key, vector.tobytes(), time.time())
+            )
+            self._disk_writes += 1
+            if self._disk_writes % DISK_TRIM_EVERY == 0:
+                self._trim_disk(self._conn)
+            self._conn.commit()
+
+    # ---------------------- Memory Tier ----------------------
+    def _remember(self, key, vector):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return
+            self._lru[key] = vector
+            self._bytes += vector.nbytes + len(key.encode("utf-8"))
+            while len(self._lru) > self.max_entries:
+                old_key, old_vector = self._lru.popitem(last=False)
+                self._bytes -= old_vector.nbytes + len(old_key.encode("utf-8"))
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+            lookups = sum(self._counters.values())
+        if self.log_every and lookups % self.log_every == 0:
+            logging.info(f"🗃️ Query embedding cache: {self.stats()}")
+
+    # ---------------------- Embeddings Interface ----------------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text) or text
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+            else:
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = self._inflight[key] = Future()
+        if vector is not None:
+            self._count("hits")
+            return vector.tolist()
+        if not owner:
+            # อีก thread กำลัง embed คำถามเดียวกันอยู่ รอใช้ผลเดียวกัน
+            self._count("hits")
+            return future.result().tolist()
+
+        try:
+            vector = self._disk_get(key)
+            embedded = vector is None
+            if embedded:
+                vector = np.asarray(self.base.embed_query(key), dtype=np.float32)
+                self._count("misses")
+            else:
+                self._count("disk_hits")
+            self._remember(key, vector)
+            future.set_result(vector)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        # เขียนลงดิสก์หลังส่งผลให้ thread ที่รอคำถามเดียวกันแล้ว
+        if embedded:
+            self._disk_put(key, vector)
+        return vector.tolist()
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self._counters.values())
+            hits = self._counters["hits"] + self._counters["disk_hits"]
+            stats = {
+                **self._counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._lru),
+                "memory_bytes": self._bytes,
+            }
+        if self._conn is not None:
+            with self._disk_lock:
+                entries, disk_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector) + LENGTH(normalized)), 0) FROM query_embeddings "
+                    "WHERE model = ?", (self.model_name,)
+                ).fetchone()
+            stats.update({"disk_entries": entries, "disk_bytes": disk_bytes})
+        return stats
+
+
+# ---------------------- Embed Timing ----------------------
+# ชั้นนอกสุดของ query embedder: บันทึกเวลา embed คำถาม (รวมแคช/batch window) เป็น stage "embed"
+# ให้ tracing.py แยก span ของการ embed ออกจากการค้น index
+
+class TimedEmbeddings(Embeddings):
+    def __init__(self, base):
+        self.base = base
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        start = time.perf_counter()
+        try:
+            return self.base.embed_query(text)
+        finally:
+            add_timing("embed", time.perf_counter() - start)
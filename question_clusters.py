@@ -0,0 +1,263 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+from batch_embed import embed_in_batches
+from text_utils import normalize_text
+
+# ---------------------- Question Clustering ----------------------
+# จัดกลุ่มคำถามที่ความหมายเดียวกัน (เช่น "กู้ กยศ ต้องมีคุณสมบัติอะไร" กับ "คุณสมบัติผู้กู้ กยศ มีอะไรบ้าง")
+# แบบ incremental: คำถามใหม่หลัง watermark ถูก normalize แล้ว embed ครั้งเดียว (เก็บ vector ไว้ใน
+# question_embeddings) จากนั้นเข้ากลุ่มที่ centroid ใกล้ที่สุด หรือเปิดกลุ่มใหม่ถ้าไม่ถึง threshold
+# การจัดกลุ่มรันนอกหน้า dashboard (`python question_clusters.py` หรือ --interval ให้รันต่อเนื่อง)
+# dashboard อ่านแค่ตาราง question_clusters (ตารางสร้างใน migrations.py)
+
+DB_PATH = "questions.db"
+WATERMARK_SOURCE = "question_clusters"
+CLUSTER_THRESHOLD = float(os.getenv("QUESTION_CLUSTER_THRESHOLD", "0.85"))
+MAX_ROWS_PER_REFRESH = 500
+
+
+def default_embeddings():
+    # ใช้ model เดียวกับ vector store (bge-m3) โหลดเมื่อเรียกใช้จริงเท่านั้น
+    from langchain_ollama import OllamaEmbeddings
+    from ingest import OLLAMA_URL
+    from model_config import EMBED_MODEL
+    return OllamaEmbeddings(model=EMBED_MODEL, base_url=OLLAMA_URL)
+
+
+def _unit(vector):
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class _Centroids:
+    """centroid ของทุกกลุ่มใน memory ระหว่างประมวลผล (normalize แล้ว ใช้ dot product เป็น cosine)"""
+
+    def __init__(self, conn):
+        rows = conn.execute("SELECT id, centroid, members FROM question_clusters ORDER BY id").fetchall()
+        self.ids = [row[0] for row in rows]
+        self.members = [row[2] for row in rows]
+        self.matrix = (np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                       if rows else None)
+
+    def nearest(self, vector):
+        if self.matrix is None:
+            return None, 0.0
+        sims = self.matrix @ vector
+        best = int(np.argmax(sims))
+        return best, float(sims[best])
+
+    def add_member(self, index, vector):
+        # running mean ของสมาชิกที่ไม่ซ้ำกัน แล้ว normalize ใหม่
+        n = self.members[index]
+        self.matrix[index] = _unit(self.matrix[index] * n + vector)
+        self.members[index] = n + 1
+
+    def append(self, cluster_id, vector):
+        self.ids.append(cluster_id)
+        self.members.append(1)
+        row = vector[np.newaxis, :]
+        self.matrix = row.copy() if self.matrix is None else np.vstack([self.matrix, row])
+
+
+def _assign(conn, centroids, representative, vector, count, threshold, now):
+    """ใส่คำถามใหม่ (ที่ยังไม่เคยเห็น) เข้ากลุ่มที่ใกล้ที่สุด คืน cluster id (representative ใช้เมื่อเปิดกลุ่มใหม่)"""
+    index, similarity = centroids.nearest(vector)
+    if index is not None and similarity >= threshold:
+        centroids.add_member(index, vector)
+        cluster_id = centroids.ids[index]
+        conn.execute(
+            "UPDATE question_clusters SET centroid = ?, members = ?, size = size + ?, updated_at = ? WHERE id = ?",
+            (centroids.matrix[index].tobytes(), centroids.members[index], count, now, cluster_id)
+        )
+    else:
+        cluster_id = conn.execute(
+            "INSERT INTO question_clusters (centroid, members, size, representative, updated_at) "
+            "VALUES (?, 1, ?, ?, ?)",
+            (vector.tobytes(), count, representative, now)
+        ).lastrowid
+        centroids.append(cluster_id, vector)
+    return cluster_id
+
+
+def _update_representatives(conn, cluster_ids):
+    # ตัวแทนของกลุ่ม = ข้อความที่ผู้ใช้พิมพ์จริงของคำถามที่ถูกถามบ่อยที่สุดในกลุ่ม (อ่านผ่าน index ของ cluster_id)
+    for cluster_id in cluster_ids:
+        conn.execute("""
+            UPDATE question_clusters SET representative = (
+                SELECT COALESCE(original, normalized) FROM question_embeddings
+                WHERE cluster_id = ? ORDER BY count DESC LIMIT 1
+            ) WHERE id = ?
+        """, (cluster_id, cluster_id))
+
+
+def _watermark(conn):
+    row = conn.execute("SELECT last_id FROM rollup_state WHERE source = ?", (WATERMARK_SOURCE,)).fetchone()
+    return row[0] if row else 0
+
+
+def _known_questions(conn, texts):
+    known = {}
+    for i in range(0, len(texts), 500):
+        batch = texts[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        known.update(conn.execute(
+            f"SELECT normalized, cluster_id FROM question_embeddings WHERE normalized IN ({placeholders})", batch
+        ).fetchall())
+    return known
+
+
+def refresh_clusters(db_path=DB_PATH, embeddings=None, threshold=CLUSTER_THRESHOLD,
+                     max_rows=MAX_ROWS_PER_REFRESH, retries=0):
+    """จัดกลุ่มคำถามใหม่หลัง watermark (ไม่เกิน max_rows แถวต่อครั้ง) คืนสถิติของรอบนี้"""
+    start = time.time()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        last_id = _watermark(conn)
+        rows = conn.execute(
+            "SELECT id, user_message FROM user_messages WHERE id > ? ORDER BY id LIMIT ?", (last_id, max_rows)
+        ).fetchall()
+        stats = {"processed": 0, "embedded": 0, "new_clusters": 0}
+        if not rows:
+            return stats
+
+        # key = ข้อความหลัง normalize_text, เก็บข้อความที่ผู้ใช้พิมพ์จริงครั้งแรกไว้แสดงบน dashboard
+        counts, originals = Counter(), {}
+        for _, message in rows:
+            text = normalize_text(message)
+            if text:
+                counts[text] += 1
+                originals.setdefault(text, message.strip())
+        texts = list(counts)
+        known = _known_questions(conn, texts)
+        missing = [text for text in texts if text not in known]
+
+        # embed นอก transaction (เรียก Ollama) แล้วค่อยล็อกฐานข้อมูลตอนเขียน
+        vectors = {}
+        if missing:
+            embeddings = embeddings or default_embeddings()
+            raw_vectors, _ = embed_in_batches(embeddings, missing, retries=retries)
+            vectors = {text: _unit(vec) for text, vec in zip(missing, raw_vectors)}
+
+        conn.execute("BEGIN IMMEDIATE")
+        if _watermark(conn) != last_id:
+            # process อื่นจัดกลุ่มแถวชุดนี้ไปแล้ว
+            conn.rollback()
+            return stats
+        now = datetime.now().isoformat()
+        centroids = _Centroids(conn)
+        clusters_before = len(centroids.ids)
+        touched = set()
+        for text, count in counts.items():
+            if text in known:
+                cluster_id = known[text]
+                conn.execute(
+                    "UPDATE question_embeddings SET count = count + ?, original = COALESCE(original, ?) "
+                    "WHERE normalized = ?", (count, originals[text], text)
+                )
+                conn.execute(
+                    "UPDATE question_clusters SET size = size + ?, updated_at = ? WHERE id = ?",
+                    (count, now, cluster_id)
+                )
+            else:
+                cluster_id = _assign(conn, centroids, originals[text], vectors[text], count, threshold, now)
+                conn.execute(
+                    "INSERT INTO question_embeddings (normalized, original, vector, cluster_id, count) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (text, originals[text], vectors[text].tobytes(), cluster_id, count)
+                )
+            touched.add(cluster_id)
+        _update_representatives(conn, touched)
+        conn.execute(
+            "INSERT OR REPLACE INTO rollup_state (source, last_id) VALUES (?, ?)", (WATERMARK_SOURCE, rows[-1][0])
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    stats = {"processed": len(rows), "embedded": len(missing), "new_clusters": len(centroids.ids) - clusters_before}
+    logging.info(f"🧩 Question clusters refreshed in {time.time() - start:.3f}s: {stats}")
+    return stats
+
+
+def recluster(db_path=DB_PATH, threshold=CLUSTER_THRESHOLD):
+    """จัดกลุ่มใหม่ทั้งหมดจาก vector ที่เก็บไว้ (ไม่ต้อง embed ซ้ำ) เช่นหลังเปลี่ยน threshold"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM question_clusters")
+        centroids = _Centroids(conn)
+        now = datetime.now().isoformat()
+        # คำถามที่ถูกถามบ่อยกว่าเป็นจุดเริ่มของกลุ่มก่อน
+        rows = conn.execute(
+            "SELECT normalized, COALESCE(original, normalized), vector, count FROM question_embeddings "
+            "ORDER BY count DESC, normalized"
+        ).fetchall()
+        assignments = []
+        for text, original, blob, count in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            assignments.append((_assign(conn, centroids, original, vector, count, threshold, now), text))
+        conn.executemany("UPDATE question_embeddings SET cluster_id = ? WHERE normalized = ?", assignments)
+        _update_representatives(conn, set(centroids.ids))
+        conn.commit()
+    finally:
+        conn.close()
+    logging.info(f"🧩 Reclustered {len(rows)} questions into {len(centroids.ids)} clusters")
+    return len(centroids.ids)
+
+
+# ---------------------- Dashboard Queries ----------------------
+def get_top_clusters(conn, limit=10):
+    """คืน [(cluster id, คำถามตัวแทน, จำนวนครั้งที่ถาม, จำนวนรูปแบบคำถาม)] เรียงตามจำนวนครั้ง"""
+    return conn.execute(
+        "SELECT id, representative, size, members FROM question_clusters ORDER BY size DESC LIMIT ?", (limit,)
+    ).fetchall()
+
+
+def get_unclustered_count(conn):
+    """จำนวนคำถามหลัง watermark ที่ยังไม่ถูกจัดกลุ่ม (นับผ่าน primary key)"""
+    return conn.execute("SELECT COUNT(*) FROM user_messages WHERE id > ?", (_watermark(conn),)).fetchone()[0]
+
+
+def get_cluster_questions(conn, cluster_id, limit=5):
+    return conn.execute(
+        "SELECT COALESCE(original, normalized), count FROM question_embeddings "
+        "WHERE cluster_id = ? ORDER BY count DESC LIMIT ?",
+        (cluster_id, limit)
+    ).fetchall()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="จัดกลุ่มคำถามที่ความหมายเดียวกันสำหรับ dashboard")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--threshold", type=float, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--recluster", action="store_true", help="จัดกลุ่มใหม่ทั้งหมดจาก vector ที่เก็บไว้")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="รันซ้ำทุก ๆ กี่วินาที (0 = จัดกลุ่มคำถามที่ค้างอยู่แล้วจบ)")
+    args = parser.parse_args()
+
+    from migrations import run_migrations
+    run_migrations(args.db)
+    if args.recluster:
+        recluster(args.db, args.threshold)
+    embeddings = default_embeddings()
+    while True:
+        try:
+            while refresh_clusters(args.db, embeddings, args.threshold, retries=3)["processed"]:
+                pass
+        except Exception as e:
+            if not args.interval:
+                raise
+            logging.warning(f"⚠️ Question clustering failed, retrying in {args.interval:g}s ({e})")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,132 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from context_assembly import AssembledRetriever
+from hybrid_retriever import HybridRetriever, load_lexical_index
+from ingest import PERSIST_DIR, manifest_fingerprint, needs_sync, open_vectorstore, sync_vectorstore
+from mmap_vectorstore import MmapVectorStore, mmap_index_dir, read_index_fingerprint
+from model_config import EMBED_MODEL, LLM_MODEL
+from query_embeddings import CachedQueryEmbeddings, MicroBatchEmbeddings, TimedEmbeddings
+from reranker import CrossEncoderReranker, RerankingRetriever
+
+# ---------------------- RAG Pipeline ----------------------
+# ส่วนของ pipeline ที่ไม่ขึ้นกับ Streamlit: embedder, vector store, retriever, LLM และ prompt
+# chatbotv3test.py และ bench_rag.py สร้าง pipeline จากฟังก์ชันชุดเดียวกัน ผล benchmark จึงตรงกับแอปจริง
+
+load_dotenv()
+
+# Vector store backend: chroma (ค่าเริ่มต้น) หรือ mmap (matrix float16/int8 แบบ memory-mapped, ดู mmap_vectorstore.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+MMAP_NPROBE = int(os.getenv("MMAP_NPROBE", "4"))
+
+# Hybrid retrieval (BM25 + dense, reciprocal-rank fusion)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+RETRIEVAL_K = 3
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "10"))
+
+# Context assembly: รวม chunk ที่ซ้อนกัน ตัดซ้ำ และจำกัดขนาด context (token)
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", str(RETRIEVAL_K)))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Cross-encoder rerank: ดึง candidate RERANK_CANDIDATES รายการ ให้คะแนนทีละ RERANK_BATCH_SIZE คู่
+# แล้วเหลือ CONTEXT_CANDIDATES รายการ ข้าม/หยุดกลางทางถ้าจะใช้เวลาเกิน RERANK_BUDGET_MS
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "500"))
+
+# รวมคำขอ embed คำถามที่มาพร้อมกันเป็น batch เดียว (window เป็นมิลลิวินาที)
+QUERY_EMBED_BATCHING = os.getenv("QUERY_EMBED_BATCHING", "1") == "1"
+QUERY_EMBED_WINDOW_MS = float(os.getenv("QUERY_EMBED_WINDOW_MS", "15"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+
+# แคช query embedding (LRU ใน process + SQLite ข้าม restart, ค่าว่าง = ไม่ใช้ชั้น SQLite, ขนาด 0 = ปิดแคช)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_CACHE_DB = os.getenv("QUERY_EMBED_CACHE_DB", "query_embed_cache.db")
+
+PROMPT_TEMPLATE = """
+คุณเป็นผู้ช่วย AI ที่เชี่ยวชาญด้านคุณสมบัติผู้กู้ยืมเงิน กยศ.
+โปรดตอบคำถามอย่างชัดเจน กระชับ และเป็นมิตร ใช้ข้อมูลจากบริบทที่ให้มาเท่านั้น
+
+บริบท (Context): {context}
+
+คำถาม (Question): {question}
+
+คำตอบ (Answer):
+- ตอบเป็นภาษาไทยที่เข้าใจง่าย
+- เจาะจงเกี่ยวกับคุณสมบัติผู้กู้ยืม กยศ.
+- ถ้าไม่มีข้อมูลในบริบท ให้บอกว่า "ไม่พบข้อมูลที่เกี่ยวข้องในเอกสาร"
+"""
+
+
+# ---------------------- Builders ----------------------
+def build_query_embeddings(base_url, cache_db=QUERY_EMBED_CACHE_DB, cache_size=QUERY_EMBED_CACHE_SIZE):
+    from langchain_ollama import OllamaEmbeddings
+
+    embed = OllamaEmbeddings(model=EMBED_MODEL, base_url=base_url)
+    if QUERY_EMBED_BATCHING:
+        embed = MicroBatchEmbeddings(embed, window_ms=QUERY_EMBED_WINDOW_MS, max_batch=QUERY_EMBED_MAX_BATCH)
+    if cache_size > 0:
+        # แคชอยู่ชั้นนอกสุด: คำถามที่เคยถามแล้วไม่ต้องรอ batch window หรือเรียก Ollama
+        embed = CachedQueryEmbeddings(embed, EMBED_MODEL, max_entries=cache_size,
+                                      db_path=cache_db or None)
+    return TimedEmbeddings(embed)
+
+
+def load_store(embeddings, backend=VECTOR_BACKEND, persist_dir=PERSIST_DIR, sources=None):
+    """เปิด vector store แล้ว sync กับเอกสาร (incremental) คืน (vectorstore, จำนวน chunks)"""
+    if backend == "mmap":
+        # เปิด Chroma เฉพาะเมื่อเอกสารเปลี่ยนหรือ index ยังไม่ตรงกับ manifest (sync จะ export index ใหม่)
+        if needs_sync(sources, persist_dir) or read_index_fingerprint(persist_dir) != manifest_fingerprint(persist_dir):
+            sync_vectorstore(open_vectorstore(persist_dir, embeddings), sources=sources, persist_dir=persist_dir,
+                             mmap_index=True)
+        vectorstore = MmapVectorStore(mmap_index_dir(persist_dir), embedding=embeddings, nprobe=MMAP_NPROBE)
+        logging.info(f"🧮 Loaded {vectorstore.dtype} mmap index ({len(vectorstore)} chunks)")
+        return vectorstore, len(vectorstore)
+
+    vectorstore = open_vectorstore(persist_dir, embeddings)
+    # parse/embed เฉพาะเอกสารที่เปลี่ยนไปจาก manifest (ปกติแค่ hash ไฟล์แล้วข้าม)
+    sync_vectorstore(vectorstore, sources=sources, persist_dir=persist_dir, mmap_index=False)
+    logging.info("📂 Loaded ChromaDB")
+    return vectorstore, vectorstore._collection.count()
+
+
+def build_reranker():
+    """คืน CrossEncoderReranker ที่โหลดแล้ว หรือ None ถ้าปิดไว้/โหลดไม่ได้"""
+    if not RERANK_ENABLED:
+        return None
+    reranker = CrossEncoderReranker(RERANK_MODEL, batch_size=RERANK_BATCH_SIZE,
+                                    latency_budget=RERANK_BUDGET_MS / 1000)
+    return reranker if reranker.load() else None
+
+
+def build_retriever(vectorstore, reranker=None, persist_dir=PERSIST_DIR):
+    # มี rerank: retriever ดึง candidate มากขึ้น แล้วให้ cross-encoder เลือก CONTEXT_CANDIDATES รายการ
+    pool = max(RERANK_CANDIDATES, CONTEXT_CANDIDATES) if reranker else CONTEXT_CANDIDATES
+    lexical_index = load_lexical_index(persist_dir) if HYBRID_RETRIEVAL else None
+    if lexical_index is None:
+        base = vectorstore.as_retriever(search_kwargs={"k": pool})
+    else:
+        logging.info(f"🔤 Hybrid retrieval enabled ({len(lexical_index.ids)} chunks in BM25 index)")
+        base = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index,
+                               k=pool, fetch_k=max(HYBRID_FETCH_K, pool))
+    if reranker:
+        base = RerankingRetriever(base_retriever=base, reranker=reranker, top_n=CONTEXT_CANDIDATES)
+    return AssembledRetriever(base_retriever=base, token_budget=CONTEXT_TOKEN_BUDGET)
+
+
+def build_llm(base_url, timeout=None):
+    """timeout = read timeout (วินาที) ของ HTTP client: stream ที่ Ollama ไม่ส่งอะไรมานานเกินนี้จะถูกตัด"""
+    from langchain_ollama import OllamaLLM
+
+    client_kwargs = {"timeout": timeout} if timeout else {}
+    return OllamaLLM(model=LLM_MODEL, base_url=base_url, temperature=0.2, client_kwargs=client_kwargs)
+
+
+def build_prompt(question, docs):
+    # รวม context แบบเดียวกับ chain_type="stuff"
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return PROMPT_TEMPLATE.format(context=context, question=question)
@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from stage_timings import record_timing
+
+# ---------------------- Cross-encoder Reranking ----------------------
+# retriever (dense / hybrid) ดึง candidate มากกว่าที่ใช้จริง (เช่น 20) แล้วให้ cross-encoder ให้คะแนน
+# คู่ (คำถาม, chunk) ทีละ batch เลือกเฉพาะ top_n ที่ดีที่สุดเข้า prompt
+# มีงบเวลา (latency budget): ถ้าคาดว่า batch ถัดไปจะทำให้เกินงบ จะหยุดให้คะแนน ส่วนที่ยังไม่ได้คะแนน
+# คงลำดับเดิมของ retriever ไว้ และถ้าคาดว่า batch แรกก็เกินงบแล้ว จะข้ามการ rerank ทั้งหมด
+
+DEFAULT_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+# น้ำหนักของเวลาล่าสุดใน moving average ของเวลาต่อคู่
+EWMA_ALPHA = 0.3
+# ทุกครั้งที่ข้าม ลดค่าประมาณลงเล็กน้อย ให้ลองใหม่ได้เมื่อเครื่องว่างลง (ไม่ติดสถานะข้ามตลอดไป)
+SKIP_DECAY = 0.9
+
+
+class CrossEncoderReranker:
+    """ให้คะแนนความเกี่ยวข้องด้วย sentence-transformers CrossEncoder บน CPU ภายในงบเวลา"""
+
+    def __init__(self, model_name=DEFAULT_MODEL, batch_size=8, latency_budget=0.5, max_length=512):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.latency_budget = latency_budget
+        self.max_length = max_length
+        self.model = None
+        self._lock = threading.Lock()
+        self._per_pair = None   # เวลาเฉลี่ยต่อคู่ (วินาที) ใช้คาดการณ์เวลาของ batch ถัดไป
+        self._counters = {"reranked": 0, "partial": 0, "skipped": 0}
+
+    def load(self):
+        """โหลดโมเดลและวัดเวลาต่อคู่ครั้งแรก คืน False ถ้าโหลดไม่ได้"""
+        try:
+            from sentence_transformers import CrossEncoder
+
+            self.model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            # batch แรกของ torch ช้ากว่าปกติมาก ให้เกิดตอนเริ่ม process ไม่ใช่ตอนคำถามแรก
+            # (และถ้า inference ใช้ไม่ได้ ก็ปิด rerank ตั้งแต่ตอนนี้แทนที่จะล้มตอนตอบคำถาม)
+            self._score([("warm up", "warm up")] * self.batch_size)
+        except Exception as e:
+            logging.warning(f"⚠️ Cross-encoder {self.model_name} unavailable ({e}), reranking disabled")
+            self.model, self._per_pair = None, None
+            return False
+        logging.info(f"🎯 Loaded cross-encoder {self.model_name} ({self._per_pair * 1000:.1f} ms/pair)")
+        return True
+
+    def _score(self, pairs):
+        start = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        per_pair = (time.perf_counter() - start) / len(pairs)
+        if self._per_pair is None:
+            self._per_pair = per_pair
+        else:
+            self._per_pair = EWMA_ALPHA * per_pair + (1 - EWMA_ALPHA) * self._per_pair
+        return [float(s) for s in scores]
+
+    def rerank(self, query, docs, top_n):
+        """คืน top_n เอกสารเรียงตามคะแนน cross-encoder (หรือตามลำดับเดิมถ้าข้าม)"""
+        if self.model is None or len(docs) <= 1:
+            return docs[:top_n]
+        start = time.perf_counter()
+        scores = []
+        # ใช้โมเดลทีละคำขอ: หลาย session แย่ง CPU กันจะช้าลงทุกคน เวลารอ lock นับรวมในงบด้วย
+        with self._lock:
+            for lo in range(0, len(docs), self.batch_size):
+                batch = docs[lo:lo + self.batch_size]
+                expected = time.perf_counter() - start + self._per_pair * len(batch)
+                if expected > self.latency_budget:
+                    break
+                scores.extend(self._score([(query, doc.page_content) for doc in batch]))
+            if not scores:
+                self._per_pair *= SKIP_DECAY
+        elapsed = time.perf_counter() - start
+
+        if not scores:
+            self._count("skipped")
+            logging.info(f"⏭️ Skipped reranking ({len(docs)} candidates would exceed {self.latency_budget * 1000:.0f} ms)")
+            return docs[:top_n]
+
+        self._count("partial" if len(scores) < len(docs) else "reranked")
+        order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        # candidate ที่ไม่ทันได้คะแนนต่อท้ายตามลำดับเดิมของ retriever
+        ranked = [docs[i] for i in order] + docs[len(scores):]
+        record_timing("rerank", elapsed)
+        return ranked[:top_n]
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "ms_per_pair": (self._per_pair or 0.0) * 1000}
+
+
+class RerankingRetriever(BaseRetriever):
+    """ดึง candidate จาก base_retriever แล้วเหลือ top_n ที่ cross-encoder ให้คะแนนสูงสุด"""
+
+    base_retriever: Any
+    reranker: Any
+    top_n: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        candidates = self.base_retriever.invoke(query, config=config)
+        return self.reranker.rerank(query, candidates, self.top_n)
@@ -0,0 +1,45 @@
+import threading
+import time
+
+# ---------------------- Stage Timings ----------------------
+# เวลาของแต่ละ stage ใน pipeline (เช่น dense / lexical / assembly) ของคำถามที่กำลังประมวลผล
+# เก็บแบบ thread-local เพราะ Streamlit รันแต่ละ session ใน thread ของตัวเอง
+# เก็บเวลาเริ่ม (epoch) ของแต่ละ stage ไว้ด้วย tracing.py ใช้สร้าง span ตามลำดับเวลาจริง
+
+_local = threading.local()
+
+
+def reset_timings():
+    _local.timings = {}
+    _local.starts = {}
+
+
+def _state():
+    if not hasattr(_local, "timings"):
+        reset_timings()
+    return _local.timings, _local.starts
+
+
+def record_timing(stage, seconds):
+    """บันทึกเวลาของ stage ที่เพิ่งจบ (วินาที)"""
+    timings, starts = _state()
+    timings[stage] = seconds
+    starts[stage] = time.time() - seconds
+
+
+def add_timing(stage, seconds):
+    """เหมือน record_timing แต่บวกสะสม สำหรับ stage ที่เกิดหลายครั้งต่อคำถาม (เช่น embed)"""
+    timings, starts = _state()
+    starts.setdefault(stage, time.time() - seconds)
+    timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def get_last_timings():
+    """เวลาของแต่ละ stage ของการค้นหาครั้งล่าสุดใน thread นี้ (วินาที)"""
+    return dict(getattr(_local, "timings", {}))
+
+
+def get_last_spans():
+    """[(stage, เวลาเริ่ม epoch, วินาที)] ของคำถามล่าสุดใน thread นี้ เรียงตามเวลาเริ่ม"""
+    timings, starts = _state()
+    return sorted(((stage, starts[stage], seconds) for stage, seconds in timings.items()), key=lambda s: s[1])
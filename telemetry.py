@@ -0,0 +1,156 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+
+# ---------------------- Telemetry Writer ----------------------
+# ใช้ connection เดียวต่อ process (WAL mode) แทนการเปิด/ปิด connection ทุกครั้งที่บันทึก
+# ข้อความ + chunks + metrics ของคำถามหนึ่งข้อถูกเขียนใน transaction เดียว
+# และ (ถ้าเปิด background) จะถูกส่งเข้า queue ให้ thread เบื้องหลังเขียน ไม่บล็อกหน้าแชท
+
+METRIC_COLUMNS = [
+    "prompt_tokens", "response_tokens", "response_time", "ttft", "total_time", "cache_hit", "latency_saved",
+    "dense_time", "lexical_time", "queue_wait", "rerank_time",
+]
+
+
+def connect(db_path):
+    """เปิด connection แบบ long-lived สำหรับเขียน telemetry"""
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL: ไม่ fsync ทุก commit แต่ยังไม่เสียข้อมูลเมื่อแอปล่ม
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class TelemetryWriter:
+    """เขียนข้อมูลการสนทนาลง questions.db ผ่าน connection เดียวที่ใช้ร่วมกันทุก session"""
+
+    def __init__(self, db_path, background=True, batch_size=50):
+        self.db_path = db_path
+        self.background = background
+        self.batch_size = batch_size
+        self._conn = connect(db_path)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        if background:
+            self._worker = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+            self._worker.start()
+        atexit.register(self.close)
+
+    # ---------------------- Writes ----------------------
+    def _write_turn(self, cursor, user_message, answer, chunks, metrics):
+        now = datetime.now().isoformat()
+        cursor.execute("""
+            INSERT INTO user_messages (user_message, answer, timestamp)
+            VALUES (?, ?, ?)
+        """, (user_message, answer, now))
+        message_id = cursor.lastrowid
+
+        cursor.executemany("""
+            INSERT INTO retrieved_chunks (user_message_id, chunk_text, source, page_number)
+            VALUES (?, ?, ?, ?)
+        """, [
+            (message_id, chunk.page_content, chunk.metadata.get("source"), chunk.metadata.get("page_number", 0))
+            for chunk in chunks
+        ])
+
+        values = [metrics.get(col) for col in METRIC_COLUMNS]
+        cursor.execute(f"""
+            INSERT INTO llm_metrics (user_message_id, timestamp, {", ".join(METRIC_COLUMNS)})
+            VALUES (?, ?, {", ".join("?" for _ in METRIC_COLUMNS)})
+        """, [message_id, now] + values)
+        return message_id
+
+    def _write_feedback(self, cursor, user_message_id, satisfaction, feedback_text):
+        cursor.execute("""
+            INSERT INTO feedback (user_message_id, satisfaction, feedback_text, timestamp)
+            VALUES (?, ?, ?, ?)
+        """, (user_message_id, satisfaction, feedback_text, datetime.now().isoformat()))
+        return cursor.lastrowid
+
+    def _execute(self, jobs):
+        """เขียนหลายงานใน transaction เดียว คืนผลลัพธ์ของแต่ละงาน"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                results = [getattr(self, name)(cursor, *args) for name, args in jobs]
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return results
+
+    def record_turn(self, user_message, answer, chunks, metrics):
+        """บันทึกข้อความ, chunks และ metrics ใน transaction เดียว คืน user_message_id"""
+        message_id = self._execute([("_write_turn", (user_message, answer, chunks, metrics))])[0]
+        logging.info(f"✅ Saved message {message_id} with {len(chunks)} chunks and metrics")
+        return message_id
+
+    def record_feedback(self, user_message_id, satisfaction, feedback_text):
+        self._execute([("_write_feedback", (user_message_id, satisfaction, feedback_text))])
+        logging.info(f"💬 Saved feedback for message {user_message_id}: {satisfaction}")
+
+    # ---------------------- Background Queue ----------------------
+    def submit_turn(self, user_message, answer, chunks, metrics):
+        """ส่งงานเข้า queue คืน Future ที่จะได้ user_message_id เมื่อเขียนเสร็จ"""
+        future = Future()
+        if not self.background:
+            try:
+                future.set_result(self.record_turn(user_message, answer, chunks, metrics))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._queue.put((future, ("_write_turn", (user_message, answer, chunks, metrics))))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # รวมงานที่รออยู่ใน queue เขียนครั้งเดียว
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                batch.append(nxt)
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch):
+        try:
+            results = self._execute([job for _, job in batch])
+        except Exception as e:
+            logging.error(f"❌ Telemetry batch write failed ({e}), retrying records one by one")
+            for future, job in batch:
+                try:
+                    future.set_result(self._execute([job])[0])
+                except Exception as job_error:
+                    future.set_exception(job_error)
+            return
+        for (future, _), result in zip(batch, results):
+            future.set_result(result)
+        logging.info(f"✅ Flushed {len(batch)} telemetry records")
+
+    def close(self):
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join(timeout=10)
+        with self._lock:
+            self._conn.close()
+
+
+def resolve_message_id(value, timeout=10):
+    """id ใน session state อาจเป็น Future (เขียนแบบ background) หรือ int"""
+    if isinstance(value, Future):
+        return value.result(timeout=timeout)
+    return value
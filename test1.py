@@ -1,30 +1,43 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
+import logging
 from datetime import datetime
 
+from dashboard_stats import (
+    get_chunks_page, get_feedback_counts, get_feedback_page, get_kpis, get_messages_page, get_top_questions, refresh_rollups,
+    search_messages,
+)
+from metrics_engine import WINDOWS, get_stage_series, get_stage_summary, get_window_series, get_window_summary
+from migrations import run_migrations
+from question_clusters import get_cluster_questions, get_top_clusters, get_unclustered_count
+from tracing import PARENT_SPANS
+
 # ---------------------- Database ----------------------
 DB_PATH = "questions.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-c = conn.cursor()
 
-# ---------------------- ฟังก์ชันดึงข้อมูล ----------------------
-def get_all_messages():
-    c.execute("SELECT id, user_message, answer, timestamp FROM user_messages ORDER BY id DESC")
-    return c.fetchall()
 
-def get_all_chunks():
-    c.execute("""
-        SELECT rc.id, rc.user_message_id, um.user_message, rc.chunk_text, rc.source, rc.page_number
-        FROM retrieved_chunks rc
-        LEFT JOIN user_messages um ON rc.user_message_id = um.id
-        ORDER BY rc.id DESC
-    """)
-    return c.fetchall()
+@st.cache_resource
+def migrate_db():
+    # อัปเดต schema และ index ครั้งเดียวต่อ process ก่อนเปิด connection ของ dashboard
+    return run_migrations(DB_PATH)
+
+
+PAGE_SIZE = 50
+# อัปเดต rollup ไม่เกินหนึ่งครั้งทุก ROLLUP_REFRESH_SECONDS วินาทีต่อ process ไม่ว่าจะ rerun บ่อยแค่ไหน
+ROLLUP_REFRESH_SECONDS = 10
+
 
+@st.cache_data(ttl=ROLLUP_REFRESH_SECONDS, show_spinner=False)
+def refresh_dashboard_rollups():
+    return refresh_rollups(DB_PATH)
+
+
+# ---------------------- ฟังก์ชันดึงข้อมูล ----------------------
 def get_latest_metrics(limit=50):
     c.execute("""
-        SELECT m.id, m.user_message_id, um.user_message, m.prompt_tokens, m.response_tokens, m.response_time, m.timestamp
+        SELECT m.id, m.user_message_id, um.user_message, m.prompt_tokens, m.response_tokens, m.response_time,
+               m.ttft, m.timestamp
         FROM llm_metrics m
         LEFT JOIN user_messages um ON m.user_message_id = um.id
         ORDER BY m.id DESC
@@ -32,14 +45,27 @@ def get_latest_metrics(limit=50):
     """, (limit,))
     return c.fetchall()
 
-def get_all_feedback():
-    c.execute("""
-        SELECT f.id, f.user_message_id, um.user_message, f.satisfaction, f.feedback_text, f.timestamp
-        FROM feedback f
-        LEFT JOIN user_messages um ON f.user_message_id = um.id
-        ORDER BY f.id DESC
-    """)
-    return c.fetchall()
+def page_cursor(key, reset_on=None):
+    """คืน (cursor, เลขหน้า) ของตาราง (keyset pagination แบบเดียวกับ admin_dashboard.py)
+
+    เก็บ cursor ของต้นหน้าที่ผ่านมาแล้ว (None = หน้าแรก) ย้อนกลับได้ทีละหน้า กลับไปหน้าแรกเมื่อ reset_on เปลี่ยน
+    """
+    state = st.session_state.setdefault(key, {"reset_on": reset_on, "cursors": [None]})
+    if state["reset_on"] != reset_on:
+        state.update(reset_on=reset_on, cursors=[None])
+    return state["cursors"][-1], len(state["cursors"])
+
+def page_buttons(key, next_cursor):
+    cursors = st.session_state[key]["cursors"]
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        if st.button("⬅️ หน้าก่อนหน้า", key=f"{key}_prev", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_next:
+        if st.button("หน้าถัดไป ➡️", key=f"{key}_next", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # ---------------------- Streamlit Page Config ----------------------
 st.set_page_config(
@@ -49,6 +75,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# migrate หลัง set_page_config: ถ้าล้มเหลว แสดงข้อผิดพลาดบนหน้าแทน traceback ก่อนหน้า render
+try:
+    migrate_db()
+except Exception as e:
+    logging.error(f"❌ Database migration failed: {e}")
+    st.error(f"❌ อัปเดตฐานข้อมูล {DB_PATH} ไม่สำเร็จ: {e}")
+    st.stop()
+conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+c = conn.cursor()
+
 # ---------------------- Custom CSS ----------------------
 st.markdown("""
     <style>
@@ -121,31 +157,22 @@ with col_header2:
 st.divider()
 
 # ---------------------- ดึงข้อมูล ----------------------
-messages_data = get_all_messages()
-df_messages = pd.DataFrame(messages_data, columns=["ID", "User Message", "Answer", "Timestamp"])
-if not df_messages.empty:
-    df_messages["Timestamp"] = pd.to_datetime(df_messages["Timestamp"])
-
-chunks_data = get_all_chunks()
-df_chunks = pd.DataFrame(chunks_data, columns=["ID", "User Message ID", "User Message", "Chunk Text", "Source", "Page Number"])
+# อัปเดต rollup เฉพาะแถวใหม่ แล้วอ่าน KPI จากตาราง rollup (ไม่โหลดทุกแถว)
+refresh_dashboard_rollups()
+kpis = get_kpis(conn)
 
 metrics_data = get_latest_metrics(limit=50)
-df_metrics = pd.DataFrame(metrics_data, columns=["ID", "User Message ID", "User Message", "Prompt Tokens", "Response Tokens", "Response Time (s)", "Timestamp"])
+df_metrics = pd.DataFrame(metrics_data, columns=["ID", "User Message ID", "User Message", "Prompt Tokens", "Response Tokens", "Response Time (s)", "TTFT (s)", "Timestamp"])
 if not df_metrics.empty:
     df_metrics["Timestamp"] = pd.to_datetime(df_metrics["Timestamp"])
 
-feedback_data = get_all_feedback()
-df_feedback = pd.DataFrame(feedback_data, columns=["ID", "User Message ID", "User Message", "Satisfaction", "Feedback Text", "Timestamp"])
-if not df_feedback.empty:
-    df_feedback["Timestamp"] = pd.to_datetime(df_feedback["Timestamp"])
-
 # ---------------------- KPI Dashboard ----------------------
 st.subheader("📊 Key Performance Indicators")
 
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    total_messages = len(df_messages)
+    total_messages = kpis["messages"]
     st.markdown(f"""
     <div class="metric-card" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);">
         <div class="metric-label">💬 ข้อความทั้งหมด</div>
@@ -155,8 +182,8 @@ with col1:
     """, unsafe_allow_html=True)
 
 with col2:
-    feedback_count = len(df_feedback)
-    satisfaction_rate = round(df_feedback[df_feedback["Satisfaction"] == "พอใจ"].shape[0] / feedback_count * 100, 1) if feedback_count > 0 else 0
+    feedback_count = kpis["feedback_count"]
+    satisfaction_rate = kpis["satisfaction_rate"]
     st.markdown(f"""
     <div class="metric-card" style="background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);">
         <div class="metric-label">⭐ Feedback</div>
@@ -166,7 +193,7 @@ with col2:
     """, unsafe_allow_html=True)
 
 with col3:
-    avg_response_time = round(df_metrics["Response Time (s)"].mean(), 2) if not df_metrics.empty else 0
+    avg_response_time = round(kpis["avg_response_time"], 2)
     st.markdown(f"""
     <div class="metric-card" style="background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);">
         <div class="metric-label">⚡ Avg Response Time</div>
@@ -176,22 +203,22 @@ with col3:
     """, unsafe_allow_html=True)
 
 with col4:
-    total_tokens = df_metrics["Prompt Tokens"].sum() + df_metrics["Response Tokens"].sum() if not df_metrics.empty else 0
+    total_tokens = kpis["total_tokens"]
     st.markdown(f"""
     <div class="metric-card" style="background: linear-gradient(135deg, #43e97b 0%, #38f9d7 100%);">
         <div class="metric-label">🎯 Total Tokens Used</div>
         <div class="metric-value">{total_tokens:,}</div>
-        <div class="metric-delta">{df_metrics.shape[0]} requests</div>
+        <div class="metric-delta">{kpis["requests"]:,} requests</div>
     </div>
     """, unsafe_allow_html=True)
 
 st.divider()
 
 # ---------------------- Quick Stats Section ----------------------
-if not df_metrics.empty:
+if kpis["requests"] > 0:
     st.subheader("📈 Quick Statistics")
     
-    stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
+    stat_col1, stat_col2, stat_col3, stat_col4, stat_col5 = st.columns(5)
     
     with stat_col1:
         st.markdown("""
@@ -199,7 +226,7 @@ if not df_metrics.empty:
             <h4 style="margin:0; color:#3b82f6;">Avg Prompt Tokens</h4>
             <h2 style="margin:0.5rem 0;">{}</h2>
         </div>
-        """.format(f"{df_metrics['Prompt Tokens'].mean():.0f}"), unsafe_allow_html=True)
+        """.format(f"{kpis['avg_prompt_tokens']:.0f}"), unsafe_allow_html=True)
     
     with stat_col2:
         st.markdown("""
@@ -207,7 +234,7 @@ if not df_metrics.empty:
             <h4 style="margin:0; color:#8b5cf6;">Avg Response Tokens</h4>
             <h2 style="margin:0.5rem 0;">{}</h2>
         </div>
-        """.format(f"{df_metrics['Response Tokens'].mean():.0f}"), unsafe_allow_html=True)
+        """.format(f"{kpis['avg_response_tokens']:.0f}"), unsafe_allow_html=True)
     
     with stat_col3:
         st.markdown("""
@@ -215,7 +242,7 @@ if not df_metrics.empty:
             <h4 style="margin:0; color:#ec4899;">Max Response Time</h4>
             <h2 style="margin:0.5rem 0;">{}</h2>
         </div>
-        """.format(f"{df_metrics['Response Time (s)'].max():.2f}s"), unsafe_allow_html=True)
+        """.format(f"{kpis['max_response_time']:.2f}s"), unsafe_allow_html=True)
     
     with stat_col4:
         st.markdown("""
@@ -223,52 +250,94 @@ if not df_metrics.empty:
             <h4 style="margin:0; color:#10b981;">Min Response Time</h4>
             <h2 style="margin:0.5rem 0;">{}</h2>
         </div>
-        """.format(f"{df_metrics['Response Time (s)'].min():.2f}s"), unsafe_allow_html=True)
+        """.format(f"{kpis['min_response_time']:.2f}s"), unsafe_allow_html=True)
+
+    with stat_col5:
+        avg_ttft = kpis["avg_ttft"]
+        st.markdown("""
+        <div class="stats-box">
+            <h4 style="margin:0; color:#f59e0b;">Avg Time to First Token</h4>
+            <h2 style="margin:0.5rem 0;">{}</h2>
+        </div>
+        """.format(f"{avg_ttft:.2f}s" if avg_ttft is not None else "-"), unsafe_allow_html=True)
     
     st.divider()
 
-# ---------------------- ⭐⭐⭐ START: NEW SECTION ⭐⭐⭐ ----------------------
-# ---------------------- Top Questions Analysis ----------------------
-st.subheader("💡 คำถามที่พบบ่อยที่สุด (Top 10)")
+# ---------------------- Answer Cache Section ----------------------
+cache_total, cache_hits, cache_saved = kpis["requests"], kpis["cache_hits"], kpis["latency_saved"]
+if cache_total > 0:
+    st.subheader("⚡ Semantic Answer Cache")
 
-if not df_messages.empty:
-    # --- START: TEXT NORMALIZATION ---
-    
-    # สร้างสำเนาของ DataFrame เพื่อไม่ให้กระทบกับข้อมูลดิบที่แสดงในตารางอื่น
-    analysis_df = df_messages.copy()
-
-    # สร้างฟังก์ชันสำหรับทำความสะอาดข้อความ
-    def normalize_text(text):
-        if not isinstance(text, str):
-            return ""
-        text = text.lower() # 1. แปลงเป็นตัวพิมพ์เล็ก
-        text = text.strip() # 2. ตัดช่องว่างหน้า-หลัง
-        
-        # 3. ลบคำลงท้ายและเครื่องหมายต่างๆ ที่ไม่สำคัญ
-        words_to_remove = ['คะ', 'ครับ', 'ค่ะ', 'คับ', 'จ้ะ', 'จ้า', '?', '!', '.']
-        for word in words_to_remove:
-            text = text.replace(word, '')
-            
-        return text.strip() # ตัดช่องว่างอีกครั้งหลังลบคำ
+    cache_col1, cache_col2, cache_col3 = st.columns(3)
+    cache_col1.metric("Cache Hit Rate", f"{cache_hits / cache_total * 100:.1f}%")
+    cache_col2.metric("Cache Hits / Misses", f"{cache_hits:,} / {cache_total - cache_hits:,}")
+    cache_col3.metric("เวลาที่ประหยัดได้ (รวม)", f"{cache_saved:,.1f}s")
 
-    # สร้างคอลัมน์ใหม่สำหรับข้อความที่ทำความสะอาดแล้ว
-    analysis_df['Normalized Message'] = analysis_df['User Message'].apply(normalize_text)
+    st.divider()
 
-    # --- END: TEXT NORMALIZATION ---
+# ---------------------- Stage Latency Section ----------------------
+# percentile ราย stage จาก histogram rollup ของ trace_spans (metrics_engine.py) ไม่อ่าน span ทีละแถว
+st.subheader("⏱️ Latency แยกตาม stage")
+window_label = st.selectbox("ช่วงเวลา", list(WINDOWS), index=1, key="stage_window")
+stage_summary = get_stage_summary(conn, window_label)
+if not stage_summary:
+    st.info("ยังไม่มีข้อมูล trace ในช่วงเวลานี้ (ดู TRACING_ENABLED)")
+else:
+    stage_table = pd.DataFrame([
+        {
+            "Stage": stage,
+            "ประเภท": "รวม: " + PARENT_SPANS[stage] if stage in PARENT_SPANS else "stage",
+            "Spans": values["count"],
+            "p50 (ms)": values[0.5] * 1000,
+            "p95 (ms)": values[0.95] * 1000,
+            "p99 (ms)": values[0.99] * 1000,
+        }
+        for stage, values in stage_summary.items()
+    ])
+    # span ที่ครอบ stage อื่นอยู่บนสุด แล้วตามด้วย stage เดี่ยวเรียงจาก p95 มากไปน้อย
+    stage_table["is_parent"] = stage_table["Stage"].isin(list(PARENT_SPANS))
+    stage_table = stage_table.sort_values(["is_parent", "p95 (ms)"], ascending=False).drop(columns="is_parent")
+    st.dataframe(stage_table.set_index("Stage").style.format({"Spans": "{:,.0f}", "p50 (ms)": "{:,.1f}",
+                                                              "p95 (ms)": "{:,.1f}", "p99 (ms)": "{:,.1f}"}),
+                 use_container_width=True)
+
+    df_stage_series = pd.DataFrame(get_stage_series(conn, window_label), columns=["Time", "Stage", "p95"])
+    df_stage_series["Time"] = pd.to_datetime(df_stage_series["Time"])
+    df_stage_series["p95"] = df_stage_series["p95"] * 1000
+    st.caption("p95 (ms) ของแต่ละ stage ตามช่วงเวลา (ไม่รวม span ที่ครอบ stage อื่น)")
+    st.line_chart(
+        df_stage_series[~df_stage_series["Stage"].isin(list(PARENT_SPANS))].pivot(index="Time", columns="Stage", values="p95")
+    )
 
-    # 1. นับความถี่จากคอลัมน์ที่ทำความสะอาดแล้ว
-    top_questions_df = analysis_df['Normalized Message'].value_counts().reset_index()
-    top_questions_df.columns = ['Question', 'Count']
-    
-    # 2. เตรียมข้อมูลสำหรับแสดงผล
-    top_10_questions = top_questions_df.head(10)
+st.divider()
+
+# ---------------------- ⭐⭐⭐ START: NEW SECTION ⭐⭐⭐ ----------------------
+# ---------------------- Top Questions Analysis ----------------------
+st.subheader("💡 คำถามที่พบบ่อยที่สุด (Top 10)")
+
+if kpis["messages"] > 0:
+    # อ่านกลุ่มที่ `python question_clusters.py` จัดไว้แล้วเท่านั้น (หน้า dashboard ไม่เรียก embedding model)
+    unclustered = get_unclustered_count(conn)
+    if unclustered:
+        st.caption(f"⏳ มี {unclustered:,} คำถามที่ยังไม่ถูกจัดกลุ่ม (รัน `python question_clusters.py` เพื่ออัปเดต)")
+    top_clusters = get_top_clusters(conn, limit=10)
+    if top_clusters:
+        top_10_questions = pd.DataFrame(
+            [(representative, size, members) for _, representative, size, members in top_clusters],
+            columns=['Question', 'Count', 'Variants']
+        )
+    else:
+        # ยังไม่มีกลุ่ม (ยังไม่เคยรัน question_clusters.py) ใช้จำนวนนับจาก normalize_text แทน
+        top_10_questions = pd.DataFrame(
+            [(question, count, 1) for question, count in get_top_questions(conn, limit=10)],
+            columns=['Question', 'Count', 'Variants']
+        )
 
-    # ... ส่วนที่เหลือของโค้ด (st.columns, st.bar_chart, st.dataframe) เหมือนเดิม ...
     col_chart, col_table = st.columns([2, 3]) 
 
     with col_chart:
         st.markdown("##### กราฟแสดง 10 อันดับคำถาม")
-        chart_data = top_10_questions.set_index('Question')
+        chart_data = top_10_questions.set_index('Question')[['Count']]
         st.bar_chart(chart_data)
 
     with col_table:
@@ -278,10 +347,18 @@ if not df_messages.empty:
             use_container_width=True,
             hide_index=True,
             column_config={
-                "Question": st.column_config.TextColumn("คำถาม", width="large"),
-                "Count": st.column_config.NumberColumn("จำนวนครั้ง", width="small")
+                "Question": st.column_config.TextColumn("คำถาม (ตัวแทนกลุ่ม)", width="large"),
+                "Count": st.column_config.NumberColumn("จำนวนครั้ง", width="small"),
+                "Variants": st.column_config.NumberColumn("รูปแบบคำถาม", width="small")
             }
         )
+
+    if top_clusters:
+        with st.expander("🧩 ตัวอย่างคำถามในแต่ละกลุ่ม"):
+            for cluster_id, representative, size, _ in top_clusters:
+                variants = get_cluster_questions(conn, cluster_id, limit=5)
+                st.markdown(f"**{representative}** ({size:,} ครั้ง)")
+                st.markdown("\n".join(f"- {question} ({count:,})" for question, count in variants))
 else:
     st.info("ยังไม่มีข้อมูลเพียงพอที่จะวิเคราะห์คำถามที่พบบ่อย")
 
@@ -295,14 +372,20 @@ tab1, tab2, tab3, tab4 = st.tabs(["💬 ข้อความทั้งหม
 
 with tab1:
     st.markdown("### 📋 ข้อความและคำตอบทั้งหมด")
-    if not df_messages.empty:
-        # Search/Filter
-        search_term = st.text_input("🔍 ค้นหาคำถาม", placeholder="พิมพ์คำค้นหา...")
+    if kpis["messages"] > 0:
+        # ค้นหาผ่าน full-text index (เรียงตามความเกี่ยวข้อง) และแบ่งหน้าใน SQL
+        search_term = st.text_input("🔍 ค้นหาคำถาม", placeholder="พิมพ์คำค้นหา...").strip()
+        cursor, page = page_cursor("messages_page", reset_on=search_term)
         if search_term:
-            filtered_df = df_messages[df_messages["User Message"].str.contains(search_term, case=False, na=False)]
+            rows, next_cursor = search_messages(conn, search_term, cursor, PAGE_SIZE)
+            filtered_df = pd.DataFrame(rows, columns=["ID", "User Message", "Answer", "Timestamp", "Question Match", "Answer Match"])
+            filtered_df = filtered_df[["ID", "Question Match", "Answer Match", "Timestamp"]]
         else:
-            filtered_df = df_messages
-        
+            rows, next_cursor = get_messages_page(conn, cursor, PAGE_SIZE)
+            filtered_df = pd.DataFrame(rows, columns=["ID", "User Message", "Answer", "Timestamp"])
+        if not filtered_df.empty:
+            filtered_df["Timestamp"] = pd.to_datetime(filtered_df["Timestamp"])
+
         st.dataframe(
             filtered_df,
             use_container_width=True,
@@ -311,16 +394,25 @@ with tab1:
                 "ID": st.column_config.NumberColumn("ID", width="small"),
                 "Timestamp": st.column_config.DatetimeColumn("เวลา", format="DD/MM/YYYY HH:mm"),
                 "User Message": st.column_config.TextColumn("คำถาม", width="medium"),
-                "Answer": st.column_config.TextColumn("คำตอบ", width="large")
+                "Answer": st.column_config.TextColumn("คำตอบ", width="large"),
+                "Question Match": st.column_config.TextColumn("คำถาม (ส่วนที่ตรง)", width="medium"),
+                "Answer Match": st.column_config.TextColumn("คำตอบ (ส่วนที่ตรง)", width="large")
             }
         )
-        st.info(f"แสดง {len(filtered_df)} จาก {len(df_messages)} รายการ")
+        page_buttons("messages_page", next_cursor)
+        if search_term:
+            st.info(f"หน้า {page}: แสดง {len(filtered_df)} รายการที่ตรงกับคำค้นหา เรียงตามความเกี่ยวข้อง" + (" (มีหน้าถัดไป)" if next_cursor is not None else ""))
+        else:
+            st.info(f"หน้า {page}: แสดง {len(filtered_df)} จาก {kpis['messages']:,} รายการ")
     else:
         st.info("ยังไม่มีข้อมูลข้อความ")
 
 with tab2:
     st.markdown("### 📂 Chunks ที่ถูกดึงมาใช้งาน")
-    if not df_chunks.empty:
+    if kpis["chunks"] > 0:
+        cursor, page = page_cursor("chunks_page")
+        rows, next_cursor = get_chunks_page(conn, cursor, PAGE_SIZE)
+        df_chunks = pd.DataFrame(rows, columns=["ID", "User Message ID", "User Message", "Chunk Text", "Source", "Page Number"])
         st.dataframe(
             df_chunks,
             use_container_width=True,
@@ -332,11 +424,49 @@ with tab2:
                 "Chunk Text": st.column_config.TextColumn("เนื้อหา", width="large")
             }
         )
-        st.info(f"จำนวน Chunks ทั้งหมด: {len(df_chunks)}")
+        page_buttons("chunks_page", next_cursor)
+        st.info(f"หน้า {page}: จำนวน Chunks ทั้งหมด {kpis['chunks']:,}")
     else:
         st.info("ยังไม่มีข้อมูล Chunks")
 
 with tab3:
+    # percentile / throughput จาก histogram rollup (metrics_engine.py) ไม่อ่าน llm_metrics ทีละแถว
+    st.markdown("### 📈 Latency และ Throughput")
+    metrics_window = st.selectbox("ช่วงเวลา", list(WINDOWS), key="metrics_window")
+    summary = get_window_summary(conn, metrics_window)
+    if summary["requests"]:
+        def seconds_label(value):
+            return f"{value:.2f}s" if value is not None else "-"
+
+        latency = summary["response_time"]
+        ttft_quantiles = summary["ttft"]
+        m_col1, m_col2, m_col3, m_col4 = st.columns(4)
+        m_col1.metric("Response Time p50", seconds_label(latency[0.5]))
+        m_col2.metric("Response Time p90", seconds_label(latency[0.9]))
+        m_col3.metric("Response Time p99", seconds_label(latency[0.99]))
+        m_col4.metric("TTFT p50 / p99", f"{seconds_label(ttft_quantiles[0.5])} / {seconds_label(ttft_quantiles[0.99])}")
+        t_col1, t_col2, t_col3, t_col4 = st.columns(4)
+        t_col1.metric("Requests", f"{summary['requests']:,}")
+        t_col2.metric("Requests / นาที", f"{summary['requests_per_min']:.2f}")
+        t_col3.metric("Tokens / นาที", f"{summary['tokens_per_min']:,.0f}")
+        output_rate = summary["output_tokens_per_sec"]
+        t_col4.metric("Output Tokens / วินาที", f"{output_rate:.1f}" if output_rate is not None else "-")
+
+        df_series = pd.DataFrame(get_window_series(conn, metrics_window))
+        df_series["time"] = pd.to_datetime(df_series["time"])
+        df_series = df_series.set_index("time")
+        st.caption("Response Time (s): p50 / p90 / p99")
+        st.line_chart(df_series[["p50", "p90", "p99"]])
+        chart_col1, chart_col2 = st.columns(2)
+        with chart_col1:
+            st.caption("Requests / นาที")
+            st.bar_chart(df_series["requests_per_min"])
+        with chart_col2:
+            st.caption("Tokens / นาที (prompt + response)")
+            st.line_chart(df_series["tokens_per_min"])
+    else:
+        st.info("ไม่มี request ในช่วงเวลานี้")
+
     st.markdown("### 📊 ข้อมูล Performance ของ LLM (50 รายการล่าสุด)")
     if not df_metrics.empty:
         st.dataframe(
@@ -348,7 +478,8 @@ with tab3:
                 "Timestamp": st.column_config.DatetimeColumn("เวลา", format="DD/MM/YYYY HH:mm"),
                 "Prompt Tokens": st.column_config.NumberColumn("Prompt Tokens", width="small"),
                 "Response Tokens": st.column_config.NumberColumn("Response Tokens", width="small"),
-                "Response Time (s)": st.column_config.NumberColumn("Response Time", format="%.2f s", width="small")
+                "Response Time (s)": st.column_config.NumberColumn("Response Time", format="%.2f s", width="small"),
+                "TTFT (s)": st.column_config.NumberColumn("TTFT", format="%.2f s", width="small")
             }
         )
     else:
@@ -356,7 +487,7 @@ with tab3:
 
 with tab4:
     st.markdown("### 💬 ความคิดเห็นจากผู้ใช้งาน")
-    if not df_feedback.empty:
+    if kpis["feedback_count"] > 0:
         # <<< CHANGED >>> ปรับตัวเลือกใน st.radio ให้สอดคล้องกับค่าใหม่
         filter_option = st.radio(
             "กรองตามประโยชน์ที่ได้รับ:", 
@@ -364,15 +495,14 @@ with tab4:
             horizontal=True
         )
         
-        # <<< CHANGED >>> ปรับเงื่อนไขการ filter ให้ตรงกับตัวเลือกใหม่
-        if filter_option == "ช่วยได้มาก 👍":
-            display_feedback = df_feedback[df_feedback["Satisfaction"] == "ช่วยได้มาก 👍"]
-        elif filter_option == "พอช่วยได้":
-            display_feedback = df_feedback[df_feedback["Satisfaction"] == "พอช่วยได้"]
-        elif filter_option == "ยังไม่ช่วย 👎":
-            display_feedback = df_feedback[df_feedback["Satisfaction"] == "ยังไม่ช่วย 👎"]
-        else: # "ทั้งหมด"
-            display_feedback = df_feedback
+        # กรองและแบ่งหน้าใน SQL; จำนวนแถวมาจาก rollup
+        satisfaction_filter = None if filter_option == "ทั้งหมด" else filter_option
+        feedback_total = kpis["feedback_count"] if satisfaction_filter is None else get_feedback_counts(conn).get(satisfaction_filter, 0)
+        cursor, page = page_cursor("feedback_page", reset_on=satisfaction_filter)
+        rows, next_cursor = get_feedback_page(conn, cursor, PAGE_SIZE, satisfaction=satisfaction_filter)
+        display_feedback = pd.DataFrame(rows, columns=["ID", "User Message ID", "User Message", "Satisfaction", "Feedback Text", "Timestamp"])
+        if not display_feedback.empty:
+            display_feedback["Timestamp"] = pd.to_datetime(display_feedback["Timestamp"])
         
         # ส่วนของ st.dataframe ยังคงเดิม ไม่ต้องแก้ไข
         st.dataframe(
@@ -386,6 +516,8 @@ with tab4:
                 "Feedback Text": st.column_config.TextColumn("ข้อเสนอแนะ", width="large")
             }
         )
+        page_buttons("feedback_page", next_cursor)
+        st.info(f"หน้า {page}: แสดง {len(display_feedback)} จาก {feedback_total:,} รายการ")
         
         st.markdown("---")
         st.markdown("#### 🌟 Feedback ล่าสุด")
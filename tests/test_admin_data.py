@@ -0,0 +1,43 @@
+import sqlite3
+
+from admin_data import ensure_question_index, question_page, question_version
+
+
+def _make_questions(db_path, timestamps):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT, answer TEXT, correct_answer TEXT, timestamp TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO questions (question, answer, timestamp) VALUES ('q', 'a', ?)",
+                     [(ts,) for ts in timestamps])
+    conn.commit()
+    return conn
+
+
+def test_pages_reach_rows_with_null_timestamp(tmp_path):
+    db_path = tmp_path / "questions.db"
+    _make_questions(db_path, ["2026-01-02", None, "2026-01-01", None, "2026-01-02", None, "2026-01-03"])
+    ensure_question_index(db_path)
+
+    ids, cursor = [], None
+    while True:
+        rows, cursor = question_page(db_path, cursor, page_size=2, columns=("id",))
+        ids += [row[0] for row in rows]
+        if cursor is None:
+            break
+    # ล่าสุดก่อน, เวลาเท่ากันเรียงตาม id, แถวที่ไม่มีเวลาอยู่ท้ายสุด
+    assert ids == [7, 5, 1, 3, 6, 4, 2]
+
+
+def test_question_version_changes_on_write(tmp_path):
+    db_path = tmp_path / "questions.db"
+    assert question_version(db_path) is None
+    conn = _make_questions(db_path, ["2026-01-01"])
+    ensure_question_index(db_path)
+    before = question_version(db_path)
+    conn.execute("UPDATE questions SET correct_answer = 'ok'")
+    conn.commit()
+    assert question_version(db_path) == before + 1
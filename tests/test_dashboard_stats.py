@@ -0,0 +1,54 @@
+import sqlite3
+
+from dashboard_stats import get_kpis, get_messages_page, has_pending_rows, refresh_rollups, search_messages
+from migrations import run_migrations
+
+
+def _insert_message(conn, text="กู้ กยศ ได้ไหม", timestamp="2026-01-01T10:00:00"):
+    conn.execute(
+        "INSERT INTO user_messages (user_message, answer, timestamp) VALUES (?, 'ได้', ?)", (text, timestamp)
+    )
+    conn.commit()
+
+
+def test_refresh_without_new_rows_skips_write_lock(tmp_path):
+    db_path = tmp_path / "questions.db"
+    run_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    _insert_message(conn)
+    assert has_pending_rows(conn)
+    assert refresh_rollups(db_path)["messages"] == 1
+    assert not has_pending_rows(conn)
+
+    # process อื่นถือ write lock อยู่ (เช่น telemetry ของหน้าแชท) refresh ที่ไม่มีงานต้องไม่รอ lock
+    writer = sqlite3.connect(db_path)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        assert not any(refresh_rollups(db_path).values())
+    finally:
+        writer.rollback()
+
+    _insert_message(conn)
+    assert refresh_rollups(db_path)["messages"] == 1
+    assert get_kpis(conn)["messages"] == 2
+
+
+def test_keyset_pages_cover_all_rows(tmp_path):
+    db_path = tmp_path / "questions.db"
+    run_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    for i in range(7):
+        _insert_message(conn, f"คำถามเรื่องกู้ยืม {i}")
+
+    def all_pages(fetch):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = fetch(cursor)
+            ids += [row[0] for row in rows]
+            if cursor is None:
+                return ids
+
+    assert all_pages(lambda cursor: get_messages_page(conn, cursor, 3)) == [7, 6, 5, 4, 3, 2, 1]
+    # FTS เรียงตาม rank แต่ต้องได้ครบและไม่ซ้ำ, LIKE (คำค้นสั้นกว่า 3 ตัว) เรียงตาม id
+    assert sorted(all_pages(lambda cursor: search_messages(conn, "กู้ยืม", cursor, 3))) == [1, 2, 3, 4, 5, 6, 7]
+    assert all_pages(lambda cursor: search_messages(conn, "กู", cursor, 3)) == [7, 6, 5, 4, 3, 2, 1]
@@ -0,0 +1,26 @@
+from doc_parsing import THAI_PUA, clean_pdf_text
+
+# glyph ใน private-use area ของฟอนต์ไทย (layout มาตรฐานแบบ Windows/Mac) -> อักขระ Unicode ที่ถูกต้อง
+TONE_MARKS = "่้๊๋์"
+EXPECTED_PUA = {
+    0xF700: "ฐ",  # ฐ ไม่มีเชิง
+    **dict(zip(range(0xF701, 0xF705), "ิีึื")),  # สระบน (เลื่อนซ้าย)
+    **dict(zip(range(0xF705, 0xF70A), TONE_MARKS)),  # วรรณยุกต์ (ต่ำ-ซ้าย)
+    **dict(zip(range(0xF70A, 0xF70F), TONE_MARKS)),  # วรรณยุกต์ (ต่ำ)
+    0xF70F: "ญ",  # ญ ไม่มีเชิง
+    0xF710: "ั",  # ไม้หันอากาศ
+    0xF711: "ํ",  # นิคหิต
+    0xF712: "็",  # ไม้ไต่คู้
+    **dict(zip(range(0xF713, 0xF718), TONE_MARKS)),  # วรรณยุกต์ (ซ้าย)
+    0xF718: "ุ",  # สระอุ
+    0xF719: "ู",  # สระอู
+    0xF71A: "ฺ",  # พินทุ
+}
+
+
+def test_thai_pua_table():
+    assert THAI_PUA == EXPECTED_PUA
+
+
+def test_clean_pdf_text_maps_lower_vowels():
+    assert clean_pdf_text("\u0e01\uf718 \u0e01\uf719 \u0e01\uf71a") == "\u0e01\u0e38 \u0e01\u0e39 \u0e01\u0e3a"
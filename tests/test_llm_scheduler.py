@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from llm_scheduler import (
+    CANCELLED, DONE, RUNNING, GenerationTimeout, LLMScheduler, QueueTimeout, RequestCancelled, stream_until,
+)
+
+
+def test_round_robin_between_sessions():
+    scheduler = LLMScheduler(max_concurrency=1)
+    running = scheduler.submit("a")
+    # session a ส่งหลายคำขอก่อน b แต่ b ต้องได้สิทธิ์ก่อนคำขอที่สองของ a
+    a1, a2 = scheduler.submit("a"), scheduler.submit("a")
+    b1 = scheduler.submit("b")
+    assert running.state == RUNNING
+    assert [scheduler.position(t) for t in (a1, b1, a2)] == [1, 2, 3]
+
+    order = []
+    current = running
+    for _ in range(3):
+        scheduler.release(current)
+        current = next(t for t in (a1, a2, b1) if t.state == RUNNING and t not in order)
+        order.append(current)
+    assert order == [a1, b1, a2]
+    assert scheduler.stats()["served"] == 3
+
+
+def test_cancel_queued_and_running():
+    scheduler = LLMScheduler(max_concurrency=1)
+    running = scheduler.submit("a")
+    queued = scheduler.submit("b")
+    waiting = scheduler.submit("c")
+
+    scheduler.cancel(queued)
+    assert queued.state == CANCELLED
+    assert scheduler.position(waiting) == 1
+
+    # ยกเลิกคำขอที่กำลังรัน = คืนสิทธิ์ให้คิวถัดไป
+    scheduler.cancel(running)
+    assert running.state == CANCELLED
+    assert waiting.state == RUNNING
+    scheduler.release(waiting)
+    scheduler.release(waiting)  # เรียกซ้ำไม่กระทบ
+    stats = scheduler.stats()
+    assert (stats["active"], stats["cancelled"], stats["served"]) == (0, 2, 1)
+    assert waiting.state == DONE
+
+
+def test_inactive_session_skipped_at_dispatch():
+    scheduler = LLMScheduler(max_concurrency=1)
+    running = scheduler.submit("a")
+    closed = scheduler.submit("b", is_active=lambda: False)
+    scheduler.release(running)
+    assert closed.state == CANCELLED
+    assert scheduler.stats()["active"] == 0
+
+
+def test_acquire_times_out_and_leaves_queue():
+    scheduler = LLMScheduler(max_concurrency=1)
+    scheduler.submit("a")
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire("b", timeout=0.05, poll=0.01)
+    stats = scheduler.stats()
+    assert (stats["queue_depth"], stats["timeouts"], stats["active"]) == (0, 1, 1)
+
+
+def test_acquire_waits_for_release():
+    scheduler = LLMScheduler(max_concurrency=1)
+    first = scheduler.acquire("a")
+    positions = []
+
+    def on_wait(position, waited):
+        positions.append(position)
+        scheduler.release(first)
+
+    second = scheduler.acquire("b", on_wait=on_wait, poll=0.01)
+    assert second.state == RUNNING
+    assert positions == [1]
+
+
+def _slow_chunks(delay):
+    yield "a"
+    time.sleep(delay)
+    yield "b"
+
+
+def test_stream_until_deadline():
+    chunks = []
+    start = time.time()
+    with pytest.raises(GenerationTimeout):
+        for chunk in stream_until(_slow_chunks(5), time.time() + 0.2, poll=0.05):
+            chunks.append(chunk)
+    assert chunks == ["a"]
+    assert time.time() - start < 1
+
+
+def test_stream_until_cancelled_and_complete():
+    with pytest.raises(RequestCancelled):
+        list(stream_until(_slow_chunks(5), time.time() + 10, is_active=lambda: False, poll=0.05))
+    assert list(stream_until(_slow_chunks(0), time.time() + 10)) == ["a", "b"]
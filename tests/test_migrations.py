@@ -0,0 +1,50 @@
+import sqlite3
+
+from migrations import MIGRATIONS, run_migrations
+
+
+def _tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    db_path = tmp_path / "questions.db"
+    assert run_migrations(db_path) == MIGRATIONS[-1][0]
+    # รันซ้ำไม่เปลี่ยนอะไร
+    assert run_migrations(db_path) == MIGRATIONS[-1][0]
+
+
+def test_migration_schema_is_frozen_per_version():
+    # เวอร์ชัน 5 = ตาราง rollup ชุดแรกเท่านั้น histogram มาใน 11
+    conn = sqlite3.connect(":memory:")
+    for version, _, migrate in MIGRATIONS:
+        if version > 5:
+            break
+        migrate(conn)
+    tables = _tables(conn)
+    assert {"stats_hourly", "feedback_hourly", "question_counts", "rollup_state", "stats_daily"} <= tables
+    assert not tables & {"metrics_histogram", "metrics_periods"}
+
+    for version, _, migrate in MIGRATIONS[5:]:
+        migrate(conn)
+    assert {"metrics_histogram", "metrics_periods"} <= _tables(conn)
+
+
+def test_search_index_created_after_skipped_migration(tmp_path):
+    db_path = tmp_path / "questions.db"
+    run_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO user_messages (user_message, answer, timestamp) VALUES ('กู้ กยศ ได้ไหม', 'ได้', '2026-01-01')")
+    # จำลอง SQLite ที่ไม่มี FTS5 ตอนรัน m006: เวอร์ชันเลื่อนไปแล้วแต่ไม่มี index
+    conn.executescript("""
+        DROP TRIGGER user_messages_fts_insert;
+        DROP TRIGGER user_messages_fts_delete;
+        DROP TRIGGER user_messages_fts_update;
+        DROP TABLE user_messages_fts;
+    """)
+    conn.commit()
+
+    run_migrations(db_path)
+    assert "user_messages_fts" in _tables(conn)
+    rows = conn.execute("SELECT rowid FROM user_messages_fts WHERE user_messages_fts MATCH '\"กยศ\"'").fetchall()
+    assert rows == [(1,)]
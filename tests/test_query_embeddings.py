@@ -0,0 +1,53 @@
+import sqlite3
+import threading
+
+import query_embeddings
+from query_embeddings import CachedQueryEmbeddings
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    db_path = tmp_path / "cache.db"
+    base = CountingEmbeddings()
+    first = CachedQueryEmbeddings(base, "bge-m3", db_path=db_path)
+    vector = first.embed_query("กู้ กยศ ได้ไหมครับ")
+    # คำลงท้ายต่างกัน = key เดียวกัน
+    assert first.embed_query("กู้ กยศ ได้ไหม") == vector
+
+    second = CachedQueryEmbeddings(base, "bge-m3", db_path=db_path)
+    assert second.embed_query("กู้ กยศ ได้ไหม") == vector
+    assert base.calls == 1
+    assert second.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_trimmed_to_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_embeddings, "DISK_TRIM_EVERY", 4)
+    db_path = tmp_path / "cache.db"
+    cache = CachedQueryEmbeddings(CountingEmbeddings(), "bge-m3", db_path=db_path, disk_max_entries=3)
+    for i in range(8):
+        cache.embed_query(f"คำถามที่ {i}")
+    rows = sqlite3.connect(db_path).execute("SELECT normalized FROM query_embeddings ORDER BY created_at").fetchall()
+    assert [row[0] for row in rows] == ["คำถามที่ 5", "คำถามที่ 6", "คำถามที่ 7"]
+
+
+def test_memory_hit_does_not_wait_for_disk(tmp_path):
+    cache = CachedQueryEmbeddings(CountingEmbeddings(), "bge-m3", db_path=tmp_path / "cache.db")
+    vector = cache.embed_query("ดอกเบี้ยเท่าไหร่")
+    result = []
+    with cache._disk_lock:
+        # thread อื่นกำลังเขียนดิสก์อยู่ hit ในหน่วยความจำต้องไม่ติด lock เดียวกัน
+        reader = threading.Thread(target=lambda: result.append(cache.embed_query("ดอกเบี้ยเท่าไหร่")))
+        reader.start()
+        reader.join(timeout=2)
+        assert result == [vector]
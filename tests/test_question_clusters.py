@@ -0,0 +1,31 @@
+import sqlite3
+
+from migrations import run_migrations
+from question_clusters import get_cluster_questions, get_top_clusters, get_unclustered_count, refresh_clusters
+
+
+class TopicEmbeddings:
+    """vector ตามหัวข้อในคำถาม: คำถามหัวข้อเดียวกันได้ vector เดียวกัน"""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] if "ดอกเบี้ย" in text else [0.0, 1.0] for text in texts]
+
+
+def test_representative_is_text_the_user_typed(tmp_path):
+    db_path = tmp_path / "questions.db"
+    run_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO user_messages (user_message, answer, timestamp) VALUES (?, 'ตอบ', '2026-01-01')",
+        [("ดอกเบี้ย กยศ เท่าไหร่ครับ?",), ("ดอกเบี้ย กยศ เท่าไหร่คะ",), ("ดอกเบี้ยคิดยังไง",), ("กู้ได้กี่ปี",)],
+    )
+    conn.commit()
+    assert get_unclustered_count(conn) == 4
+
+    stats = refresh_clusters(db_path, TopicEmbeddings())
+    assert stats == {"processed": 4, "embedded": 3, "new_clusters": 2}
+    assert get_unclustered_count(conn) == 0
+
+    (cluster_id, representative, size, members), _ = get_top_clusters(conn)
+    assert (representative, size, members) == ("ดอกเบี้ย กยศ เท่าไหร่ครับ?", 3, 2)
+    assert get_cluster_questions(conn, cluster_id) == [("ดอกเบี้ย กยศ เท่าไหร่ครับ?", 2), ("ดอกเบี้ยคิดยังไง", 1)]
@@ -0,0 +1,36 @@
+import sys
+import types
+
+from langchain_core.documents import Document
+
+from reranker import CrossEncoderReranker
+
+
+def _fake_sentence_transformers(monkeypatch, predict):
+    class CrossEncoder:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def predict(self, pairs, **kwargs):
+            return predict(pairs)
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(CrossEncoder=CrossEncoder))
+
+
+def test_load_returns_false_when_warm_up_fails(monkeypatch):
+    def predict(pairs):
+        raise RuntimeError("tokenizer error")
+
+    _fake_sentence_transformers(monkeypatch, predict)
+    reranker = CrossEncoderReranker("fake-model")
+    assert reranker.load() is False
+    docs = [Document(page_content="a"), Document(page_content="b")]
+    assert reranker.rerank("q", docs, top_n=1) == docs[:1]
+
+
+def test_load_and_rerank(monkeypatch):
+    _fake_sentence_transformers(monkeypatch, lambda pairs: [len(doc) for _, doc in pairs])
+    reranker = CrossEncoderReranker("fake-model", latency_budget=10)
+    assert reranker.load() is True
+    docs = [Document(page_content=text) for text in ("a", "ccc", "bb")]
+    assert [doc.page_content for doc in reranker.rerank("q", docs, top_n=2)] == ["ccc", "bb"]
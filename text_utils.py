@@ -0,0 +1,38 @@
+import re
+
+# ---------------------- Text Normalization ----------------------
+# ใช้ร่วมกันระหว่าง dashboard (นับคำถามยอดนิยม) และแคชฝั่ง chatbot
+
+WORDS_TO_REMOVE = ['คะ', 'ครับ', 'ค่ะ', 'คับ', 'จ้ะ', 'จ้า', '?', '!', '.']
+
+
+def normalize_text(text):
+    """ทำความสะอาดคำถาม: ตัวพิมพ์เล็ก ตัดช่องว่าง และลบคำลงท้าย/เครื่องหมายที่ไม่สำคัญ"""
+    if not isinstance(text, str):
+        return ""
+    text = text.lower()  # 1. แปลงเป็นตัวพิมพ์เล็ก
+    text = text.strip()  # 2. ตัดช่องว่างหน้า-หลัง
+
+    # 3. ลบคำลงท้ายและเครื่องหมายต่างๆ ที่ไม่สำคัญ
+    for word in WORDS_TO_REMOVE:
+        text = text.replace(word, '')
+
+    return text.strip()  # ตัดช่องว่างอีกครั้งหลังลบคำ
+
+
+# ตัดเฉพาะคำลงท้าย/เครื่องหมายท้ายประโยค (คำยาวก่อน เช่น "ครับ" ก่อน "คับ")
+_TRAILING_WORDS_RE = re.compile(
+    r"(?:\s|" + "|".join(re.escape(w) for w in sorted(WORDS_TO_REMOVE, key=len, reverse=True)) + r")+$"
+)
+
+
+def normalize_query(text):
+    """normalize แบบระวังสำหรับใช้เป็น key ของแคช embedding
+
+    ต่างจาก normalize_text ตรงที่ไม่ลบข้อความกลางประโยค (เช่น "คะ" ใน "คะแนน" หรือ "." ใน "2.5")
+    แค่ตัวพิมพ์เล็ก รวมช่องว่างซ้ำ และตัดคำลงท้าย/เครื่องหมายที่ท้ายคำถาม
+    """
+    if not isinstance(text, str):
+        return ""
+    text = " ".join(text.lower().split())
+    return _TRAILING_WORDS_RE.sub("", text)
@@ -0,0 +1,71 @@
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# ---------------------- Token Accounting ----------------------
+# นับ token ด้วย tokenizer ของโมเดลจริง (ภาษาไทยไม่มีช่องว่าง การใช้ split() จึงนับผิด)
+# ถ้า Ollama ส่ง prompt_eval_count / eval_count กลับมา จะใช้ค่านั้นเป็นหลัก
+
+# tokenizer ของ llama3.2 (repo ที่ไม่ต้องขอสิทธิ์เข้าถึง)
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "unsloth/Llama-3.2-1B-Instruct")
+
+_THAI_RE = re.compile(r"[฀-๿]")
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """โหลด tokenizer ครั้งเดียวต่อ process คืน None ถ้าโหลดไม่ได้"""
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+        logging.info(f"🔢 Loaded tokenizer {TOKENIZER_NAME}")
+        return tokenizer
+    except Exception as e:
+        logging.warning(f"⚠️ Tokenizer {TOKENIZER_NAME} unavailable ({e}), using estimated token counts")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """ประมาณจำนวน token เมื่อไม่มี tokenizer: ภาษาไทย ~2 ตัวอักษรต่อ token, ที่เหลือนับตามคำ"""
+    thai_chars = len(_THAI_RE.findall(text))
+    other_words = len(_THAI_RE.sub(" ", text).split())
+    return math.ceil(thai_chars / 2) + other_words
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class OllamaUsageHandler(BaseCallbackHandler):
+    """เก็บจำนวน token และเวลาที่ Ollama รายงานกลับมาเมื่อ generate เสร็จ"""
+
+    def __init__(self):
+        self.usage = {}
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                for key in ("prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration"):
+                    if info.get(key) is not None:
+                        self.usage[key] = info[key]
+
+    def token_counts(self, prompt_text, answer_text):
+        """คืน (prompt_tokens, response_tokens) ใช้ค่าจาก Ollama ถ้ามี ไม่เช่นนั้นนับด้วย tokenizer"""
+        prompt_tokens = self.usage.get("prompt_eval_count")
+        response_tokens = self.usage.get("eval_count")
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(prompt_text)
+        if response_tokens is None:
+            response_tokens = count_tokens(answer_text)
+        return prompt_tokens, response_tokens
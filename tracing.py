@@ -0,0 +1,208 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from telemetry import connect
+
+# ---------------------- Per-stage Tracing ----------------------
+# trace หนึ่งอันต่อคำถาม: span ของแต่ละ stage (embed, search, rerank, assembly, queue_wait, prefill, decode, db_write)
+# ผูกกับ user_message_id ของคำถามนั้น dashboard จึงแยก p50/p95/p99 ราย stage และย้อนดูคำถามที่ช้าได้
+# การเขียนทำใน thread เบื้องหลัง (TraceSink) ไม่เพิ่มเวลาให้หน้าแชท: SQLite (ตาราง trace_spans, migration m010),
+# JSONL (ถ้ากำหนด TRACE_JSONL_PATH) และ Langfuse (ถ้าตั้ง LANGFUSE_PUBLIC_KEY / LANGFUSE_SECRET_KEY)
+
+TRACE_BATCH_SIZE = 50
+# stage ใน stage_timings ที่ครอบ stage อื่นอยู่แล้ว (dense = embed + search) ไม่บันทึกเป็น span ซ้ำ
+UNTRACED_STAGES = ("dense",)
+# span ที่ครอบ span อื่น (ไม่ใช่ stage เดี่ยว) -> คำอธิบายบน dashboard
+PARENT_SPANS = {
+    "turn": "ทั้งคำถาม",
+    "retrieval": "embed + search + lexical + fusion + rerank + assembly",
+}
+
+
+class Trace:
+    """span ของคำถามหนึ่งข้อ เวลาเริ่มเป็น epoch (time.time()) และ duration เป็นวินาที"""
+
+    def __init__(self, name="turn"):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.start = time.time()
+        self.spans = []
+        self.attributes = {}
+
+    def add_span(self, name, start, duration, **attributes):
+        self.spans.append({"name": name, "start": start, "duration": duration, "attributes": attributes})
+
+    @contextmanager
+    def span(self, name, **attributes):
+        start = time.time()
+        try:
+            yield attributes
+        finally:
+            self.add_span(name, start, time.time() - start, **attributes)
+
+    def add_stage_spans(self, spans):
+        """รับ [(stage, เวลาเริ่ม, วินาที)] จาก stage_timings.get_last_spans()"""
+        for name, start, duration in spans:
+            if name not in UNTRACED_STAGES:
+                self.add_span(name, start, duration)
+
+    def finish(self, **attributes):
+        """ปิด trace: เพิ่ม span ราก (ชื่อเดียวกับ trace) ตั้งแต่เริ่มจนถึงตอนนี้"""
+        self.attributes.update(attributes)
+        self.add_span(self.name, self.start, time.time() - self.start, **self.attributes)
+        return self
+
+    def rows(self, message_id):
+        return [
+            (self.trace_id, message_id, span["name"], datetime.fromtimestamp(span["start"]).isoformat(),
+             span["duration"], json.dumps(span["attributes"], ensure_ascii=False) if span["attributes"] else None)
+            for span in self.spans
+        ]
+
+    def to_dict(self, message_id):
+        return {
+            "trace_id": self.trace_id,
+            "user_message_id": message_id,
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start).isoformat(),
+            "attributes": self.attributes,
+            "spans": [
+                {**span, "start": datetime.fromtimestamp(span["start"]).isoformat()} for span in self.spans
+            ],
+        }
+
+
+# ---------------------- Langfuse Exporter ----------------------
+class LangfuseExporter:
+    """ส่ง trace ไป Langfuse (SDK v3 แบบเดียวกับ chatbotv3.py) หนึ่ง trace ต่อคำถาม หนึ่ง child span ต่อ stage
+
+    Langfuse กำหนดเวลาเริ่มของ span เองตอนสร้าง เวลาจริงของแต่ละ stage จึงอยู่ใน metadata (offset/duration)
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_env(cls):
+        """คืน exporter ถ้าตั้งค่า key และติดตั้ง langfuse ไว้ ไม่เช่นนั้น None"""
+        if not (os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY")):
+            return None
+        try:
+            from langfuse import get_client
+        except ImportError:
+            logging.warning("⚠️ LANGFUSE_* is set but langfuse is not installed, Langfuse export disabled")
+            return None
+        return cls(get_client())
+
+    def export(self, trace, message_id):
+        trace_context = {"trace_id": self.client.create_trace_id(seed=trace.trace_id)}
+        root = self.client.start_span(
+            name=trace.name,
+            trace_context=trace_context,
+            metadata={"user_message_id": message_id, **trace.attributes},
+        )
+        for span in trace.spans:
+            if span["name"] == trace.name:
+                continue
+            child = root.start_span(name=span["name"], metadata={
+                "offset_ms": round((span["start"] - trace.start) * 1000, 1),
+                "duration_ms": round(span["duration"] * 1000, 1),
+                **span["attributes"],
+            })
+            child.end()
+        root.end()
+
+    def flush(self):
+        self.client.flush()
+
+
+# ---------------------- Trace Sink ----------------------
+class TraceSink:
+    """รับ trace ที่รอ user_message_id (Future จาก TelemetryWriter.submit_turn) แล้วเขียนใน thread เบื้องหลัง"""
+
+    def __init__(self, db_path, jsonl_path=None, exporter=None, batch_size=TRACE_BATCH_SIZE):
+        self.db_path = db_path
+        self.jsonl_path = jsonl_path
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self._conn = connect(db_path)
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, trace, message_id, write_started=None):
+        """message_id เป็น int หรือ Future; write_started = เวลาที่ส่งงานเขียน telemetry (ได้ span db_write)"""
+        def enqueue(resolved):
+            if write_started is not None:
+                trace.add_span("db_write", write_started, time.time() - write_started)
+            self._queue.put((trace, resolved))
+
+        if not hasattr(message_id, "add_done_callback"):
+            enqueue(message_id)
+            return
+
+        def on_done(future):
+            try:
+                enqueue(future.result())
+            except Exception as e:
+                logging.warning(f"⚠️ Trace {trace.trace_id} dropped, telemetry write failed ({e})")
+
+        message_id.add_done_callback(on_done)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                batch.append(nxt)
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch):
+        try:
+            with self._conn:
+                self._conn.executemany("""
+                    INSERT INTO trace_spans (trace_id, user_message_id, name, start_time, duration, attributes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [row for trace, message_id in batch for row in trace.rows(message_id)])
+        except Exception as e:
+            logging.error(f"❌ Trace batch write failed ({e})")
+
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    for trace, message_id in batch:
+                        f.write(json.dumps(trace.to_dict(message_id), ensure_ascii=False) + "\n")
+            except OSError as e:
+                logging.error(f"❌ Trace JSONL write failed ({e})")
+
+        if self.exporter is not None:
+            try:
+                for trace, message_id in batch:
+                    self.exporter.export(trace, message_id)
+                self.exporter.flush()
+            except Exception as e:
+                logging.warning(f"⚠️ Langfuse export failed ({e})")
+
+    def close(self):
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join(timeout=10)
+        self._conn.close()
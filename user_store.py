@@ -0,0 +1,169 @@
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import bcrypt
+
+# ---------------------- User Store ----------------------
+# ข้อมูลผู้ใช้ของ admin dashboard (adminMN.db) ผ่าน connection เดียวต่อ process
+# - login อ่านผู้ใช้คนเดียวด้วย index ของ username (UNIQUE) ไม่โหลดทุกคนเข้า dict
+# - แคช record ในหน่วยความจำอายุสั้น (USER_CACHE_TTL_SECONDS) และล้าง record นั้นทุกครั้งที่เขียน
+# - รหัสผ่านเก็บเป็น bcrypt ที่ปรับ cost ได้ (BCRYPT_ROUNDS) hash SHA-256 เดิมยัง login ได้
+#   และถูกเปลี่ยนเป็น bcrypt ตอน login สำเร็จครั้งถัดไป (เช่นเดียวกับ hash ที่ cost ไม่ตรงค่าปัจจุบัน)
+
+USER_DB_PATH = "adminMN.db"
+# cost ของ bcrypt (2^rounds รอบ): ทุก +1 ใช้ CPU ต่อ login เพิ่มเท่าตัว
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+USER_COLUMNS = ("id", "username", "password_hash", "role", "full_name", "email", "created_at", "last_login",
+                "is_active")
+
+USERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT DEFAULT 'staff',
+        full_name TEXT,
+        email TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP,
+        is_active INTEGER DEFAULT 1
+    )
+"""
+
+DEFAULT_USERS = [
+    ("admin", "password", "admin", "ผู้ดูแลระบบ", "admin@company.com"),
+    ("manager", "secret123", "manager", "ผู้จัดการ", "manager@company.com"),
+    ("staff", "secret", "staff", "เจ้าหน้าที่", "staff@company.com"),
+]
+
+
+def _is_bcrypt(password_hash):
+    return password_hash.startswith("$2")
+
+
+def _bcrypt_rounds(password_hash):
+    # รูปแบบ $2b$<rounds>$<salt+hash>
+    return int(password_hash.split("$")[2])
+
+
+class UserStore:
+    def __init__(self, db_path=USER_DB_PATH, rounds=BCRYPT_ROUNDS, cache_ttl=USER_CACHE_TTL):
+        self.db_path = db_path
+        self.rounds = rounds
+        self.cache_ttl = cache_ttl
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._cache = {}  # username -> (หมดอายุเมื่อ, record หรือ None)
+        # username ที่ไม่มีอยู่ก็ต้องเสียเวลา bcrypt เท่ากัน เดา username จากเวลาตอบไม่ได้
+        self._dummy_hash = self.hash_password("dummy password")
+        self.ensure_schema()
+
+    # ---------------------- Schema ----------------------
+    def ensure_schema(self):
+        """สร้างตารางและผู้ใช้เริ่มต้นที่ยังไม่มี (ครั้งเดียวตอนสร้าง store)"""
+        with self._lock, self._conn:
+            self._conn.execute(USERS_SCHEMA)
+            existing = {row[0] for row in self._conn.execute(
+                f"SELECT username FROM users WHERE username IN ({','.join('?' * len(DEFAULT_USERS))})",
+                [user[0] for user in DEFAULT_USERS],
+            )}
+        missing = [user for user in DEFAULT_USERS if user[0] not in existing]
+        for username, password, role, full_name, email in missing:
+            self.add_user(username, password, role, full_name, email)
+        if missing:
+            logging.info(f"👥 Created default users: {', '.join(user[0] for user in missing)}")
+
+    # ---------------------- Passwords ----------------------
+    def hash_password(self, password):
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds)).decode("ascii")
+
+    def _check_password(self, password, password_hash):
+        if _is_bcrypt(password_hash):
+            return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("ascii"))
+        legacy = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return hmac.compare_digest(legacy, password_hash)
+
+    def _needs_rehash(self, password_hash):
+        return not _is_bcrypt(password_hash) or _bcrypt_rounds(password_hash) != self.rounds
+
+    # ---------------------- Reads ----------------------
+    def get_user(self, username):
+        """record ของผู้ใช้ที่ active เป็น dict (หรือ None) อ่านจากแคชถ้ายังไม่หมดอายุ"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(username)
+            if cached and cached[0] > now:
+                return cached[1]
+            row = self._conn.execute(
+                f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = ? AND is_active = 1", (username,)
+            ).fetchone()
+            record = dict(row) if row else None
+            self._cache[username] = (now + self.cache_ttl, record)
+            return record
+
+    def list_users(self):
+        """ผู้ใช้ทั้งหมด (ไม่รวม password_hash) เรียงจากสร้างล่าสุด"""
+        columns = [c for c in USER_COLUMNS if c != "password_hash"]
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(columns)} FROM users ORDER BY created_at DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def count_users(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # ---------------------- Login ----------------------
+    def verify_login(self, username, password):
+        """คืน record ของผู้ใช้ถ้า username/password ถูกต้อง ไม่เช่นนั้น None
+
+        เวลาที่ใช้เท่ากับการตรวจ bcrypt หนึ่งครั้งเสมอ (ยกเว้นครั้งแรกของ hash แบบเดิมที่ต้อง hash ใหม่)
+        """
+        user = self.get_user(username)
+        if user is None:
+            self._check_password(password, self._dummy_hash)
+            return None
+        if not self._check_password(password, user["password_hash"]):
+            return None
+        password_hash = self.hash_password(password) if self._needs_rehash(user["password_hash"]) else None
+        self._record_login(username, password_hash)
+        return user
+
+    # ---------------------- Writes ----------------------
+    def _write(self, username, sql, params):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(sql, params)
+            self._cache.pop(username, None)
+        return cursor.rowcount
+
+    def _record_login(self, username, password_hash=None):
+        if password_hash is None:
+            self._write(username, "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?", (username,))
+            return
+        self._write(
+            username,
+            "UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = ? WHERE username = ?",
+            (password_hash, username),
+        )
+        logging.info(f"🔐 Upgraded password hash of {username} to bcrypt (cost {self.rounds})")
+
+    def add_user(self, username, password, role="staff", full_name=None, email=None):
+        self._write(
+            username,
+            "INSERT INTO users (username, password_hash, role, full_name, email) VALUES (?, ?, ?, ?, ?)",
+            (username, self.hash_password(password), role, full_name, email),
+        )
+
+    def set_password(self, username, password):
+        return self._write(username, "UPDATE users SET password_hash = ? WHERE username = ?",
+                           (self.hash_password(password), username))
+
+    def set_active(self, username, active):
+        return self._write(username, "UPDATE users SET is_active = ? WHERE username = ?", (int(active), username))
@@ -0,0 +1,73 @@
+import argparse
+import json
+import logging
+import os
+import time
+import urllib.request
+
+from ingest import OLLAMA_URL, PERSIST_DIR
+from model_config import EMBED_MODEL, LLM_MODEL
+
+# ---------------------- Warm-up ----------------------
+# ก่อนเปิดรับผู้ใช้: ให้ Ollama โหลด weights ของ LLM และ embedding model เข้าหน่วยความจำ
+# และอ่านไฟล์ index ให้อยู่ใน page cache ของ OS คำถามแรกจะได้ไม่ต้องรอโหลดโมเดล/อ่านดิสก์
+#   python warmup.py            (เช่น ใน entrypoint ก่อน streamlit run)
+# chatbotv3test.py เรียก ping_ollama และลองค้นหา 1 ครั้งตอนเริ่ม process ด้วย (WARMUP_ENABLED)
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+WARMUP_QUERY = "คุณสมบัติผู้กู้ยืมเงิน กยศ"
+READ_BLOCK = 1 << 20
+
+
+def ping_ollama(base_url, model, embed=False, timeout=300):
+    """ส่งคำขอว่างให้ Ollama โหลดโมเดล คืนเวลาที่ใช้ (วินาที) หรือ None ถ้าเรียกไม่สำเร็จ"""
+    base_url = (base_url or DEFAULT_OLLAMA_URL).rstrip("/")
+    if embed:
+        path, payload = "/api/embed", {"model": model, "input": "warm up"}
+    else:
+        # generate ที่ prompt ว่าง = โหลดโมเดลโดยไม่สร้างข้อความ
+        path, payload = "/api/generate", {"model": model, "prompt": ""}
+    request = urllib.request.Request(
+        base_url + path, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    start = time.time()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    except Exception as e:
+        logging.warning(f"⚠️ Could not warm up {model} at {base_url} ({e})")
+        return None
+    elapsed = time.time() - start
+    logging.info(f"🔥 Ollama loaded {model} in {elapsed:.2f}s")
+    return elapsed
+
+
+def warm_page_cache(directory):
+    """อ่านทุกไฟล์ใน directory หนึ่งรอบ (index ของ Chroma / mmap / BM25) คืนจำนวน byte ที่อ่าน"""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as f:
+                for block in iter(lambda: f.read(READ_BLOCK), b""):
+                    total += len(block)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="โหลดโมเดลใน Ollama และ index เข้า page cache ก่อนเปิดรับผู้ใช้")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR)
+    parser.add_argument("--model", default=LLM_MODEL)
+    parser.add_argument("--skip-index", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_index and os.path.isdir(args.persist_dir):
+        start = time.time()
+        size = warm_page_cache(args.persist_dir)
+        logging.info(f"📂 Read {size / 1e6:.1f} MB of index files in {time.time() - start:.2f}s")
+    ping_ollama(OLLAMA_URL, EMBED_MODEL, embed=True)
+    ping_ollama(OLLAMA_URL, args.model)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()